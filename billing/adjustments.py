@@ -0,0 +1,124 @@
+"""
+Credit and debit notes applied to many invoices at once.
+
+The selected invoices are read once as plain rows, one adjustment per
+invoice is computed in integer minor units, and the adjustments and their
+ledger entries are written with ``bulk_create``. The unit of work then
+recalculates every adjusted invoice in one UPDATE.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import QuerySet
+
+from . import money
+from .models import CorporateAccount, Invoice, InvoiceAdjustment, LedgerEntry
+from .remittances import allocate_pro_rata
+from .unit_of_work import mark_invoice_dirty, unit_of_work
+
+
+class AmountRule(models.TextChoices):
+	FIXED = "fixed", "Fixed Amount per Invoice"
+	PERCENTAGE = "percentage", "Percentage of Invoice Total"
+	PRO_RATA = "pro_rata", "Amount Split by Invoice Total"
+
+
+class AdjustmentError(Exception):
+	"""The adjustment cannot be applied to the selected invoices."""
+
+
+def adjustable_invoices(
+	*,
+	corporate_account: CorporateAccount | None = None,
+	issued_from: date | None = None,
+	issued_to: date | None = None,
+	status: str | None = None,
+	invoice_ids: list[int] | None = None,
+) -> QuerySet:
+	"""Invoices selected by the bulk adjustment filters; void invoices are never adjusted."""
+	invoices = Invoice.objects.exclude(status=Invoice.InvoiceStatus.VOID)
+	if corporate_account is not None:
+		invoices = invoices.filter(folio__corporate_account=corporate_account)
+	if issued_from:
+		invoices = invoices.filter(issued_at__date__gte=issued_from)
+	if issued_to:
+		invoices = invoices.filter(issued_at__date__lte=issued_to)
+	if status:
+		invoices = invoices.filter(status=status)
+	if invoice_ids is not None:
+		invoices = invoices.filter(pk__in=invoice_ids)
+	return invoices
+
+
+def apply_bulk_adjustment(
+	invoices: QuerySet,
+	*,
+	adjustment_type: str,
+	rule: str,
+	value: Decimal,
+	reason: str = "",
+) -> dict:
+	"""Add one credit or debit note to every invoice in ``invoices`` and summarize.
+
+	``value`` is the amount per invoice for ``fixed``, a percentage of each
+	invoice's total for ``percentage``, or one amount split in proportion to
+	the invoice totals for ``pro_rata`` (invoices must share a currency).
+	Credits are stored negative and debits positive, as the single-invoice
+	credit and debit notes do. Invoices whose adjustment rounds to zero are
+	skipped.
+	"""
+	sign = -1 if adjustment_type == InvoiceAdjustment.AdjustmentType.CREDIT else 1
+	with unit_of_work():
+		rows = list(invoices.order_by("pk").values("pk", "folio_id", "currency", "total"))
+		if rule == AmountRule.PRO_RATA:
+			currencies = {row["currency"] for row in rows}
+			if len(currencies) > 1:
+				raise AdjustmentError("A pro rata split needs invoices in a single currency.")
+			currency = currencies.pop() if currencies else "USD"
+			weights = [
+				(row["pk"], money.to_minor(row["total"], currency))
+				for row in rows
+				if row["total"] > 0
+			]
+			split = allocate_pro_rata(money.to_minor(value, currency), weights)
+			minor = {row["pk"]: split.get(row["pk"], 0) for row in rows}
+		elif rule == AmountRule.PERCENTAGE:
+			minor = {
+				row["pk"]: money.percentage(money.to_minor(row["total"], row["currency"]), value)
+				for row in rows
+			}
+		else:
+			minor = {row["pk"]: money.to_minor(value, row["currency"]) for row in rows}
+
+		adjustments, totals = [], defaultdict(lambda: {"count": 0, "amount": Decimal("0.00")})
+		for row in rows:
+			if not minor[row["pk"]]:
+				continue
+			amount = sign * money.from_minor(abs(minor[row["pk"]]), row["currency"])
+			adjustments.append(
+				InvoiceAdjustment(
+					invoice_id=row["pk"],
+					adjustment_type=adjustment_type,
+					amount=amount,
+					reason=reason,
+				)
+			)
+			totals[row["currency"]]["count"] += 1
+			totals[row["currency"]]["amount"] += amount
+		InvoiceAdjustment.objects.bulk_create(adjustments, batch_size=1000)
+		folio_ids = {row["pk"]: row["folio_id"] for row in rows}
+		LedgerEntry.objects.append(
+			[adjustment.ledger_entry(folio_ids[adjustment.invoice_id]) for adjustment in adjustments]
+		)
+		for adjustment in adjustments:
+			mark_invoice_dirty(adjustment.invoice_id)
+
+	return {
+		"adjusted": len(adjustments),
+		"skipped": len(rows) - len(adjustments),
+		"totals": [
+			{"currency": currency, **summary} for currency, summary in sorted(totals.items())
+		],
+	}
@@ -10,8 +10,11 @@ from .models import (
 	InvoiceAdjustment,
 	InvoiceDiscount,
 	InvoiceLine,
+	LedgerEntry,
+	NightAuditRun,
 	Payment,
 	PaymentMethod,
+	RatePlan,
 	Reservation,
 	TaxRule,
 	WebhookEvent,
@@ -40,14 +43,20 @@ class ReservationAdmin(admin.ModelAdmin):
 class FolioItemInline(admin.TabularInline):
 	model = FolioItem
 	extra = 0
+	readonly_fields = ("line_total", "tax_amount")
 
 
 @admin.register(Folio)
 class FolioAdmin(admin.ModelAdmin):
-	list_display = ("folio_number", "guest_name", "status", "created_at")
+	list_display = ("folio_number", "guest_name", "status", "total", "created_at")
 	list_filter = ("status",)
 	search_fields = ("folio_number", "guest_name")
 	inlines = [FolioItemInline]
+	actions = ["refresh_totals"]
+
+	@admin.action(description="Recalculate totals from items")
+	def refresh_totals(self, request, queryset):
+		queryset.refresh_totals()
 
 
 class InvoiceLineInline(admin.TabularInline):
@@ -70,9 +79,54 @@ class PaymentAdmin(admin.ModelAdmin):
 	search_fields = ("invoice__invoice_number", "reference")
 
 
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+	list_display = ("folio", "invoice", "entry_type", "amount", "recorded_at")
+	list_filter = ("entry_type",)
+	search_fields = ("folio__folio_number", "description")
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+
+@admin.register(TaxRule)
+class TaxRuleAdmin(admin.ModelAdmin):
+	list_display = (
+		"name", "rate", "item_type", "auto_apply", "compound", "inclusive", "priority", "is_active"
+	)
+	list_filter = ("is_active", "auto_apply", "item_type")
+	search_fields = ("name",)
+
+
+@admin.register(RatePlan)
+class RatePlanAdmin(admin.ModelAdmin):
+	list_display = ("code", "name", "nightly_rate", "tax_rule", "is_active")
+	list_filter = ("is_active",)
+	search_fields = ("code", "name")
+
+
+@admin.register(NightAuditRun)
+class NightAuditRunAdmin(admin.ModelAdmin):
+	list_display = ("business_date", "status", "posted", "skipped", "started_at", "finished_at")
+	list_filter = ("status",)
+	readonly_fields = ("owner", "lease_expires_at", "started_at", "finished_at", "posted", "skipped", "error")
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+	list_display = ("source", "event_type", "status", "attempts", "next_attempt_at", "created_at")
+	list_filter = ("status", "source")
+	search_fields = ("event_type", "notes")
+	actions = ["requeue"]
+
+	@admin.action(description="Requeue for processing")
+	def requeue(self, request, queryset):
+		queryset.exclude(status=WebhookEvent.EventStatus.PROCESSING).update(
+			status=WebhookEvent.EventStatus.RECEIVED, attempts=0, next_attempt_at=None
+		)
+
+
 admin.site.register(Discount)
-admin.site.register(TaxRule)
 admin.site.register(PaymentMethod)
 admin.site.register(InvoiceDiscount)
 admin.site.register(InvoiceAdjustment)
-admin.site.register(WebhookEvent)
@@ -0,0 +1,58 @@
+"""
+Per-thread compiled lookups that are rebuilt when their source rows change.
+
+Each :class:`CompiledCache` keeps the value it built in a thread-local, along
+with the token it read from its :class:`~billing.models.CompiledCacheVersion`
+row. Saving a source row calls ``invalidate()``, which writes a new token in
+the same transaction: once it commits, every thread in every process sees
+the new token on its next ``get()`` and rebuilds; if it rolls back, the old
+token comes back and the value built from the rolled-back rows no longer
+matches it. Rows changed without going through ``save()`` are picked up once
+the value is ``MAX_AGE`` seconds old.
+"""
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+from .models import CompiledCacheVersion
+
+T = TypeVar("T")
+
+# Rebuild at least this often (seconds), even without an invalidation.
+MAX_AGE = 300
+
+
+class CompiledCache(Generic[T]):
+	def __init__(self, key: str, build: Callable[[], T], *, max_age: float = MAX_AGE) -> None:
+		self.key = key
+		self.build = build
+		self.max_age = max_age
+		self._local = threading.local()
+
+	def get(self) -> T:
+		"""The compiled value, rebuilt if the source changed since this thread built it.
+
+		Costs one indexed read of the token. Inside a transaction that changed
+		the source, the token read is the transaction's own, so the value is
+		built from its uncommitted rows.
+		"""
+		token = (
+			CompiledCacheVersion.objects.filter(key=self.key).values_list("token", flat=True).first()
+			or ""
+		)
+		now = time.monotonic()
+		if (
+			getattr(self._local, "token", None) != token
+			or now - self._local.built_at > self.max_age
+		):
+			self._local.value = self.build()
+			self._local.token, self._local.built_at = token, now
+		return self._local.value
+
+	def invalidate(self) -> None:
+		"""Make every process rebuild the value once the current transaction commits."""
+		CompiledCacheVersion.objects.update_or_create(
+			key=self.key, defaults={"token": uuid.uuid4().hex}
+		)
@@ -0,0 +1,180 @@
+"""
+Discount resolution for invoices.
+
+Active automatic :class:`Discount` rows are compiled into a
+:class:`DiscountIndex` keyed by corporate account, cached per thread and
+rebuilt when a discount is saved or deleted; corporate account discount
+rates are cached the same way. Resolving the discounts for a folio, or for
+a whole chunk of folios, is then a dictionary lookup and a date check
+rather than a query per discount or per folio.
+"""
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from . import money
+from .caching import CompiledCache
+from .models import CorporateAccount, Discount, Folio
+
+
+class CompiledDiscount(NamedTuple):
+	pk: Optional[int]
+	discount_type: str
+	value: Decimal
+	priority: int
+	stackable: bool
+	max_amount: Optional[Decimal]
+	start_date: Optional[date]
+	end_date: Optional[date]
+	description: str = ""
+
+	@classmethod
+	def from_discount(cls, discount: Discount) -> "CompiledDiscount":
+		return cls(
+			pk=discount.pk,
+			discount_type=discount.discount_type,
+			value=discount.value,
+			priority=discount.priority,
+			stackable=discount.stackable,
+			max_amount=discount.max_amount,
+			start_date=discount.start_date,
+			end_date=discount.end_date,
+		)
+
+	@classmethod
+	def corporate_rate(cls, rate: Decimal) -> "CompiledDiscount":
+		"""A corporate account's negotiated rate, applied first and stacked with the rest."""
+		return cls(
+			pk=None,
+			discount_type=Discount.DiscountType.PERCENTAGE,
+			value=rate,
+			priority=0,
+			stackable=True,
+			max_amount=None,
+			start_date=None,
+			end_date=None,
+			description=f"Corporate rate {rate}%",
+		)
+
+	def applies_on(self, day: date) -> bool:
+		return (self.start_date is None or self.start_date <= day) and (
+			self.end_date is None or day <= self.end_date
+		)
+
+
+class DiscountIndex:
+	"""Active automatic discounts, indexed by the corporate account they belong to.
+
+	Discounts without a corporate account apply to every folio.
+	"""
+
+	def __init__(self, discounts: Iterable[Discount]) -> None:
+		self._by_account: dict[Optional[int], list[CompiledDiscount]] = defaultdict(list)
+		for discount in discounts:
+			self._by_account[discount.corporate_account_id].append(
+				CompiledDiscount.from_discount(discount)
+			)
+		self._resolved: dict[tuple, tuple[CompiledDiscount, ...]] = {}
+
+	def applicable(self, corporate_account_id: Optional[int], day: date) -> tuple[CompiledDiscount, ...]:
+		"""Automatic discounts for a folio of ``corporate_account_id`` invoiced on ``day``."""
+		key = (corporate_account_id, day)
+		if key not in self._resolved:
+			candidates = self._by_account[None]
+			if corporate_account_id is not None:
+				candidates = candidates + self._by_account[corporate_account_id]
+			self._resolved[key] = tuple(
+				discount for discount in candidates if discount.applies_on(day)
+			)
+		return self._resolved[key]
+
+
+_discount_index = CompiledCache(
+	"billing:discount-index",
+	lambda: DiscountIndex(Discount.objects.filter(is_active=True, auto_apply=True)),
+)
+_corporate_rates = CompiledCache(
+	"billing:corporate-rates",
+	lambda: {
+		account_id: CompiledDiscount.corporate_rate(rate)
+		for account_id, rate in CorporateAccount.objects.filter(discount_rate__gt=0).values_list(
+			"pk", "discount_rate"
+		)
+	},
+)
+
+
+def discount_index() -> DiscountIndex:
+	"""The compiled discount index, rebuilt after any discount change commits."""
+	return _discount_index.get()
+
+
+def invalidate_discount_index() -> None:
+	_discount_index.invalidate()
+
+
+def corporate_rates() -> dict[int, CompiledDiscount]:
+	"""Each corporate account's discount rate, keyed by account id, for accounts that have one."""
+	return _corporate_rates.get()
+
+
+def invalidate_corporate_rates() -> None:
+	_corporate_rates.invalidate()
+
+
+def automatic_discounts(folios: Iterable[Folio], day: date) -> dict[int, tuple[CompiledDiscount, ...]]:
+	"""The corporate rate and automatic discounts for each folio on ``day``, keyed by folio id.
+
+	Only ``pk`` and ``corporate_account_id`` are read from the folios, and the
+	lookups are served from the compiled caches, so this runs no queries
+	once the caches are warm.
+	"""
+	index, rates = discount_index(), corporate_rates()
+	resolved = {}
+	for folio in folios:
+		account_id = folio.corporate_account_id
+		rate = (rates[account_id],) if account_id in rates else ()
+		resolved[folio.pk] = (*rate, *index.applicable(account_id, day))
+	return resolved
+
+
+def _stacking_order(discount: CompiledDiscount) -> tuple:
+	# Corporate rates have no pk and go first among discounts of the same priority.
+	return (discount.priority, discount.pk is not None, discount.pk or 0)
+
+
+def apply_discounts(
+	base_amount: int, discounts: Iterable[CompiledDiscount], currency: str
+) -> list[tuple[CompiledDiscount, int]]:
+	"""Stack ``discounts`` on a base amount in minor units and return each one's share.
+
+	Discounts apply in priority order and a percentage is taken from what is
+	left after the discounts before it. Each is capped at its ``max_amount``
+	and at the amount still left, so the total never exceeds the base. A
+	discount that is not stackable only applies when nothing else has, and
+	nothing applies after it. Discounts that would take off nothing are left out.
+	"""
+	unique = {discount.pk: discount for discount in discounts}.values()
+	remaining = base_amount
+	applied: list[tuple[CompiledDiscount, int]] = []
+	for discount in sorted(unique, key=_stacking_order):
+		if remaining <= 0:
+			break
+		if not discount.stackable and applied:
+			continue
+		if discount.discount_type == Discount.DiscountType.PERCENTAGE:
+			amount = money.percentage(remaining, discount.value)
+		else:
+			amount = money.to_minor(discount.value, currency)
+		if discount.max_amount is not None:
+			amount = min(amount, money.to_minor(discount.max_amount, currency))
+		amount = min(amount, remaining)
+		if amount <= 0:
+			continue
+		applied.append((discount, amount))
+		remaining -= amount
+		if not discount.stackable:
+			break
+	return applied
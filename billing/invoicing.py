@@ -0,0 +1,260 @@
+"""
+Invoice generation from folios.
+
+Lines, their per-rule taxes and discounts are computed in memory from one
+read of the folio's items and their tax rows and written with
+``bulk_create``; the totals are then left to the
+unit of work, so creating an invoice costs the same number of queries
+whatever the number of items.
+
+``generate_invoices()`` does the same for many folios at once: the folios
+are split into chunks, each chunk is invoiced in its own transaction with a
+fixed number of queries, and chunks are spread over a bounded thread pool.
+Each chunk locks its folios and selects them again under the lock, so a
+folio invoiced by a concurrent run in the meantime is skipped rather than
+invoiced twice.
+"""
+import logging
+from collections import defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from . import money
+from .discounts import CompiledDiscount, apply_discounts, automatic_discounts
+from .models import (
+	CorporateAccount,
+	Discount,
+	Folio,
+	FolioItem,
+	FolioItemTax,
+	Invoice,
+	InvoiceDiscount,
+	InvoiceLine,
+	InvoiceLineTax,
+	LedgerEntry,
+)
+from .unit_of_work import mark_invoice_dirty, unit_of_work
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 200
+DEFAULT_WORKERS = 4
+_ITEM_FIELDS = ("id", "folio_id", "description", "quantity", "unit_price", "line_total", "tax_amount")
+
+
+def build_lines(invoice: Invoice, items: Iterable[FolioItem]) -> list[InvoiceLine]:
+	return [
+		InvoiceLine(
+			invoice=invoice,
+			folio_item=item,
+			description=item.description,
+			quantity=item.quantity,
+			unit_price=item.unit_price,
+			net_amount=item.line_total,
+			tax_amount=item.tax_amount,
+		)
+		for item in items
+	]
+
+
+def build_line_taxes(lines: Iterable[InvoiceLine]) -> list[InvoiceLineTax]:
+	"""Copy the tax rows of each saved line's item onto the line, in one query."""
+	lines_by_item = {line.folio_item_id: line for line in lines if line.folio_item_id}
+	taxes = FolioItemTax.objects.filter(
+		folio_item_id__in=lines_by_item, tax_rule__isnull=False
+	).values("folio_item_id", "tax_rule_id", "tax_rule__name", "taxable_amount", "amount")
+	return [
+		InvoiceLineTax(
+			invoice_line=lines_by_item[tax["folio_item_id"]],
+			tax_rule_id=tax["tax_rule_id"],
+			tax_rule_name=tax["tax_rule__name"],
+			taxable_amount=tax["taxable_amount"],
+			amount=tax["amount"],
+		)
+		for tax in taxes.order_by("pk")
+	]
+
+
+def build_discounts(
+	invoice: Invoice,
+	lines: Iterable[InvoiceLine],
+	discounts: Iterable[CompiledDiscount],
+	currency: str,
+) -> list[InvoiceDiscount]:
+	base_amount = sum(
+		money.to_minor(line.net_amount, currency) + money.to_minor(line.tax_amount, currency)
+		for line in lines
+	)
+	return [
+		InvoiceDiscount(
+			invoice=invoice,
+			discount_id=discount.pk,
+			description=discount.description,
+			applied_amount=money.from_minor(amount, currency),
+		)
+		for discount, amount in apply_discounts(base_amount, discounts, currency)
+	]
+
+
+def populate_invoice(invoice: Invoice, discounts: Iterable[Discount] = ()) -> None:
+	"""Copy the folio's items onto ``invoice`` as lines and apply discounts.
+
+	The requested ``discounts`` are stacked with the folio's corporate rate
+	and every automatic discount that applies to it on the invoice date.
+	"""
+	folio = invoice.folio
+	items = FolioItem.objects.filter(folio_id=folio.pk).only(*_ITEM_FIELDS)
+	lines = InvoiceLine.objects.bulk_create(build_lines(invoice, items))
+	InvoiceLineTax.objects.bulk_create(build_line_taxes(lines))
+	automatic = automatic_discounts([folio], timezone.localdate(invoice.issued_at))[folio.pk]
+	resolved = [*automatic, *(CompiledDiscount.from_discount(discount) for discount in discounts)]
+	applied = build_discounts(invoice, lines, resolved, folio.currency)
+	if applied:
+		InvoiceDiscount.objects.bulk_create(applied)
+		LedgerEntry.objects.append([discount.ledger_entry(folio.pk) for discount in applied])
+	mark_invoice_dirty(invoice)
+
+
+def billable_folios(
+	*,
+	corporate_account: CorporateAccount | None = None,
+	status: str | None = Folio.FolioStatus.OPEN,
+	created_from: date | None = None,
+	created_to: date | None = None,
+	include_invoiced: bool = False,
+) -> QuerySet:
+	"""Folios selected by the batch invoicing filters."""
+	folios = Folio.objects.all()
+	if corporate_account is not None:
+		folios = folios.filter(corporate_account=corporate_account)
+	if status:
+		folios = folios.filter(status=status)
+	if created_from:
+		folios = folios.filter(created_at__date__gte=created_from)
+	if created_to:
+		folios = folios.filter(created_at__date__lte=created_to)
+	if not include_invoiced:
+		folios = folios.filter(invoices__isnull=True)
+	return folios
+
+
+def _invoice_chunk(folios: QuerySet, folio_ids: list[int], due_date: date | None) -> list[dict]:
+	"""Invoice one chunk of folios in a single transaction and report on each folio."""
+	results = {
+		folio_id: {
+			"folio_id": folio_id,
+			"status": "skipped",
+			"detail": "Folio no longer matches or is being invoiced elsewhere.",
+		}
+		for folio_id in folio_ids
+	}
+	try:
+		with unit_of_work():
+			# Folios locked by another run are skipped; the filters are checked again under the lock.
+			locked = folios.filter(pk__in=folio_ids).select_for_update(
+				skip_locked=connection.features.has_select_for_update_skip_locked, of=("self",)
+			)
+			folios = list(locked.only("id", "folio_number", "currency", "corporate_account_id"))
+			folio_ids = [folio.pk for folio in folios]
+			discounts = automatic_discounts(folios, timezone.localdate())
+			items_by_folio = defaultdict(list)
+			for item in FolioItem.objects.filter(folio_id__in=folio_ids).only(*_ITEM_FIELDS):
+				items_by_folio[item.folio_id].append(item)
+
+			pending = []
+			for folio in folios:
+				results[folio.pk] = {"folio_id": folio.pk, "folio_number": folio.folio_number}
+				if items_by_folio[folio.pk]:
+					pending.append(Invoice(folio=folio, currency=folio.currency, due_date=due_date))
+				else:
+					results[folio.pk].update(status="skipped", detail="Folio has no items.")
+
+			invoices = Invoice.objects.bulk_create(pending)
+			lines, applied = [], []
+			for invoice in invoices:
+				invoice_lines = build_lines(invoice, items_by_folio[invoice.folio_id])
+				lines.extend(invoice_lines)
+				applied.extend(
+					build_discounts(
+						invoice, invoice_lines, discounts[invoice.folio_id], invoice.currency
+					)
+				)
+				mark_invoice_dirty(invoice.pk)
+				results[invoice.folio_id].update(
+					status="created",
+					invoice_id=invoice.pk,
+					invoice_number=invoice.invoice_number,
+				)
+			InvoiceLine.objects.bulk_create(lines, batch_size=1000)
+			InvoiceLineTax.objects.bulk_create(build_line_taxes(lines), batch_size=1000)
+			InvoiceDiscount.objects.bulk_create(applied, batch_size=1000)
+			LedgerEntry.objects.append(
+				[discount.ledger_entry(discount.invoice.folio_id) for discount in applied]
+			)
+	except Exception as exc:
+		logger.exception("Invoicing a chunk of %d folios failed", len(results))
+		return [
+			{"folio_id": folio_id, "status": "failed", "detail": str(exc) or type(exc).__name__}
+			for folio_id in results
+		]
+	return list(results.values())
+
+
+def _invoice_chunk_in_thread(
+	folios: QuerySet, folio_ids: list[int], due_date: date | None
+) -> list[dict]:
+	try:
+		return _invoice_chunk(folios, folio_ids, due_date)
+	finally:
+		# Worker threads get their own connection; give it back when done.
+		connection.close()
+
+
+def generate_invoices(
+	folios: QuerySet,
+	*,
+	due_date: date | None = None,
+	chunk_size: int = DEFAULT_CHUNK_SIZE,
+	workers: int | None = None,
+) -> list[dict]:
+	"""Invoice every folio in ``folios`` and return one result row per folio.
+
+	``workers`` defaults to ``BILLING_INVOICE_WORKERS`` (or 4); SQLite allows a
+	single writer, so it always runs the chunks one after another in the
+	calling thread.
+	"""
+	folio_ids = list(folios.order_by("pk").values_list("pk", flat=True))
+	chunks = [folio_ids[i : i + chunk_size] for i in range(0, len(folio_ids), chunk_size)]
+	if workers is None:
+		workers = getattr(settings, "BILLING_INVOICE_WORKERS", DEFAULT_WORKERS)
+	if connection.vendor == "sqlite":
+		workers = 1
+
+	results = []
+	if workers <= 1 or len(chunks) <= 1:
+		for chunk in chunks:
+			results.extend(_invoice_chunk(folios, chunk, due_date))
+		return results
+
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		for chunk_results in pool.map(
+			_invoice_chunk_in_thread, [folios] * len(chunks), chunks, [due_date] * len(chunks)
+		):
+			results.extend(chunk_results)
+	return results
+
+
+def summarize(results: list[dict]) -> dict:
+	"""Count the batch results per outcome and attach the rows."""
+	report = {
+		outcome: sum(1 for row in results if row["status"] == outcome)
+		for outcome in ("created", "skipped", "failed")
+	}
+	report["results"] = results
+	return report
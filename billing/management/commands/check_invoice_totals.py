@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.models import CENT, Invoice
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Compare stored invoice totals with their lines, discounts and adjustments."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Recalculate the stored totals of every drifted invoice.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--start-id", type=int, default=0, help="Resume after this invoice id.")
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Drifted invoices to list (default: 20)."
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be positive.")
+        fields = list(Invoice.TOTAL_FIELDS)
+        columns = ["pk", "invoice_number", *fields, *(f"computed_{name}" for name in fields)]
+
+        last_id = options["start_id"]
+        checked = drifted = repaired = 0
+        while True:
+            # Keyset pagination: bound each chunk by primary key instead of OFFSET.
+            ids = list(
+                Invoice.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:chunk_size]
+            )
+            if not ids:
+                break
+            chunk = Invoice.objects.filter(pk__gte=ids[0], pk__lte=ids[-1])
+            rows = list(chunk.drifted().order_by("pk").values(*columns))
+            checked += len(ids)
+            for row in rows[: max(options["limit"] - drifted, 0)]:
+                changes = ", ".join(
+                    f"{name} {row[name]} != {row[f'computed_{name}'].quantize(CENT)}"
+                    for name in fields
+                    if row[name] != row[f"computed_{name}"]
+                )
+                self.stdout.write(f"{row['invoice_number']} (#{row['pk']}): {changes}")
+            drifted += len(rows)
+            if rows and options["repair"]:
+                repaired += Invoice.objects.filter(
+                    pk__in=[row["pk"] for row in rows]
+                ).recalculate_totals()
+            last_id = ids[-1]
+
+        summary = f"Checked {checked} invoices, {drifted} drifted"
+        if options["repair"]:
+            summary += f", {repaired} repaired"
+        style = self.style.SUCCESS if not drifted or repaired == drifted else self.style.WARNING
+        self.stdout.write(style(summary + "."))
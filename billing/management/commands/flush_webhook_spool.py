@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.spool import DEFAULT_BATCH_SIZE, flush_spool, spool_dir
+
+
+class Command(BaseCommand):
+    help = "Insert the webhook events buffered in WEBHOOK_SPOOL_DIR into the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between flushes once the spool is drained (default: 1).",
+        )
+        parser.add_argument("--once", action="store_true", help="Flush once and exit.")
+
+    def handle(self, *args, **options):
+        if spool_dir() is None:
+            raise CommandError("WEBHOOK_SPOOL_DIR is not set.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        if options["once"]:
+            flushed = flush_spool(batch_size=options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} events."))
+            return
+        try:
+            while True:
+                flushed = flush_spool(batch_size=options["batch_size"])
+                if flushed:
+                    self.stdout.write(f"Flushed {flushed} events.")
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
@@ -0,0 +1,66 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.invoicing import DEFAULT_CHUNK_SIZE, billable_folios, generate_invoices, summarize
+from billing.models import CorporateAccount, Folio
+
+
+class Command(BaseCommand):
+    help = "Invoice every folio matching the filters, in chunks spread over a worker pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corporate-account", help="Corporate account code to invoice.")
+        parser.add_argument(
+            "--status",
+            default=Folio.FolioStatus.OPEN,
+            choices=Folio.FolioStatus.values,
+            help="Folio status to select (default: open).",
+        )
+        parser.add_argument("--from", dest="created_from", type=date.fromisoformat)
+        parser.add_argument("--to", dest="created_to", type=date.fromisoformat)
+        parser.add_argument("--due-date", type=date.fromisoformat)
+        parser.add_argument(
+            "--include-invoiced",
+            action="store_true",
+            help="Also invoice folios that already have an invoice.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--workers", type=int, help="Parallel chunk workers.")
+
+    def handle(self, *args, **options):
+        corporate_account = None
+        if options["corporate_account"]:
+            try:
+                corporate_account = CorporateAccount.objects.get(code=options["corporate_account"])
+            except CorporateAccount.DoesNotExist:
+                raise CommandError(f"Unknown corporate account {options['corporate_account']!r}.")
+
+        folios = billable_folios(
+            corporate_account=corporate_account,
+            status=options["status"],
+            created_from=options["created_from"],
+            created_to=options["created_to"],
+            include_invoiced=options["include_invoiced"],
+        )
+        started = time.monotonic()
+        results = generate_invoices(
+            folios,
+            due_date=options["due_date"],
+            chunk_size=options["chunk_size"],
+            workers=options["workers"],
+        )
+        elapsed = time.monotonic() - started
+        report = summarize(results)
+
+        for row in results:
+            if row["status"] == "failed":
+                self.stderr.write(f"Folio {row['folio_id']}: {row['detail']}")
+        rate = report["created"] / elapsed * 60 if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']} invoices, skipped {report['skipped']}, "
+                f"failed {report['failed']} in {elapsed:.1f}s ({rate:.0f} invoices/min)."
+            )
+        )
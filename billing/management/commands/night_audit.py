@@ -0,0 +1,38 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from billing.night_audit import DEFAULT_CHUNK_SIZE, NightAuditLocked, run_night_audit
+
+
+class Command(BaseCommand):
+    help = "Post the night's room charges to every in-house reservation."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--date",
+            dest="business_date",
+            type=date.fromisoformat,
+            help="Business date to audit (default: today).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive.")
+        business_date = options["business_date"] or timezone.localdate()
+
+        started = time.monotonic()
+        try:
+            run = run_night_audit(business_date, chunk_size=options["chunk_size"])
+        except NightAuditLocked as exc:
+            raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Night audit {run.business_date} {run.status}: posted {run.posted}, "
+                f"skipped {run.skipped} in {elapsed:.1f}s."
+            )
+        )
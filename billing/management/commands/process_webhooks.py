@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from billing.webhooks import DEFAULT_BATCH_SIZE, HANDLERS, process_pending, worker_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Claim and apply due webhook events in batches. Any number of workers can run "
+        "side by side; each batch is leased to one of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", choices=sorted(HANDLERS), help="Only process this source.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling for new and retried events instead of exiting once drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls with --watch (default: 1).",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        owner = worker_id()
+        if not options["watch"]:
+            started = time.monotonic()
+            totals = self._drain(owner, options)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Processed {totals['processed']} events, {totals['failed']} failed "
+                    f"in {elapsed:.1f}s."
+                )
+            )
+            return
+
+        self.stdout.write(f"Worker {owner} watching for webhook events.")
+        try:
+            while True:
+                totals = self._drain(owner, options)
+                if totals["processed"] or totals["failed"]:
+                    self.stdout.write(
+                        f"Processed {totals['processed']} events, {totals['failed']} failed."
+                    )
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped.")
+
+    def _drain(self, owner, options):
+        return process_pending(options["source"], batch_size=options["batch_size"], owner=owner)
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:27
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_folio_totals(apps, schema_editor):
+    Folio = apps.get_model("billing", "Folio")
+    FolioItem = apps.get_model("billing", "FolioItem")
+    cent = Decimal("0.01")
+    totals = {}
+    for item in FolioItem.objects.select_related("tax_rule").iterator():
+        line_total = item.quantity * item.unit_price
+        tax = Decimal("0.00")
+        if item.tax_rule_id and item.tax_rule.is_active:
+            tax = (line_total * item.tax_rule.rate) / Decimal("100.00")
+        subtotal, tax_total = totals.get(
+            item.folio_id, (Decimal("0.00"), Decimal("0.00"))
+        )
+        totals[item.folio_id] = (subtotal + line_total, tax_total + tax)
+    for folio_id, (subtotal, tax_total) in totals.items():
+        subtotal = subtotal.quantize(cent)
+        tax_total = tax_total.quantize(cent)
+        Folio.objects.filter(pk=folio_id).update(
+            subtotal=subtotal, tax_total=tax_total, total=subtotal + tax_total
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folio",
+            name="subtotal",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="folio",
+            name="tax_total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="folio",
+            name="total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.RunPython(backfill_folio_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:29
+
+from decimal import ROUND_HALF_UP, Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_item_amounts(apps, schema_editor):
+    Folio = apps.get_model("billing", "Folio")
+    FolioItem = apps.get_model("billing", "FolioItem")
+    cent = Decimal("0.01")
+    batch = []
+    for item in FolioItem.objects.select_related("tax_rule").iterator():
+        item.line_total = (item.quantity * item.unit_price).quantize(
+            cent, rounding=ROUND_HALF_UP
+        )
+        item.tax_amount = Decimal("0.00")
+        if item.tax_rule_id and item.tax_rule.is_active:
+            item.tax_amount = (
+                (item.line_total * item.tax_rule.rate) / Decimal("100.00")
+            ).quantize(cent, rounding=ROUND_HALF_UP)
+        batch.append(item)
+        if len(batch) >= 500:
+            FolioItem.objects.bulk_update(batch, ["line_total", "tax_amount"])
+            batch = []
+    FolioItem.objects.bulk_update(batch, ["line_total", "tax_amount"])
+
+    totals = FolioItem.objects.values("folio_id").annotate(
+        subtotal=Sum("line_total"), tax_total=Sum("tax_amount")
+    )
+    for row in totals:
+        Folio.objects.filter(pk=row["folio_id"]).update(
+            subtotal=row["subtotal"],
+            tax_total=row["tax_total"],
+            total=row["subtotal"] + row["tax_total"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0002_folio_stored_totals"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="folioitem",
+            name="line_total",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="folioitem",
+            name="tax_amount",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.RunPython(backfill_item_amounts, migrations.RunPython.noop),
+    ]
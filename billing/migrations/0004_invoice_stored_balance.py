@@ -0,0 +1,52 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:32
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_invoice_balance(apps, schema_editor):
+    Invoice = apps.get_model("billing", "Invoice")
+    Payment = apps.get_model("billing", "Payment")
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = (
+        Payment.objects.filter(invoice=OuterRef("pk"), status="posted")
+        .order_by()
+        .values("invoice")
+        .annotate(amount=Sum("amount"))
+        .values("amount")
+    )
+    Invoice.objects.update(
+        amount_paid=Coalesce(
+            Subquery(paid, output_field=money),
+            Value(Decimal("0.00")),
+            output_field=money,
+        )
+    )
+    Invoice.objects.update(balance_due=F("total") - F("amount_paid"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0003_folio_item_stored_amounts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="amount_paid",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="balance_due",
+            field=models.DecimalField(
+                db_index=True, decimal_places=2, default=Decimal("0.00"), max_digits=12
+            ),
+        ),
+        migrations.RunPython(backfill_invoice_balance, migrations.RunPython.noop),
+    ]
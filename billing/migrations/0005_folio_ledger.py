@@ -0,0 +1,190 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_ledger(apps, schema_editor):
+    FolioItem = apps.get_model("billing", "FolioItem")
+    InvoiceDiscount = apps.get_model("billing", "InvoiceDiscount")
+    InvoiceAdjustment = apps.get_model("billing", "InvoiceAdjustment")
+    Payment = apps.get_model("billing", "Payment")
+    PaymentRefund = apps.get_model("billing", "PaymentRefund")
+    LedgerEntry = apps.get_model("billing", "LedgerEntry")
+
+    def entries():
+        for item in FolioItem.objects.order_by("posted_at").iterator():
+            for entry_type, amount in (
+                ("charge", item.line_total),
+                ("tax", item.tax_amount),
+            ):
+                yield LedgerEntry(
+                    folio_id=item.folio_id,
+                    entry_type=entry_type,
+                    amount=amount,
+                    description=item.description,
+                    recorded_at=item.posted_at,
+                )
+        for discount in InvoiceDiscount.objects.select_related("invoice").iterator():
+            yield LedgerEntry(
+                folio_id=discount.invoice.folio_id,
+                invoice_id=discount.invoice_id,
+                entry_type="discount",
+                amount=-discount.applied_amount,
+                description=f"Discount {discount.discount_id}",
+                recorded_at=discount.created_at,
+            )
+        for adjustment in InvoiceAdjustment.objects.select_related(
+            "invoice"
+        ).iterator():
+            yield LedgerEntry(
+                folio_id=adjustment.invoice.folio_id,
+                invoice_id=adjustment.invoice_id,
+                entry_type="adjustment",
+                amount=adjustment.amount,
+                description=adjustment.reason,
+                recorded_at=adjustment.created_at,
+            )
+        payments = Payment.objects.exclude(status="void").select_related("invoice")
+        for payment in payments.iterator():
+            yield LedgerEntry(
+                folio_id=payment.invoice.folio_id,
+                invoice_id=payment.invoice_id,
+                entry_type="payment",
+                amount=-payment.amount,
+                description=payment.reference,
+                recorded_at=payment.paid_at,
+            )
+        refunds = PaymentRefund.objects.select_related("payment__invoice")
+        for refund in refunds.iterator():
+            yield LedgerEntry(
+                folio_id=refund.payment.invoice.folio_id,
+                invoice_id=refund.payment.invoice_id,
+                entry_type="refund",
+                amount=refund.amount,
+                description=refund.reason,
+                recorded_at=refund.created_at,
+            )
+
+    batch = []
+    for entry in entries():
+        if entry.amount:
+            batch.append(entry)
+        if len(batch) >= 1000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0004_invoice_stored_balance"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LedgerEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "entry_type",
+                    models.CharField(
+                        choices=[
+                            ("charge", "Charge"),
+                            ("tax", "Tax"),
+                            ("discount", "Discount"),
+                            ("payment", "Payment"),
+                            ("refund", "Refund"),
+                            ("adjustment", "Adjustment"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("description", models.CharField(blank=True, max_length=240)),
+                (
+                    "recorded_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "folio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger_entries",
+                        to="billing.folio",
+                    ),
+                ),
+                (
+                    "invoice",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger_entries",
+                        to="billing.invoice",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="LedgerSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("balance", models.DecimalField(decimal_places=2, max_digits=14)),
+                ("recorded_at", models.DateTimeField()),
+                (
+                    "folio",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ledger_snapshots",
+                        to="billing.folio",
+                    ),
+                ),
+                (
+                    "last_entry",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshot",
+                        to="billing.ledgerentry",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-last_entry_id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="ledgerentry",
+            index=models.Index(
+                fields=["folio", "recorded_at"], name="billing_led_folio_i_01f52e_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ledgersnapshot",
+            index=models.Index(
+                fields=["folio", "-last_entry"], name="billing_led_folio_i_b7c3ad_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:39
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_exposure(apps, schema_editor):
+    CorporateAccount = apps.get_model("billing", "CorporateAccount")
+    LedgerEntry = apps.get_model("billing", "LedgerEntry")
+    totals = (
+        LedgerEntry.objects.filter(folio__corporate_account__isnull=False)
+        .values("folio__corporate_account")
+        .annotate(exposure=Sum("amount"))
+    )
+    for row in totals:
+        CorporateAccount.objects.filter(pk=row["folio__corporate_account"]).update(
+            exposure=row["exposure"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0005_folio_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="corporateaccount",
+            name="credit_limit",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=14, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="corporateaccount",
+            name="enforce_credit_limit",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name="corporateaccount",
+            name="exposure",
+            field=models.DecimalField(
+                decimal_places=2, default=Decimal("0.00"), max_digits=14
+            ),
+        ),
+        migrations.RunPython(backfill_exposure, migrations.RunPython.noop),
+    ]
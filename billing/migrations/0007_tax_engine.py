@@ -0,0 +1,127 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_item_taxes(apps, schema_editor):
+    FolioItem = apps.get_model("billing", "FolioItem")
+    FolioItemTax = apps.get_model("billing", "FolioItemTax")
+    items = (
+        FolioItem.objects.filter(tax_rule__isnull=False)
+        .exclude(tax_amount=0)
+        .values_list("pk", "tax_rule_id", "line_total", "tax_amount")
+    )
+    batch = []
+    for pk, tax_rule_id, line_total, tax_amount in items.iterator(chunk_size=2000):
+        batch.append(
+            FolioItemTax(
+                folio_item_id=pk,
+                tax_rule_id=tax_rule_id,
+                taxable_amount=line_total,
+                amount=tax_amount,
+            )
+        )
+        if len(batch) >= 2000:
+            FolioItemTax.objects.bulk_create(batch)
+            batch = []
+    FolioItemTax.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0006_corporate_credit_limit"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taxrule",
+            name="auto_apply",
+            field=models.BooleanField(
+                default=False,
+                help_text="Apply to every matching item, not only items that name the rule.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="compound",
+            field=models.BooleanField(
+                default=False, help_text="Tax the net amount plus earlier taxes."
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="inclusive",
+            field=models.BooleanField(
+                default=False, help_text="The unit price already includes this tax."
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="item_type",
+            field=models.CharField(
+                blank=True,
+                help_text="Folio item type the rule applies to; blank for all.",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Lower priorities apply first."
+            ),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="valid_from",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="taxrule",
+            name="valid_to",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="FolioItemTax",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "taxable_amount",
+                    models.DecimalField(decimal_places=2, max_digits=12),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "folio_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="taxes",
+                        to="billing.folioitem",
+                    ),
+                ),
+                (
+                    "tax_rule",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="item_taxes",
+                        to="billing.taxrule",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["folio_item", "id"],
+            },
+        ),
+        migrations.RunPython(backfill_item_taxes, migrations.RunPython.noop),
+    ]
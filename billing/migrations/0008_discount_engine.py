@@ -0,0 +1,47 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0007_tax_engine"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="discount",
+            name="auto_apply",
+            field=models.BooleanField(
+                default=False,
+                help_text="Apply at invoice time to every matching folio without being requested.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="discount",
+            name="max_amount",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=2,
+                help_text="Most this discount takes off a single invoice.",
+                max_digits=12,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="discount",
+            name="priority",
+            field=models.PositiveSmallIntegerField(
+                default=0, help_text="Lower priorities apply first."
+            ),
+        ),
+        migrations.AddField(
+            model_name="discount",
+            name="stackable",
+            field=models.BooleanField(
+                default=True,
+                help_text="Combine with other discounts on the same invoice.",
+            ),
+        ),
+    ]
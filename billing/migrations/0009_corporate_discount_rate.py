@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0008_discount_engine"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoicediscount",
+            name="description",
+            field=models.CharField(blank=True, max_length=160),
+        ),
+        migrations.AlterField(
+            model_name="invoicediscount",
+            name="discount",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="invoice_discounts",
+                to="billing.discount",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0010_night_audit"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="webhookevent",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("received", "Received"),
+                    ("processed", "Processed"),
+                    ("failed", "Failed"),
+                ],
+                default="received",
+                max_length=40,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="webhookevent",
+            index=models.Index(
+                fields=["source", "status"], name="billing_web_source_b73a07_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:08
+
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+
+WEBHOOK_EVENT_ID_FIELDS = {"payment_gateway": "id"}
+
+
+def webhook_dedup_key(source, payload):
+    # Frozen copy of billing.models.webhook_dedup_key for stored events, which
+    # carry no header event id.
+    event_id = ""
+    if isinstance(payload, dict):
+        event_id = str(
+            payload.get(WEBHOOK_EVENT_ID_FIELDS.get(source, "event_id")) or ""
+        )
+    if event_id and len(event_id) <= 150:
+        return f"id:{event_id}"
+    if event_id:
+        return f"id-sha256:{hashlib.sha256(event_id.encode()).hexdigest()}"
+    content = json.dumps(
+        payload, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder
+    )
+    return f"sha256:{hashlib.sha256(content.encode()).hexdigest()}"
+
+
+def backfill_dedup_keys(apps, schema_editor):
+    # Same key the webhook views compute; later copies of a delivery keep a blank key.
+    WebhookEvent = apps.get_model("billing", "WebhookEvent")
+    seen = set()
+    batch = []
+    events = WebhookEvent.objects.order_by("pk").values_list("pk", "source", "payload")
+    for pk, source, payload in events.iterator(chunk_size=2000):
+        key = webhook_dedup_key(source, payload)
+        if (source, key) in seen:
+            continue
+        seen.add((source, key))
+        batch.append(WebhookEvent(pk=pk, dedup_key=key))
+        if len(batch) >= 2000:
+            WebhookEvent.objects.bulk_update(batch, ["dedup_key"])
+            batch = []
+    WebhookEvent.objects.bulk_update(batch, ["dedup_key"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0012_webhook_worker"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="webhookevent",
+            name="dedup_key",
+            field=models.CharField(blank=True, max_length=160),
+        ),
+        migrations.RunPython(backfill_dedup_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="webhookevent",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("dedup_key", ""), _negated=True),
+                fields=("source", "dedup_key"),
+                name="unique_webhook_event_dedup_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0013_webhook_dedup_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompiledCacheVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100, unique=True)),
+                ("token", models.CharField(max_length=32)),
+            ],
+        ),
+    ]
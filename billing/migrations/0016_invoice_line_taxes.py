@@ -0,0 +1,80 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_line_taxes(apps, schema_editor):
+    InvoiceLine = apps.get_model("billing", "InvoiceLine")
+    InvoiceLineTax = apps.get_model("billing", "InvoiceLineTax")
+    FolioItemTax = apps.get_model("billing", "FolioItemTax")
+    lines = InvoiceLine.objects.filter(folio_item__isnull=False).only(
+        "id", "folio_item_id"
+    )
+    for line in lines.iterator():
+        InvoiceLineTax.objects.bulk_create(
+            InvoiceLineTax(
+                invoice_line=line,
+                tax_rule_id=tax.tax_rule_id,
+                tax_rule_name=tax.tax_rule.name,
+                taxable_amount=tax.taxable_amount,
+                amount=tax.amount,
+            )
+            for tax in FolioItemTax.objects.filter(
+                folio_item_id=line.folio_item_id, tax_rule__isnull=False
+            )
+            .select_related("tax_rule")
+            .order_by("pk")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("billing", "0015_ledger_outlives_invoices"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceLineTax",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tax_rule_name", models.CharField(max_length=120)),
+                (
+                    "taxable_amount",
+                    models.DecimalField(decimal_places=2, max_digits=12),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                (
+                    "invoice_line",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="taxes",
+                        to="billing.invoiceline",
+                    ),
+                ),
+                (
+                    "tax_rule",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="invoice_line_taxes",
+                        to="billing.taxrule",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["invoice_line", "id"],
+            },
+        ),
+        migrations.RunPython(backfill_line_taxes, migrations.RunPython.noop),
+    ]
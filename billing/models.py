@@ -1,12 +1,20 @@
-from datetime import date
-from decimal import Decimal
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
+import hashlib
+import json
 import uuid
 
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Round
 from django.utils import timezone
 
 
+CENT = Decimal("0.01")
+
+
 class TimeStampedModel(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
@@ -37,6 +45,11 @@ class CorporateAccount(TimeStampedModel):
 	discount_rate = models.DecimalField(
 		max_digits=5, decimal_places=2, default=Decimal("0.00")
 	)
+	credit_limit = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+	enforce_credit_limit = models.BooleanField(default=True)
+	# Running sum of the ledger balances of the account's folios, moved by every
+	# LedgerEntry append so the credit check never has to aggregate.
+	exposure = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
 	notes = models.TextField(blank=True)
 
 	class Meta:
@@ -45,6 +58,38 @@ class CorporateAccount(TimeStampedModel):
 	def __str__(self) -> str:  # pragma: no cover
 		return self.name
 
+	def save(self, *args, **kwargs):
+		# exposure only moves through F() updates; never write back a stale copy of it.
+		if not self._state.adding and kwargs.get("update_fields") is None:
+			kwargs["update_fields"] = [
+				field.name
+				for field in self._meta.concrete_fields
+				if not field.primary_key and field.name != "exposure"
+			]
+		super().save(*args, **kwargs)
+		update_fields = kwargs.get("update_fields")
+		if update_fields is None or "discount_rate" in update_fields:
+			from .discounts import invalidate_corporate_rates  # discounts.py imports this module
+
+			invalidate_corporate_rates()
+
+	def delete(self, *args, **kwargs):
+		from .discounts import invalidate_corporate_rates
+
+		result = super().delete(*args, **kwargs)
+		invalidate_corporate_rates()
+		return result
+
+	def exceeds_credit_limit(self, amount: Decimal) -> bool:
+		"""Whether posting ``amount`` more would take the exposure over the credit limit."""
+		return self.credit_limit is not None and self.exposure + amount > self.credit_limit
+
+	@classmethod
+	def adjust_exposure(cls, deltas: dict[int, Decimal]) -> None:
+		for account_id, delta in deltas.items():
+			if delta:
+				cls.objects.filter(pk=account_id).update(exposure=models.F("exposure") + delta)
+
 
 class Discount(TimeStampedModel):
 	class DiscountType(models.TextChoices):
@@ -62,6 +107,20 @@ class Discount(TimeStampedModel):
 	corporate_account = models.ForeignKey(
 		CorporateAccount, related_name="discounts", on_delete=models.CASCADE, null=True, blank=True
 	)
+	auto_apply = models.BooleanField(
+		default=False, help_text="Apply at invoice time to every matching folio without being requested."
+	)
+	priority = models.PositiveSmallIntegerField(default=0, help_text="Lower priorities apply first.")
+	stackable = models.BooleanField(
+		default=True, help_text="Combine with other discounts on the same invoice."
+	)
+	max_amount = models.DecimalField(
+		max_digits=12,
+		decimal_places=2,
+		null=True,
+		blank=True,
+		help_text="Most this discount takes off a single invoice.",
+	)
 
 	class Meta:
 		ordering = ["-created_at"]
@@ -69,6 +128,19 @@ class Discount(TimeStampedModel):
 	def __str__(self) -> str:  # pragma: no cover
 		return self.name
 
+	def save(self, *args, **kwargs):
+		from .discounts import invalidate_discount_index  # discounts.py imports this module
+
+		super().save(*args, **kwargs)
+		invalidate_discount_index()
+
+	def delete(self, *args, **kwargs):
+		from .discounts import invalidate_discount_index
+
+		result = super().delete(*args, **kwargs)
+		invalidate_discount_index()
+		return result
+
 	def is_applicable(self, target_date: date | None = None) -> bool:
 		today = target_date or timezone.now().date()
 		if not self.is_active:
@@ -85,10 +157,34 @@ class TaxRule(TimeStampedModel):
 	rate = models.DecimalField(max_digits=5, decimal_places=2)
 	is_active = models.BooleanField(default=True)
 	description = models.TextField(blank=True)
+	item_type = models.CharField(
+		max_length=20, blank=True, help_text="Folio item type the rule applies to; blank for all."
+	)
+	auto_apply = models.BooleanField(
+		default=False, help_text="Apply to every matching item, not only items that name the rule."
+	)
+	compound = models.BooleanField(default=False, help_text="Tax the net amount plus earlier taxes.")
+	inclusive = models.BooleanField(default=False, help_text="The unit price already includes this tax.")
+	priority = models.PositiveSmallIntegerField(default=0, help_text="Lower priorities apply first.")
+	valid_from = models.DateField(null=True, blank=True)
+	valid_to = models.DateField(null=True, blank=True)
 
 	class Meta:
 		ordering = ["name"]
 
+	def save(self, *args, **kwargs):
+		from .taxes import invalidate_tax_table  # taxes.py imports this module
+
+		super().save(*args, **kwargs)
+		invalidate_tax_table()
+
+	def delete(self, *args, **kwargs):
+		from .taxes import invalidate_tax_table
+
+		result = super().delete(*args, **kwargs)
+		invalidate_tax_table()
+		return result
+
 	def __str__(self) -> str:  # pragma: no cover
 		return f"{self.name} ({self.rate}%)"
 
@@ -138,10 +234,71 @@ class Reservation(TimeStampedModel):
 		return f"Reservation {self.reservation_number}"
 
 
+class RatePlan(TimeStampedModel):
+	"""Nightly room price for reservations whose ``rate_plan`` is this plan's code."""
+
+	code = models.CharField(max_length=120, unique=True)
+	name = models.CharField(max_length=160)
+	nightly_rate = models.DecimalField(max_digits=10, decimal_places=2)
+	tax_rule = models.ForeignKey(
+		TaxRule, related_name="rate_plans", on_delete=models.SET_NULL, null=True, blank=True
+	)
+	is_active = models.BooleanField(default=True)
+
+	class Meta:
+		ordering = ["code"]
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"{self.code} ({self.nightly_rate})"
+
+
 def _folio_number() -> str:
 	return uuid.uuid4().hex[:10].upper()
 
 
+def _cents(expression: models.Expression) -> models.Expression:
+	"""``expression`` rounded to cents; SQLite sums decimals as binary floats."""
+	return Round(expression, 2, output_field=models.DecimalField(max_digits=12, decimal_places=2))
+
+
+def _summed(queryset: models.QuerySet, expression: models.Expression, group_by: str) -> models.Expression:
+	"""Correlated subquery summing ``expression`` over ``queryset`` to cents, zero when it is empty."""
+	money = models.DecimalField(max_digits=12, decimal_places=2)
+	rows = (
+		queryset.order_by()
+		.values(group_by)
+		.annotate(amount=_cents(models.Sum(expression, output_field=money)))
+		.values("amount")
+	)
+	return Coalesce(
+		models.Subquery(rows, output_field=money),
+		models.Value(Decimal("0.00")),
+		output_field=money,
+	)
+
+
+def _folio_item_totals() -> dict[str, models.Expression]:
+	"""SQL expressions for a folio's totals from its stored item amounts."""
+	items = FolioItem.objects.filter(folio=models.OuterRef("pk"))
+	return {
+		"subtotal": _summed(items, models.F("line_total"), "folio"),
+		"tax_total": _summed(items, models.F("tax_amount"), "folio"),
+		"total": _summed(items, models.F("line_total") + models.F("tax_amount"), "folio"),
+	}
+
+
+class FolioQuerySet(models.QuerySet):
+	def with_totals(self) -> "FolioQuerySet":
+		"""Annotate ``items_subtotal``, ``items_tax_total`` and ``items_total`` computed in SQL."""
+		return self.annotate(
+			**{f"items_{name}": expression for name, expression in _folio_item_totals().items()}
+		)
+
+	def refresh_totals(self) -> int:
+		"""Rewrite the stored totals of every folio in the queryset from its items."""
+		return self.update(**_folio_item_totals(), updated_at=timezone.now())
+
+
 class Folio(TimeStampedModel):
 	class FolioStatus(models.TextChoices):
 		OPEN = "open", "Open"
@@ -169,26 +326,86 @@ class Folio(TimeStampedModel):
 		max_length=20, choices=FolioStatus.choices, default=FolioStatus.OPEN
 	)
 	notes = models.TextField(blank=True)
+	subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	tax_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
 
 	discounts = models.ManyToManyField(Discount, through="FolioDiscount", blank=True)
 
+	objects = FolioQuerySet.as_manager()
+
+	TOTAL_FIELDS = ("subtotal", "tax_total", "total")
+
 	class Meta:
 		ordering = ["-created_at", "folio_number"]
 
 	def __str__(self) -> str:  # pragma: no cover
 		return f"Folio {self.folio_number}"
 
-	@property
-	def subtotal(self) -> Decimal:
-		return sum((item.line_total for item in self.items.all()), Decimal("0.00"))
-
-	@property
-	def tax_total(self) -> Decimal:
-		return sum((item.tax_amount for item in self.items.all()), Decimal("0.00"))
-
-	@property
-	def total(self) -> Decimal:
-		return self.subtotal + self.tax_total
+	def save(self, *args, **kwargs):
+		# The totals only move through adjust_totals(); never write back a stale copy of them.
+		if not self._state.adding and kwargs.get("update_fields") is None:
+			kwargs["update_fields"] = [
+				field.name
+				for field in self._meta.concrete_fields
+				if not field.primary_key and field.name not in self.TOTAL_FIELDS
+			]
+		with transaction.atomic():
+			previous_account_id = None
+			if not self._state.adding:
+				previous_account_id = (
+					Folio.objects.filter(pk=self.pk)
+					.values_list("corporate_account_id", flat=True)
+					.first()
+				)
+			super().save(*args, **kwargs)
+			if previous_account_id != self.corporate_account_id and not self._state.adding:
+				# The folio's balance now counts against a different account.
+				balance = self.ledger_balance()
+				deltas = defaultdict(Decimal)
+				if previous_account_id is not None:
+					deltas[previous_account_id] -= balance
+				if self.corporate_account_id is not None:
+					deltas[self.corporate_account_id] += balance
+				CorporateAccount.adjust_exposure(deltas)
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic():
+			account_id = (
+				Folio.objects.filter(pk=self.pk).values_list("corporate_account_id", flat=True).first()
+			)
+			if account_id is not None:
+				# The folio's ledger goes with it, and so does its share of the account's exposure.
+				CorporateAccount.adjust_exposure({account_id: -self.ledger_balance()})
+			return super().delete(*args, **kwargs)
+
+	def ledger_balance(self, as_of: datetime | None = None) -> Decimal:
+		"""Balance from the latest snapshot plus the entries after it, optionally as of a time."""
+		snapshots = self.ledger_snapshots.all()
+		entries = self.ledger_entries.all()
+		if as_of is not None:
+			snapshots = snapshots.filter(recorded_at__lte=as_of)
+			entries = entries.filter(recorded_at__lte=as_of)
+		balance = Decimal("0.00")
+		snapshot = snapshots.only("last_entry_id", "balance").first()
+		if snapshot is not None:
+			balance = snapshot.balance
+			entries = entries.filter(pk__gt=snapshot.last_entry_id)
+		return balance + (entries.aggregate(total=models.Sum("amount"))["total"] or Decimal("0.00"))
+
+	@classmethod
+	def adjust_totals(cls, folio_id: int, subtotal: Decimal, tax: Decimal) -> None:
+		"""Shift the stored totals of a folio by the given deltas in one UPDATE."""
+		subtotal = subtotal.quantize(CENT, rounding=ROUND_HALF_UP)
+		tax = tax.quantize(CENT, rounding=ROUND_HALF_UP)
+		if not subtotal and not tax:
+			return
+		cls.objects.filter(pk=folio_id).update(
+			subtotal=models.F("subtotal") + subtotal,
+			tax_total=models.F("tax_total") + tax,
+			total=models.F("total") + subtotal + tax,
+			updated_at=timezone.now(),
+		)
 
 
 class FolioDiscount(TimeStampedModel):
@@ -226,25 +443,149 @@ class FolioItem(TimeStampedModel):
 		null=True,
 		blank=True,
 	)
+	line_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	# Identifies the external charge an item was posted for, so reposting it is a no-op.
+	source_reference = models.CharField(max_length=120, blank=True)
 
 	class Meta:
 		ordering = ["-posted_at"]
+		constraints = [
+			models.UniqueConstraint(
+				fields=["folio", "source_reference"],
+				condition=~models.Q(source_reference=""),
+				name="unique_folio_item_source_reference",
+			)
+		]
+
+	def compute_amounts(self) -> list["FolioItemTax"]:
+		"""Set ``line_total`` and ``tax_amount`` and return the unsaved per-rule tax rows.
+
+		See :func:`billing.taxes.apply_taxes` for how stacked, compound and
+		inclusive taxes are applied and rounded.
+		"""
+		from .taxes import apply_taxes  # taxes.py imports this module
+
+		return apply_taxes([self])
+
+	def save(self, *args, **kwargs):
+		# Folio totals are stored, so every write moves them by the item's delta.
+		taxes = self.compute_amounts()
+		update_fields = kwargs.get("update_fields")
+		if update_fields is not None:
+			kwargs["update_fields"] = {*update_fields, "line_total", "tax_amount"}
+		with transaction.atomic():
+			previous = None
+			if self.pk is not None:
+				previous = (
+					FolioItem.objects.filter(pk=self.pk)
+					.values("folio_id", "line_total", "tax_amount")
+					.first()
+				)
+			super().save(*args, **kwargs)
+			if previous is not None:
+				self.taxes.all().delete()
+			FolioItemTax.objects.bulk_create(taxes)
+			subtotal, tax = self.line_total, self.tax_amount
+			if previous is not None:
+				if previous["folio_id"] == self.folio_id:
+					subtotal -= previous["line_total"]
+					tax -= previous["tax_amount"]
+				else:
+					self._post(previous["folio_id"], -previous["line_total"], -previous["tax_amount"])
+			self._post(self.folio_id, subtotal, tax)
+
+	def delete(self, *args, **kwargs):
+		with transaction.atomic():
+			self._post(self.folio_id, -self.line_total, -self.tax_amount)
+			return super().delete(*args, **kwargs)
+
+	def _post(self, folio_id: int, line_total: Decimal, tax_amount: Decimal) -> None:
+		"""Move the folio totals and append ledger entries for a change of this item."""
+		Folio.adjust_totals(folio_id, line_total, tax_amount)
+		LedgerEntry.objects.append(
+			[
+				LedgerEntry(
+					folio_id=folio_id,
+					entry_type=LedgerEntry.EntryType.CHARGE,
+					amount=line_total,
+					description=self.description,
+				),
+				LedgerEntry(
+					folio_id=folio_id,
+					entry_type=LedgerEntry.EntryType.TAX,
+					amount=tax_amount,
+					description=self.description,
+				),
+			]
+		)
 
-	@property
-	def line_total(self) -> Decimal:
-		return self.quantity * self.unit_price
 
-	@property
-	def tax_amount(self) -> Decimal:
-		if not self.tax_rule or not self.tax_rule.is_active:
-			return Decimal("0.00")
-		return (self.line_total * self.tax_rule.rate) / Decimal("100.00")
+class FolioItemTax(models.Model):
+	"""One tax rule's share of a folio item's ``tax_amount``."""
+
+	folio_item = models.ForeignKey(FolioItem, related_name="taxes", on_delete=models.CASCADE)
+	tax_rule = models.ForeignKey(
+		TaxRule, related_name="item_taxes", on_delete=models.SET_NULL, null=True, blank=True
+	)
+	taxable_amount = models.DecimalField(max_digits=12, decimal_places=2)
+	amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+	class Meta:
+		ordering = ["folio_item", "id"]
 
 
 def _invoice_number() -> str:
 	return uuid.uuid4().hex[:12].upper()
 
 
+def _invoice_totals() -> dict[str, models.Expression]:
+	"""SQL expressions for an invoice's totals from its lines, discounts and adjustments."""
+	invoice = models.OuterRef("pk")
+	lines = InvoiceLine.objects.filter(invoice=invoice)
+	subtotal = _summed(lines, models.F("net_amount"), "invoice")
+	tax_total = _summed(lines, models.F("tax_amount"), "invoice")
+	discount_total = _summed(
+		InvoiceDiscount.objects.filter(invoice=invoice), models.F("applied_amount"), "invoice"
+	)
+	adjustment_total = _summed(
+		InvoiceAdjustment.objects.filter(invoice=invoice), models.F("amount"), "invoice"
+	)
+	amount_paid = _summed(
+		Payment.objects.filter(invoice=invoice, status=Payment.PaymentStatus.POSTED),
+		models.F("amount"),
+		"invoice",
+	)
+	total = _cents(subtotal + tax_total - discount_total + adjustment_total)
+	return {
+		"subtotal": subtotal,
+		"tax_total": tax_total,
+		"discount_total": discount_total,
+		"total": total,
+		"amount_paid": amount_paid,
+		"balance_due": _cents(total - amount_paid),
+	}
+
+
+class InvoiceQuerySet(models.QuerySet):
+	def recalculate_totals(self) -> int:
+		"""Recompute the stored totals of every invoice in the queryset with one UPDATE."""
+		return self.update(**_invoice_totals(), updated_at=timezone.now())
+
+	def with_computed_totals(self) -> "InvoiceQuerySet":
+		"""Annotate ``computed_<field>`` for every stored total, recomputed in SQL."""
+		return self.annotate(
+			**{f"computed_{name}": expression for name, expression in _invoice_totals().items()}
+		)
+
+	def drifted(self) -> "InvoiceQuerySet":
+		"""Invoices whose stored totals differ from their lines, discounts and adjustments."""
+		mismatch = models.Q()
+		for name in _invoice_totals():
+			mismatch |= ~models.Q(**{name: models.F(f"computed_{name}")})
+		return self.with_computed_totals().filter(mismatch)
+
+
 class Invoice(TimeStampedModel):
 	class InvoiceStatus(models.TextChoices):
 		DRAFT = "draft", "Draft"
@@ -252,6 +593,15 @@ class Invoice(TimeStampedModel):
 		PAID = "paid", "Paid"
 		VOID = "void", "Void"
 
+	TOTAL_FIELDS = (
+		"subtotal",
+		"tax_total",
+		"discount_total",
+		"total",
+		"amount_paid",
+		"balance_due",
+	)
+
 	folio = models.ForeignKey(Folio, related_name="invoices", on_delete=models.CASCADE)
 	invoice_number = models.CharField(max_length=25, unique=True, default=_invoice_number)
 	status = models.CharField(
@@ -264,10 +614,16 @@ class Invoice(TimeStampedModel):
 	discount_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
 	tax_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
 	total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+	balance_due = models.DecimalField(
+		max_digits=12, decimal_places=2, default=Decimal("0.00"), db_index=True
+	)
 	notes = models.TextField(blank=True)
 
 	discounts = models.ManyToManyField(Discount, through="InvoiceDiscount", blank=True)
 
+	objects = InvoiceQuerySet.as_manager()
+
 	class Meta:
 		ordering = ["-issued_at", "invoice_number"]
 
@@ -275,32 +631,35 @@ class Invoice(TimeStampedModel):
 		return f"Invoice {self.invoice_number}"
 
 	def recalculate_totals(self) -> None:
-		line_totals = self.lines.aggregate(
-			subtotal=models.Sum("net_amount"), tax=models.Sum("tax_amount")
-		)
-		subtotal = line_totals.get("subtotal") or Decimal("0.00")
-		tax_total = line_totals.get("tax") or Decimal("0.00")
-		discount_total = (
-			self.invoice_discounts.aggregate(total=models.Sum("applied_amount"))["total"]
-			or Decimal("0.00")
-		)
-		adjustment_total = (
-			self.adjustments.aggregate(total=models.Sum("amount"))["total"]
-			or Decimal("0.00")
-		)
-		self.subtotal = subtotal
-		self.tax_total = tax_total
-		self.discount_total = discount_total
-		self.total = subtotal + tax_total - discount_total + adjustment_total
-		self.save(update_fields=["subtotal", "tax_total", "discount_total", "total", "updated_at"])
-
-	@property
-	def balance_due(self) -> Decimal:
-		payments = self.payments.filter(status=Payment.PaymentStatus.POSTED).aggregate(
-			total=models.Sum("amount")
-		)
-		paid = payments.get("total") or Decimal("0.00")
-		return self.total - paid
+		Invoice.objects.filter(pk=self.pk).recalculate_totals()
+		self.refresh_from_db(fields=[*self.TOTAL_FIELDS, "updated_at"])
+
+	def save(self, *args, **kwargs):
+		if self._state.adding:
+			self.balance_due = self.total - self.amount_paid
+		super().save(*args, **kwargs)
+
+	def delete(self, *args, **kwargs):
+		# The ledger outlives the invoice: take back what its payments, discounts and
+		# adjustments posted, since deleting the invoice deletes them without their own delete().
+		with transaction.atomic():
+			posted = (
+				self.ledger_entries.order_by()
+				.values("folio_id")
+				.annotate(amount=models.Sum("amount"))
+			)
+			LedgerEntry.objects.append(
+				[
+					LedgerEntry(
+						folio_id=row["folio_id"],
+						entry_type=LedgerEntry.EntryType.ADJUSTMENT,
+						amount=-row["amount"],
+						description=f"Deletion of invoice {self.invoice_number}",
+					)
+					for row in posted
+				]
+			)
+			return super().delete(*args, **kwargs)
 
 
 class InvoiceLine(TimeStampedModel):
@@ -315,14 +674,62 @@ class InvoiceLine(TimeStampedModel):
 	tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
 
 
+class InvoiceLineTax(models.Model):
+	"""One tax rule's share of an invoice line, copied from the item when the invoice was issued.
+
+	Tax reports read these rather than :class:`FolioItemTax`, so a later edit
+	or deletion of the item, or a renamed rule, leaves issued periods alone.
+	"""
+
+	invoice_line = models.ForeignKey(InvoiceLine, related_name="taxes", on_delete=models.CASCADE)
+	tax_rule = models.ForeignKey(
+		TaxRule, related_name="invoice_line_taxes", on_delete=models.SET_NULL, null=True, blank=True
+	)
+	tax_rule_name = models.CharField(max_length=120)
+	taxable_amount = models.DecimalField(max_digits=12, decimal_places=2)
+	amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+	class Meta:
+		ordering = ["invoice_line", "id"]
+
+
 class InvoiceDiscount(TimeStampedModel):
 	invoice = models.ForeignKey(Invoice, related_name="invoice_discounts", on_delete=models.CASCADE)
-	discount = models.ForeignKey(Discount, related_name="invoice_discounts", on_delete=models.CASCADE)
+	# Null for the folio's corporate account rate, which is not a Discount row.
+	discount = models.ForeignKey(
+		Discount, related_name="invoice_discounts", on_delete=models.CASCADE, null=True, blank=True
+	)
+	description = models.CharField(max_length=160, blank=True)
 	applied_amount = models.DecimalField(max_digits=12, decimal_places=2)
 
 	class Meta:
 		unique_together = ("invoice", "discount")
 
+	def ledger_entry(self, folio_id: int, reverse: bool = False) -> "LedgerEntry":
+		return LedgerEntry(
+			folio_id=folio_id,
+			invoice_id=self.invoice_id,
+			entry_type=LedgerEntry.EntryType.DISCOUNT,
+			amount=self.applied_amount if reverse else -self.applied_amount,
+			description=self.description or f"Discount {self.discount_id}",
+		)
+
+	def save(self, *args, **kwargs):
+		adding = self._state.adding
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			if adding:
+				LedgerEntry.objects.append([self.ledger_entry(self.invoice.folio_id)])
+
+	def delete(self, *args, **kwargs):
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		with transaction.atomic():
+			LedgerEntry.objects.append([self.ledger_entry(self.invoice.folio_id, reverse=True)])
+			result = super().delete(*args, **kwargs)
+			mark_invoice_dirty(self.invoice_id)
+		return result
+
 
 class InvoiceAdjustment(TimeStampedModel):
 	class AdjustmentType(models.TextChoices):
@@ -334,6 +741,31 @@ class InvoiceAdjustment(TimeStampedModel):
 	amount = models.DecimalField(max_digits=12, decimal_places=2)
 	reason = models.CharField(max_length=255, blank=True)
 
+	def ledger_entry(self, folio_id: int, reverse: bool = False) -> "LedgerEntry":
+		return LedgerEntry(
+			folio_id=folio_id,
+			invoice_id=self.invoice_id,
+			entry_type=LedgerEntry.EntryType.ADJUSTMENT,
+			amount=-self.amount if reverse else self.amount,
+			description=self.reason,
+		)
+
+	def save(self, *args, **kwargs):
+		adding = self._state.adding
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			if adding:
+				LedgerEntry.objects.append([self.ledger_entry(self.invoice.folio_id)])
+
+	def delete(self, *args, **kwargs):
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		with transaction.atomic():
+			LedgerEntry.objects.append([self.ledger_entry(self.invoice.folio_id, reverse=True)])
+			result = super().delete(*args, **kwargs)
+			mark_invoice_dirty(self.invoice_id)
+		return result
+
 
 class Payment(TimeStampedModel):
 	class PaymentStatus(models.TextChoices):
@@ -364,6 +796,54 @@ class Payment(TimeStampedModel):
 	)
 	notes = models.TextField(blank=True)
 
+	def ledger_entry(self, folio_id: int, reverse: bool = False) -> "LedgerEntry":
+		return LedgerEntry(
+			folio_id=folio_id,
+			invoice_id=self.invoice_id,
+			entry_type=LedgerEntry.EntryType.PAYMENT,
+			amount=self.amount if reverse else -self.amount,
+			description=f"Void of payment {self.reference}" if reverse else self.reference,
+		)
+
+	def save(self, *args, **kwargs):
+		# A posted payment credits the ledger; voiding it later reverses that entry.
+		# Refunds are recorded by PaymentRefund, so REFUNDED adds nothing here.
+		# The invoice's amount_paid counts posted payments, so any change to either moves it.
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		with transaction.atomic():
+			previous_status = previous_amount = None
+			if not self._state.adding:
+				previous_status, previous_amount = Payment.objects.filter(pk=self.pk).values_list(
+					"status", "amount"
+				).first() or (None, None)
+			adding = self._state.adding
+			super().save(*args, **kwargs)
+			entry = None
+			if adding and self.status == self.PaymentStatus.POSTED:
+				entry = self.ledger_entry(self.invoice.folio_id)
+			elif previous_status == self.PaymentStatus.POSTED and self.status == self.PaymentStatus.VOID:
+				entry = self.ledger_entry(self.invoice.folio_id, reverse=True)
+			if entry is not None:
+				LedgerEntry.objects.append([entry])
+			if adding or previous_status != self.status or previous_amount != self.amount:
+				mark_invoice_dirty(self.invoice_id)
+
+	def delete(self, *args, **kwargs):
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		with transaction.atomic():
+			# Take back what the payment, unless already voided, and its refunds posted.
+			folio_id = self.invoice.folio_id
+			status = Payment.objects.filter(pk=self.pk).values_list("status", flat=True).first()
+			entries = [refund.ledger_entry(folio_id, reverse=True) for refund in self.refunds.all()]
+			if status != self.PaymentStatus.VOID:
+				entries.append(self.ledger_entry(folio_id, reverse=True))
+			LedgerEntry.objects.append(entries)
+			result = super().delete(*args, **kwargs)
+			mark_invoice_dirty(self.invoice_id)
+		return result
+
 
 class PaymentRefund(TimeStampedModel):
 	payment = models.ForeignKey(Payment, related_name="refunds", on_delete=models.CASCADE)
@@ -377,6 +857,57 @@ class PaymentRefund(TimeStampedModel):
 		blank=True,
 	)
 
+	def ledger_entry(self, folio_id: int, reverse: bool = False) -> "LedgerEntry":
+		return LedgerEntry(
+			folio_id=folio_id,
+			invoice_id=self.payment.invoice_id,
+			entry_type=LedgerEntry.EntryType.REFUND,
+			amount=-self.amount if reverse else self.amount,
+			description=self.reason,
+		)
+
+	def save(self, *args, **kwargs):
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		adding = self._state.adding
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			if adding:
+				LedgerEntry.objects.append([self.ledger_entry(self.payment.invoice.folio_id)])
+			mark_invoice_dirty(self.payment.invoice_id)
+
+	def delete(self, *args, **kwargs):
+		from .unit_of_work import mark_invoice_dirty  # unit_of_work.py imports this module
+
+		with transaction.atomic():
+			LedgerEntry.objects.append(
+				[self.ledger_entry(self.payment.invoice.folio_id, reverse=True)]
+			)
+			result = super().delete(*args, **kwargs)
+			mark_invoice_dirty(self.payment.invoice_id)
+		return result
+
+
+# Payload field holding the provider's event id, per webhook source.
+WEBHOOK_EVENT_ID_FIELDS = {"payment_gateway": "id"}
+
+
+def webhook_dedup_key(source: str, payload, event_id: str = "") -> str:
+	"""Deduplication key for a delivery: the provider's event id when there is one, else a payload hash.
+
+	``event_id`` (from a header) takes precedence over the id in the payload.
+	The 0013 migration backfills stored events with a frozen copy of this
+	function; change both together if stored keys must keep matching.
+	"""
+	if not event_id and isinstance(payload, dict):
+		event_id = str(payload.get(WEBHOOK_EVENT_ID_FIELDS.get(source, "event_id")) or "")
+	if event_id and len(event_id) <= 150:
+		return f"id:{event_id}"
+	if event_id:
+		return f"id-sha256:{hashlib.sha256(event_id.encode()).hexdigest()}"
+	content = json.dumps(payload, sort_keys=True, separators=(",", ":"), cls=DjangoJSONEncoder)
+	return f"sha256:{hashlib.sha256(content.encode()).hexdigest()}"
+
 
 class WebhookEvent(TimeStampedModel):
 	class WebhookSource(models.TextChoices):
@@ -384,12 +915,198 @@ class WebhookEvent(TimeStampedModel):
 		POS = "pos", "Point of Sale"
 		PAYMENT_GATEWAY = "payment_gateway", "Payment Gateway"
 
+	class EventStatus(models.TextChoices):
+		RECEIVED = "received", "Received"
+		PROCESSING = "processing", "Processing"
+		PROCESSED = "processed", "Processed"
+		FAILED = "failed", "Failed"  # retried at next_attempt_at
+		DEAD = "dead", "Dead letter"
+
 	source = models.CharField(max_length=32, choices=WebhookSource.choices)
 	event_type = models.CharField(max_length=120, blank=True)
 	payload = models.JSONField()
-	status = models.CharField(max_length=40, default="received")
+	status = models.CharField(max_length=40, choices=EventStatus.choices, default=EventStatus.RECEIVED)
 	processed_at = models.DateTimeField(null=True, blank=True)
 	notes = models.TextField(blank=True)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	next_attempt_at = models.DateTimeField(null=True, blank=True)
+	# Lease of the worker processing the event; an expired lease lets another worker take it.
+	locked_by = models.CharField(max_length=64, blank=True)
+	locked_until = models.DateTimeField(null=True, blank=True)
+	# Identity of the delivery: the provider's event id, or a hash of the payload.
+	dedup_key = models.CharField(max_length=160, blank=True)
 
 	class Meta:
 		ordering = ["-created_at"]
+		indexes = [
+			models.Index(fields=["source", "status"]),
+			models.Index(fields=["status", "next_attempt_at"]),
+		]
+		constraints = [
+			models.UniqueConstraint(
+				fields=["source", "dedup_key"],
+				condition=~models.Q(dedup_key=""),
+				name="unique_webhook_event_dedup_key",
+			)
+		]
+
+
+class LedgerEntryQuerySet(models.QuerySet):
+	def append(self, entries: list["LedgerEntry"]) -> list["LedgerEntry"]:
+		"""Insert ``entries`` (skipping zero amounts) and snapshot folios that are due.
+
+		A snapshot covers every entry of its folio up to an id, so entries of one
+		folio must commit in id order: the folio rows stay locked from before the
+		insert until the surrounding transaction commits.
+		"""
+		entries = [entry for entry in entries if entry.amount]
+		if not entries:
+			return []
+		with transaction.atomic():
+			folio_ids = sorted({entry.folio_id for entry in entries})
+			locked = Folio.objects.select_for_update().filter(pk__in=folio_ids).order_by("pk")
+			list(locked.values_list("pk", flat=True))
+			created = self.bulk_create(entries)
+			self._move_exposure(created)
+			self._snapshot(set(folio_ids))
+		return created
+
+	def _move_exposure(self, entries: list["LedgerEntry"]) -> None:
+		by_folio = defaultdict(Decimal)
+		for entry in entries:
+			by_folio[entry.folio_id] += entry.amount
+		by_account = defaultdict(Decimal)
+		accounts = Folio.objects.filter(pk__in=by_folio, corporate_account__isnull=False)
+		for folio_id, account_id in accounts.values_list("pk", "corporate_account_id"):
+			by_account[account_id] += by_folio[folio_id]
+		CorporateAccount.adjust_exposure(by_account)
+
+	def _snapshot(self, folio_ids: set[int]) -> None:
+		interval = getattr(settings, "LEDGER_SNAPSHOT_INTERVAL", 100)
+		last_snapshot = (
+			LedgerSnapshot.objects.filter(folio=models.OuterRef("folio"))
+			.order_by("-last_entry_id")
+			.values("last_entry_id")[:1]
+		)
+		tails = (
+			LedgerEntry.objects.filter(folio_id__in=folio_ids)
+			.alias(since=Coalesce(models.Subquery(last_snapshot), models.Value(0)))
+			.filter(pk__gt=models.F("since"))
+			.order_by()
+			.values("folio_id")
+			.annotate(
+				count=models.Count("pk"),
+				amount=models.Sum("amount"),
+				last_entry_id=models.Max("pk"),
+				recorded_at=models.Max("recorded_at"),
+			)
+			.filter(count__gte=interval)
+		)
+		due = {tail["folio_id"]: tail for tail in tails}
+		if not due:
+			return
+
+		bases = {
+			folio_id: balance
+			for folio_id, balance in LedgerSnapshot.objects.filter(
+				pk__in=models.Subquery(
+					LedgerSnapshot.objects.filter(folio=models.OuterRef("folio"))
+					.order_by("-last_entry_id")
+					.values("pk")[:1]
+				),
+				folio_id__in=due,
+			).values_list("folio_id", "balance")
+		}
+		LedgerSnapshot.objects.bulk_create(
+			[
+				LedgerSnapshot(
+					folio_id=folio_id,
+					last_entry_id=tail["last_entry_id"],
+					balance=bases.get(folio_id, Decimal("0.00")) + tail["amount"],
+					recorded_at=tail["recorded_at"],
+				)
+				for folio_id, tail in due.items()
+			]
+		)
+
+
+class LedgerEntry(models.Model):
+	"""One append-only movement of what a folio's guest owes.
+
+	Positive amounts increase the balance (charges, tax, refunds, debit notes),
+	negative amounts reduce it (payments, discounts, credit notes). Entries are
+	never updated; corrections are new entries.
+	"""
+
+	class EntryType(models.TextChoices):
+		CHARGE = "charge", "Charge"
+		TAX = "tax", "Tax"
+		DISCOUNT = "discount", "Discount"
+		PAYMENT = "payment", "Payment"
+		REFUND = "refund", "Refund"
+		ADJUSTMENT = "adjustment", "Adjustment"
+
+	folio = models.ForeignKey(Folio, related_name="ledger_entries", on_delete=models.CASCADE)
+	# Entries outlive the invoice they came from; Invoice.delete() appends the reversal.
+	invoice = models.ForeignKey(
+		Invoice, related_name="ledger_entries", on_delete=models.SET_NULL, null=True, blank=True
+	)
+	entry_type = models.CharField(max_length=20, choices=EntryType.choices)
+	amount = models.DecimalField(max_digits=12, decimal_places=2)
+	description = models.CharField(max_length=240, blank=True)
+	recorded_at = models.DateTimeField(default=timezone.now)
+
+	objects = LedgerEntryQuerySet.as_manager()
+
+	class Meta:
+		ordering = ["id"]
+		indexes = [models.Index(fields=["folio", "recorded_at"])]
+
+
+class LedgerSnapshot(models.Model):
+	"""Folio balance after every entry up to and including ``last_entry``."""
+
+	folio = models.ForeignKey(Folio, related_name="ledger_snapshots", on_delete=models.CASCADE)
+	# Entries are only ever deleted along with their folio, which takes its snapshots too.
+	last_entry = models.OneToOneField(LedgerEntry, related_name="snapshot", on_delete=models.CASCADE)
+	balance = models.DecimalField(max_digits=14, decimal_places=2)
+	recorded_at = models.DateTimeField()
+
+	class Meta:
+		ordering = ["-last_entry_id"]
+		indexes = [models.Index(fields=["folio", "-last_entry"])]
+
+
+class NightAuditRun(TimeStampedModel):
+	"""One night audit per business date; the row doubles as the lock for running it."""
+
+	class RunStatus(models.TextChoices):
+		RUNNING = "running", "Running"
+		COMPLETED = "completed", "Completed"
+		FAILED = "failed", "Failed"
+
+	business_date = models.DateField(unique=True)
+	status = models.CharField(max_length=12, choices=RunStatus.choices, default=RunStatus.RUNNING)
+	owner = models.CharField(max_length=64, blank=True)
+	lease_expires_at = models.DateTimeField(null=True, blank=True)
+	started_at = models.DateTimeField(default=timezone.now)
+	finished_at = models.DateTimeField(null=True, blank=True)
+	posted = models.PositiveIntegerField(default=0)
+	skipped = models.PositiveIntegerField(default=0)
+	error = models.TextField(blank=True)
+
+	class Meta:
+		ordering = ["-business_date"]
+
+	def __str__(self) -> str:  # pragma: no cover
+		return f"Night audit {self.business_date} ({self.status})"
+
+
+class CompiledCacheVersion(models.Model):
+	"""Current token of a :class:`~billing.caching.CompiledCache`, replaced whenever its source changes."""
+
+	key = models.CharField(max_length=100, unique=True)
+	token = models.CharField(max_length=32)
+
+	def __str__(self) -> str:  # pragma: no cover
+		return self.key
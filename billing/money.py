@@ -0,0 +1,86 @@
+"""
+Integer minor-unit money arithmetic for the billing hot paths.
+
+Amounts are carried as ``int`` counts of the currency's minor unit (cents
+for USD) while they are being multiplied, taxed, discounted and summed, and
+are converted to ``Decimal`` only when they are written to a model field or
+handed to a serializer. Every operation that can produce a fraction of a
+minor unit rounds half away from zero, once, at the point stated in its
+docstring, so the same inputs always give the same totals.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+
+# ISO 4217 minor-unit exponents for currencies that do not use two decimals.
+ISO_EXPONENTS = {
+	"BHD": 3,
+	"BIF": 0,
+	"CLP": 0,
+	"DJF": 0,
+	"GNF": 0,
+	"IQD": 3,
+	"ISK": 0,
+	"JOD": 3,
+	"JPY": 0,
+	"KMF": 0,
+	"KRW": 0,
+	"KWD": 3,
+	"LYD": 3,
+	"OMR": 3,
+	"PYG": 0,
+	"RWF": 0,
+	"TND": 3,
+	"UGX": 0,
+	"UYI": 0,
+	"VND": 0,
+	"VUV": 0,
+	"XAF": 0,
+	"XOF": 0,
+	"XPF": 0,
+}
+DEFAULT_EXPONENT = 2
+# Amount columns are DecimalField(decimal_places=2), so no currency is stored
+# with more precision than that.
+STORAGE_EXPONENT = 2
+
+# Quantities and percentage rates are stored with two decimal places too.
+_FACTOR_PLACES = 2
+_FACTOR_SCALE = 10**_FACTOR_PLACES
+
+
+def exponent(currency: str) -> int:
+	"""Number of minor-unit decimal places used for ``currency``."""
+	return min(ISO_EXPONENTS.get(currency.upper(), DEFAULT_EXPONENT), STORAGE_EXPONENT)
+
+
+def _divide(numerator: int, denominator: int) -> int:
+	"""Integer division rounding half away from zero."""
+	quotient, remainder = divmod(abs(numerator), denominator)
+	if remainder * 2 >= denominator:
+		quotient += 1
+	return quotient if numerator >= 0 else -quotient
+
+
+def _scaled(value, places: int) -> int:
+	"""``value`` as an integer count of ``10 ** -places`` units, rounded half-up."""
+	return int((Decimal(value).scaleb(places)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def to_minor(amount, currency: str) -> int:
+	"""Convert a Decimal (or str/int) amount to minor units, rounding half-up."""
+	return _scaled(amount, exponent(currency))
+
+
+def from_minor(minor: int, currency: str) -> Decimal:
+	"""Convert minor units back to a Decimal with two decimal places."""
+	return Decimal(minor).scaleb(-exponent(currency)).quantize(Decimal("0.01"))
+
+
+def multiply(minor: int, quantity) -> int:
+	"""``minor`` times a quantity with up to two decimals, rounded to a minor unit."""
+	return _divide(minor * _scaled(quantity, _FACTOR_PLACES), _FACTOR_SCALE)
+
+
+def percentage(minor: int, rate) -> int:
+	"""``rate`` percent of ``minor`` (rate has up to two decimals), rounded to a minor unit."""
+	return _divide(minor * _scaled(rate, _FACTOR_PLACES), 100 * _FACTOR_SCALE)
@@ -0,0 +1,182 @@
+"""
+Night audit: post the night's room charge to every in-house reservation.
+
+A run is keyed by business date. Its :class:`NightAuditRun` row is also the
+lock: a node takes it with a conditional UPDATE and keeps it by renewing a
+short lease after every chunk, so a crashed run can be taken over once the
+lease lapses. Every charge carries a ``source_reference`` derived from the
+date and reservation, so a rerun only posts what is still missing.
+"""
+import os
+import socket
+import uuid
+from datetime import date, datetime, time, timedelta
+
+from django.db import models
+from django.utils import timezone
+
+from .models import Folio, FolioItem, NightAuditRun, RatePlan, Reservation
+from .posting import post_items
+
+DEFAULT_CHUNK_SIZE = 500
+LEASE = timedelta(minutes=5)
+
+RunStatus = NightAuditRun.RunStatus
+
+
+class NightAuditLocked(Exception):
+	"""Another node is running the night audit for this business date."""
+
+
+def source_reference(business_date: date, reservation_id: int) -> str:
+	return f"night-audit:{business_date.isoformat()}:{reservation_id}"
+
+
+def in_house_reservations(business_date: date) -> models.QuerySet:
+	"""Checked-in reservations staying the night of ``business_date``."""
+	return Reservation.objects.filter(
+		status=Reservation.ReservationStatus.CHECKED_IN,
+		check_in__lte=business_date,
+		check_out__gt=business_date,
+	).select_related("guest").order_by("pk")
+
+
+def _default_owner() -> str:
+	return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+
+
+def _acquire(business_date: date, owner: str) -> NightAuditRun:
+	now = timezone.now()
+	run, created = NightAuditRun.objects.get_or_create(
+		business_date=business_date,
+		defaults={"owner": owner, "lease_expires_at": now + LEASE, "started_at": now},
+	)
+	if created or run.status == RunStatus.COMPLETED:
+		return run
+	# Compare-and-swap: only a failed run or one whose lease lapsed can be taken over.
+	taken = (
+		NightAuditRun.objects.filter(pk=run.pk)
+		.exclude(status=RunStatus.COMPLETED)
+		.filter(models.Q(status=RunStatus.FAILED) | models.Q(lease_expires_at__lt=now))
+		.update(
+			status=RunStatus.RUNNING,
+			owner=owner,
+			lease_expires_at=now + LEASE,
+			started_at=now,
+			finished_at=None,
+			error="",
+			updated_at=now,
+		)
+	)
+	if not taken:
+		raise NightAuditLocked(f"Night audit for {business_date} is already running.")
+	run.refresh_from_db()
+	return run
+
+
+def _renew(run: NightAuditRun, **fields) -> None:
+	now = timezone.now()
+	renewed = NightAuditRun.objects.filter(
+		pk=run.pk, owner=run.owner, status=RunStatus.RUNNING
+	).update(lease_expires_at=now + LEASE, updated_at=now, **fields)
+	if not renewed:
+		raise NightAuditLocked(f"Lost the night audit lease for {run.business_date}.")
+
+
+def _open_folios(reservations: list[Reservation]) -> dict[int, Folio]:
+	"""Latest open folio per reservation, opening one where a reservation has none."""
+	folios: dict[int, Folio] = {}
+	existing = Folio.objects.filter(
+		reservation__in=reservations, status=Folio.FolioStatus.OPEN
+	).order_by("reservation_id", "pk")
+	for folio in existing:
+		folios[folio.reservation_id] = folio
+	missing = [
+		Folio(
+			reservation=reservation,
+			guest_name=str(reservation.guest),
+			corporate_account_id=reservation.corporate_account_id,
+		)
+		for reservation in reservations
+		if reservation.pk not in folios
+	]
+	for folio in Folio.objects.bulk_create(missing):
+		folios[folio.reservation_id] = folio
+	return folios
+
+
+def run_night_audit(
+	business_date: date, *, chunk_size: int = DEFAULT_CHUNK_SIZE, owner: str | None = None
+) -> NightAuditRun:
+	"""Post ``business_date``'s room charges and return the run.
+
+	Reservations without an active rate plan, and those already charged for
+	the night, are counted as skipped. A completed run is returned unchanged.
+	"""
+	run = _acquire(business_date, owner or _default_owner())
+	if run.status == RunStatus.COMPLETED:
+		return run
+
+	try:
+		reservations = list(in_house_reservations(business_date))
+		plans = RatePlan.objects.filter(is_active=True).in_bulk(
+			{reservation.rate_plan for reservation in reservations}, field_name="code"
+		)
+		already_posted = set(
+			FolioItem.objects.filter(
+				source_reference__startswith=f"night-audit:{business_date.isoformat()}:"
+			).values_list("source_reference", flat=True)
+		)
+		pending = [
+			reservation
+			for reservation in reservations
+			if reservation.rate_plan in plans
+			and source_reference(business_date, reservation.pk) not in already_posted
+		]
+		skipped = len(reservations) - len(pending)
+		posted_at = timezone.make_aware(datetime.combine(business_date, time(23, 59, 59)))
+
+		posted = 0
+		for start in range(0, len(pending), chunk_size):
+			chunk = pending[start : start + chunk_size]
+			folios = _open_folios(chunk)
+			items = []
+			for reservation in chunk:
+				plan = plans[reservation.rate_plan]
+				items.append(
+					FolioItem(
+						folio=folios[reservation.pk],
+						description=f"Room {reservation.room_number} - {plan.name}",
+						item_type=FolioItem.ItemType.ROOM,
+						quantity=1,
+						unit_price=plan.nightly_rate,
+						tax_rule_id=plan.tax_rule_id,
+						posted_at=posted_at,
+						source_reference=source_reference(business_date, reservation.pk),
+					)
+				)
+			post_items(items)
+			posted += len(items)
+			_renew(run, posted=posted, skipped=skipped)
+	except NightAuditLocked:
+		raise
+	except Exception as exc:
+		NightAuditRun.objects.filter(pk=run.pk, owner=run.owner).update(
+			status=RunStatus.FAILED,
+			error=str(exc),
+			lease_expires_at=None,
+			finished_at=timezone.now(),
+			updated_at=timezone.now(),
+		)
+		raise
+
+	NightAuditRun.objects.filter(pk=run.pk, owner=run.owner).update(
+		status=RunStatus.COMPLETED,
+		posted=posted,
+		skipped=skipped,
+		lease_expires_at=None,
+		finished_at=timezone.now(),
+		updated_at=timezone.now(),
+	)
+	run.refresh_from_db()
+	return run
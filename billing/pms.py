@@ -0,0 +1,145 @@
+"""
+PMS ingestion: reservation events upserted in bulk.
+
+The events of a batch are folded per ``reservation_number`` in arrival
+order, so the last write for each reservation wins and fields an event
+leaves out keep their stored value. Guests and corporate accounts are
+resolved with one lookup per batch, and the reservations are written with a
+single insert-or-update keyed by ``reservation_number``.
+"""
+import json
+from collections import defaultdict
+
+from .models import CorporateAccount, Guest, Reservation, WebhookEvent
+from .serializers import PMSReservationSerializer
+
+RESERVATION_FIELDS = [
+	"status",
+	"check_in",
+	"check_out",
+	"room_number",
+	"rate_plan",
+	"number_of_guests",
+	"notes",
+]
+UPSERT_FIELDS = [*RESERVATION_FIELDS, "guest", "corporate_account", "updated_at"]
+CANCELLED_EVENTS = {"reservation.cancelled", "reservation.canceled"}
+
+
+def _fold(changes: list[tuple[WebhookEvent, dict]], errors: dict[int, str]) -> tuple[dict, dict]:
+	"""Merge the changes of each reservation in order; returns the merged state and its events."""
+	accounts = CorporateAccount.objects.in_bulk(
+		{change["corporate_account_code"] for _, change in changes if change.get("corporate_account_code")},
+		field_name="code",
+	)
+	guest_ids = set(
+		Guest.objects.filter(
+			pk__in={change["guest_id"] for _, change in changes if "guest_id" in change}
+		).values_list("pk", flat=True)
+	)
+
+	folded: dict[str, dict] = {}
+	sources: dict[str, list[int]] = defaultdict(list)
+	for event, change in changes:
+		code = change.get("corporate_account_code")
+		if code and code not in accounts:
+			errors[event.pk] = f"Unknown corporate account {code}."
+			continue
+		if "guest_id" in change and change["guest_id"] not in guest_ids:
+			errors[event.pk] = f"Unknown guest {change['guest_id']}."
+			continue
+		number = change["reservation_number"]
+		state = folded.setdefault(number, {})
+		state.update({field: change[field] for field in RESERVATION_FIELDS if field in change})
+		if change.get("event_type") in CANCELLED_EVENTS:
+			state["status"] = Reservation.ReservationStatus.CANCELLED
+		if "corporate_account_code" in change:
+			state["corporate_account"] = accounts[code] if code else None
+		if "guest_id" in change:
+			state["guest"] = change["guest_id"]
+		elif "guest" in change:
+			state["guest"] = change["guest"]
+		sources[number].append(event.pk)
+	return folded, sources
+
+
+def _missing(reservation: Reservation, state: dict) -> str | None:
+	required = ["check_in", "check_out", "room_number"]
+	absent = [field for field in required if getattr(reservation, field) in (None, "")]
+	if reservation.guest_id is None and "guest" not in state:
+		absent.append("guest")
+	if absent:
+		return f"Reservation {reservation.reservation_number} is missing {', '.join(absent)}."
+	if reservation.check_in >= reservation.check_out:
+		return f"Reservation {reservation.reservation_number} must check out after it checks in."
+	return None
+
+
+def _resolve_guests(pending: list[tuple[Reservation, dict]]) -> None:
+	"""Point each reservation at the guest with its email, creating the guests that are missing."""
+	emails = {guest["email"].lower() for _, guest in pending if guest.get("email")}
+	by_email = {}
+	for guest in Guest.objects.filter(email__in=emails).order_by("pk"):
+		by_email[guest.email.lower()] = guest  # the latest guest wins
+
+	created = []
+	for reservation, data in pending:
+		email = data.get("email", "").lower()
+		guest = by_email.get(email) if email else None
+		if guest is None:
+			guest = Guest(**{**data, "email": email})
+			created.append(guest)
+			if email:
+				by_email[email] = guest
+		reservation.guest = guest
+	Guest.objects.bulk_create(created)
+
+
+def process_pms_events(events: list[WebhookEvent]) -> dict[int, str]:
+	"""Upsert the reservations in ``events`` and return the error of each event not applied."""
+	errors: dict[int, str] = {}
+	changes = []
+	for event in events:
+		serializer = PMSReservationSerializer(data=event.payload)
+		if serializer.is_valid():
+			changes.append((event, serializer.validated_data))
+		else:
+			errors[event.pk] = json.dumps(serializer.errors)
+
+	folded, sources = _fold(changes, errors)
+	existing = Reservation.objects.select_related("guest").in_bulk(folded, field_name="reservation_number")
+
+	rows, pending_guests = [], []
+	for number, state in folded.items():
+		reservation = existing.get(number) or Reservation(reservation_number=number)
+		for field in RESERVATION_FIELDS:
+			if field in state:
+				setattr(reservation, field, state[field])
+		if "corporate_account" in state:
+			reservation.corporate_account = state["corporate_account"]
+		error = _missing(reservation, state)
+		if error:
+			errors.update({event_id: error for event_id in sources[number]})
+			continue
+
+		guest = state.get("guest")
+		if isinstance(guest, int):
+			reservation.guest_id = guest
+		elif guest is not None:
+			current = reservation.guest if reservation.guest_id else None
+			# A guest without an email, or with the current one, is the guest already booked.
+			if current is None or guest.get("email", "").lower() not in ("", current.email.lower()):
+				pending_guests.append((reservation, guest))
+		# Insert-or-update matches on reservation_number; a stored primary key would conflict first.
+		reservation.pk = None
+		rows.append(reservation)
+
+	_resolve_guests(pending_guests)
+	Reservation.objects.bulk_create(
+		rows,
+		batch_size=1000,
+		update_conflicts=True,
+		unique_fields=["reservation_number"],
+		update_fields=UPSERT_FIELDS,
+	)
+	return errors
@@ -0,0 +1,142 @@
+"""
+POS ingestion: checks sent by the point of sale become folio items.
+
+A batch of events is validated, its folios are resolved with one query per
+kind of reference, and the lines of every check are posted together through
+:func:`billing.posting.post_items`, which moves each folio's totals once.
+Lines carry a ``source_reference`` built from the outlet and check, so a
+redelivered check is not charged twice.
+"""
+import json
+
+from django.db import transaction
+
+from .models import Folio, FolioItem, Reservation, TaxRule, WebhookEvent
+from .posting import exposure_by_account, lock_accounts, over_credit_limit, post_items
+from .serializers import POSEventSerializer
+from .taxes import apply_taxes
+
+
+def _source_reference(event: WebhookEvent, check: dict, index: int) -> str:
+	if check.get("check_id"):
+		return f"pos:{check['outlet']}:{check['check_id']}:{index}"
+	return f"pos-event:{event.pk}:{index}"
+
+
+def _resolve_folios(checks: list[dict]) -> tuple[dict[str, Folio], dict[str, Folio]]:
+	"""Folios by folio number and, for checks without one, the open folio of each in-house room."""
+	numbers = {check["folio_number"] for check in checks if check.get("folio_number")}
+	rooms = {check["room_number"] for check in checks if not check.get("folio_number")}
+	folios = Folio.objects.select_related("corporate_account")
+	by_number = folios.in_bulk(numbers, field_name="folio_number") if numbers else {}
+	by_room = {}
+	if rooms:
+		in_house = folios.filter(
+			status=Folio.FolioStatus.OPEN,
+			reservation__status=Reservation.ReservationStatus.CHECKED_IN,
+			reservation__room_number__in=rooms,
+		).values_list("reservation__room_number", "pk")
+		room_folios = dict(in_house.order_by("pk"))  # the latest folio wins
+		opened = folios.in_bulk(room_folios.values())
+		by_room = {room: opened[pk] for room, pk in room_folios.items()}
+	return by_number, by_room
+
+
+def _folio_error(check: dict, folio: Folio | None) -> str | None:
+	if check.get("folio_number"):
+		if folio is None:
+			return f"Unknown folio {check['folio_number']}."
+		if folio.status != Folio.FolioStatus.OPEN:
+			return f"Folio {folio.folio_number} is {folio.status}."
+	elif folio is None:
+		return f"No open folio for room {check['room_number']}."
+	return None
+
+
+def process_pos_events(events: list[WebhookEvent]) -> dict[int, str]:
+	"""Post the checks in ``events`` and return the error of each event that was not posted.
+
+	Charges that would take an account enforcing its credit limit past it
+	fail every check of the batch billed to that account, as in the bulk
+	posting endpoint.
+	"""
+	errors: dict[int, str] = {}
+	checks: list[tuple[WebhookEvent, dict]] = []
+	for event in events:
+		serializer = POSEventSerializer(data=event.payload)
+		if serializer.is_valid():
+			checks.append((event, serializer.validated_data))
+		else:
+			errors[event.pk] = json.dumps(serializer.errors)
+
+	by_number, by_room = _resolve_folios([check for _, check in checks])
+	tax_rules = TaxRule.objects.in_bulk(
+		{
+			line["tax_rule_id"]
+			for _, check in checks
+			for line in check["lines"]
+			if line.get("tax_rule_id") is not None
+		}
+	)
+
+	posted: list[tuple[int, FolioItem]] = []
+	for event, check in checks:
+		if check.get("folio_number"):
+			folio = by_number.get(check["folio_number"])
+		else:
+			folio = by_room.get(check["room_number"])
+		error = _folio_error(check, folio)
+		unknown = {
+			line["tax_rule_id"]
+			for line in check["lines"]
+			if line.get("tax_rule_id") is not None and line["tax_rule_id"] not in tax_rules
+		}
+		if unknown:
+			error = f"Unknown tax rule {', '.join(map(str, sorted(unknown)))}."
+		if error:
+			errors[event.pk] = error
+			continue
+		prefix = f"{check['outlet']}: " if check["outlet"] else ""
+		for index, line in enumerate(check["lines"]):
+			item = FolioItem(
+				folio=folio,
+				description=f"{prefix}{line['description']}"[:240],
+				item_type=line["item_type"],
+				quantity=line["quantity"],
+				unit_price=line["unit_price"],
+				tax_rule_id=line.get("tax_rule_id"),
+				posted_at=check.get("closed_at") or event.created_at,
+				source_reference=_source_reference(event, check, index),
+			)
+			posted.append((event.pk, item))
+
+	# Drop lines already posted by an earlier delivery, or twice within this batch.
+	seen = set(
+		FolioItem.objects.filter(
+			folio_id__in={item.folio_id for _, item in posted},
+			source_reference__in={item.source_reference for _, item in posted},
+		).values_list("folio_id", "source_reference")
+	)
+	fresh = []
+	for event_id, item in posted:
+		key = (item.folio_id, item.source_reference)
+		if key not in seen:
+			seen.add(key)
+			fresh.append((event_id, item))
+
+	items = [item for _, item in fresh]
+	apply_taxes(items)
+	with transaction.atomic():
+		accounts = lock_accounts({item.folio_id for item in items})
+		blocked = {
+			account.pk: account.code
+			for account in over_credit_limit(accounts.values(), exposure_by_account(items))
+			if account.enforce_credit_limit
+		}
+		if blocked:
+			for event_id, item in fresh:
+				account_id = item.folio.corporate_account_id
+				if account_id in blocked:
+					errors[event_id] = f"Charges exceed the credit limit of {blocked[account_id]}."
+		post_items([item for event_id, item in fresh if event_id not in errors])
+	return errors
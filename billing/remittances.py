@@ -0,0 +1,165 @@
+"""
+Remittances: one payment amount spread over many invoices.
+
+The invoices are read and locked once, the split is computed in integer
+minor units, the :class:`Payment` rows and their ledger entries are written
+with ``bulk_create`` and every touched invoice is recalculated by the unit
+of work in one UPDATE, all in a single transaction.
+"""
+from collections.abc import Iterable
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+
+from . import money
+from .models import CorporateAccount, Invoice, LedgerEntry, Payment, PaymentMethod
+from .unit_of_work import mark_invoice_dirty, unit_of_work
+
+
+class AllocationMethod(models.TextChoices):
+	OLDEST_FIRST = "oldest_first", "Oldest First"
+	EXPLICIT = "explicit", "Explicit"
+	PRO_RATA = "pro_rata", "Pro Rata"
+
+
+class AllocationError(Exception):
+	"""The remittance cannot be allocated as requested."""
+
+
+def allocate_oldest_first(amount: int, balances: list[tuple[int, int]]) -> dict[int, int]:
+	"""Pay ``(invoice_id, balance)`` pairs in order until ``amount`` runs out."""
+	allocation = {}
+	for invoice_id, balance in balances:
+		if amount <= 0:
+			break
+		share = min(balance, amount)
+		if share <= 0:
+			continue
+		allocation[invoice_id] = share
+		amount -= share
+	return allocation
+
+
+def allocate_pro_rata(amount: int, balances: list[tuple[int, int]]) -> dict[int, int]:
+	"""Split ``amount`` in proportion to each balance, never paying more than a balance.
+
+	Shares are rounded down and the leftover minor units go to the largest
+	remainders (earliest invoice first on ties), so the shares add up to
+	``amount`` exactly.
+	"""
+	balances = [(invoice_id, balance) for invoice_id, balance in balances if balance > 0]
+	total = sum(balance for _, balance in balances)
+	if amount >= total:
+		return dict(balances)
+	shares, remainders = {}, []
+	for position, (invoice_id, balance) in enumerate(balances):
+		shares[invoice_id], remainder = divmod(amount * balance, total)
+		remainders.append((-remainder, position, invoice_id))
+	for _, _, invoice_id in sorted(remainders)[: amount - sum(shares.values())]:
+		shares[invoice_id] += 1
+	return {invoice_id: share for invoice_id, share in shares.items() if share}
+
+
+def apply_remittance(
+	*,
+	amount: Decimal,
+	method: str = AllocationMethod.OLDEST_FIRST,
+	corporate_account: CorporateAccount | None = None,
+	invoice_ids: Iterable[int] | None = None,
+	allocations: dict[int, Decimal] | None = None,
+	currency: str | None = None,
+	payment_method: PaymentMethod | None = None,
+	reference: str = "",
+	paid_at: datetime | None = None,
+	notes: str = "",
+	processed_by=None,
+) -> dict:
+	"""Allocate ``amount`` over open invoices, post the payments and report per invoice.
+
+	Oldest-first and pro-rata allocation choose among the open invoices of
+	``corporate_account`` and/or ``invoice_ids``, oldest first. Explicit
+	allocation pays exactly ``allocations`` (invoice id to amount). Raises
+	:class:`AllocationError` if explicit amounts exceed the remittance or an
+	invoice's balance, or if the invoices are in more than one currency.
+	"""
+	invoices = Invoice.objects.exclude(
+		status__in=[Invoice.InvoiceStatus.DRAFT, Invoice.InvoiceStatus.VOID]
+	)
+	if method == AllocationMethod.EXPLICIT:
+		invoices = invoices.filter(pk__in=list(allocations or {}))
+	else:
+		invoices = invoices.filter(balance_due__gt=0)
+		if corporate_account is not None:
+			invoices = invoices.filter(folio__corporate_account=corporate_account)
+		if invoice_ids is not None:
+			invoices = invoices.filter(pk__in=list(invoice_ids))
+	if currency:
+		invoices = invoices.filter(currency=currency)
+
+	with unit_of_work():
+		rows = list(
+			invoices.select_for_update(of=("self",))
+			.order_by("issued_at", "pk")
+			.values("pk", "invoice_number", "folio_id", "currency", "balance_due")
+		)
+		currencies = {row["currency"] for row in rows}
+		if len(currencies) > 1:
+			raise AllocationError("Invoices are in more than one currency; pass a currency.")
+		currency = currencies.pop() if currencies else currency or "USD"
+		balances = [(row["pk"], money.to_minor(row["balance_due"], currency)) for row in rows]
+
+		if method == AllocationMethod.EXPLICIT:
+			if sum(allocations.values()) > amount:
+				raise AllocationError("Allocations add up to more than the remittance amount.")
+			missing = set(allocations) - {row["pk"] for row in rows}
+			if missing:
+				raise AllocationError(f"Invoices not found or not payable: {sorted(missing)}.")
+			split = {pk: money.to_minor(allocations[pk], currency) for pk, _ in balances}
+			over = [pk for pk, balance in balances if split[pk] > balance]
+			if over:
+				raise AllocationError(f"Allocations exceed the balance due on invoices {over}.")
+		elif method == AllocationMethod.PRO_RATA:
+			split = allocate_pro_rata(money.to_minor(amount, currency), balances)
+		else:
+			split = allocate_oldest_first(money.to_minor(amount, currency), balances)
+
+		by_pk = {row["pk"]: row for row in rows}
+		payments = Payment.objects.bulk_create(
+			[
+				Payment(
+					invoice_id=pk,
+					amount=money.from_minor(share, currency),
+					payment_method=payment_method,
+					paid_at=paid_at or timezone.now(),
+					reference=reference,
+					notes=notes,
+					processed_by=processed_by,
+				)
+				for pk, share in split.items()
+			]
+		)
+		LedgerEntry.objects.append(
+			[payment.ledger_entry(by_pk[payment.invoice_id]["folio_id"]) for payment in payments]
+		)
+		for payment in payments:
+			mark_invoice_dirty(payment.invoice_id)
+
+	balances_due = dict(Invoice.objects.filter(pk__in=split).values_list("pk", "balance_due"))
+	allocated = money.from_minor(sum(split.values()), currency)
+	return {
+		"amount": amount,
+		"allocated": allocated,
+		"unallocated": amount - allocated,
+		"payments": [
+			{
+				"invoice_id": payment.invoice_id,
+				"invoice_number": by_pk[payment.invoice_id]["invoice_number"],
+				"payment_id": payment.pk,
+				"amount": payment.amount,
+				"balance_due": balances_due[payment.invoice_id],
+			}
+			for payment in payments
+		],
+	}
@@ -3,20 +3,27 @@ from decimal import Decimal
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
+from .adjustments import AmountRule
+from .invoicing import populate_invoice
+from .posting import MAX_BULK_ITEMS
+from .remittances import AllocationMethod
 from .models import (
     CorporateAccount,
     Discount,
     Folio,
     FolioDiscount,
     FolioItem,
+    FolioItemTax,
     Guest,
     Invoice,
     InvoiceAdjustment,
     InvoiceDiscount,
     InvoiceLine,
+    NightAuditRun,
     Payment,
     PaymentMethod,
     PaymentRefund,
+    RatePlan,
     Reservation,
     TaxRule,
     WebhookEvent,
@@ -52,11 +59,14 @@ class CorporateAccountSerializer(serializers.ModelSerializer):
             "contact_email",
             "contact_phone",
             "discount_rate",
+            "credit_limit",
+            "enforce_credit_limit",
+            "exposure",
             "notes",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "created_at", "updated_at"]
+        read_only_fields = ["id", "exposure", "created_at", "updated_at"]
 
 
 class DiscountSerializer(serializers.ModelSerializer):
@@ -71,6 +81,10 @@ class DiscountSerializer(serializers.ModelSerializer):
             "start_date",
             "end_date",
             "corporate_account",
+            "auto_apply",
+            "priority",
+            "stackable",
+            "max_amount",
             "created_at",
             "updated_at",
         ]
@@ -78,11 +92,95 @@ class DiscountSerializer(serializers.ModelSerializer):
 
 
 class TaxRuleSerializer(serializers.ModelSerializer):
+    item_type = serializers.ChoiceField(
+        choices=FolioItem.ItemType.choices, allow_blank=True, required=False
+    )
+
     class Meta:
         model = TaxRule
-        fields = ["id", "name", "rate", "is_active", "description", "created_at", "updated_at"]
+        fields = [
+            "id",
+            "name",
+            "rate",
+            "is_active",
+            "description",
+            "item_type",
+            "auto_apply",
+            "compound",
+            "inclusive",
+            "priority",
+            "valid_from",
+            "valid_to",
+            "created_at",
+            "updated_at",
+        ]
         read_only_fields = ["id", "created_at", "updated_at"]
 
+    def validate(self, attrs):
+        valid_from = attrs.get("valid_from", getattr(self.instance, "valid_from", None))
+        valid_to = attrs.get("valid_to", getattr(self.instance, "valid_to", None))
+        if valid_from and valid_to and valid_from > valid_to:
+            raise serializers.ValidationError("valid_from must be on or before valid_to.")
+        return attrs
+
+
+class FolioItemTaxSerializer(serializers.ModelSerializer):
+    tax_rule = serializers.CharField(source="tax_rule.name", read_only=True, allow_null=True)
+
+    class Meta:
+        model = FolioItemTax
+        fields = ["tax_rule_id", "tax_rule", "taxable_amount", "amount"]
+
+
+class TaxRateChangeSerializer(serializers.Serializer):
+    tax_rule_id = serializers.PrimaryKeyRelatedField(queryset=TaxRule.objects.all())
+    rate = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal("0"))
+
+
+class TaxSimulationSerializer(serializers.Serializer):
+    changes = TaxRateChangeSerializer(many=True, allow_empty=False)
+
+    def validate_changes(self, value):
+        rule_ids = [change["tax_rule_id"].pk for change in value]
+        if len(set(rule_ids)) != len(rule_ids):
+            raise serializers.ValidationError("Each tax rule may appear only once.")
+        inclusive = [change["tax_rule_id"].name for change in value if change["tax_rule_id"].inclusive]
+        if inclusive:
+            raise serializers.ValidationError(
+                f"Inclusive tax rules cannot be simulated: {', '.join(inclusive)}."
+            )
+        return value
+
+
+class TaxImpactSerializer(serializers.Serializer):
+    item_count = serializers.IntegerField()
+    taxable_amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    current_tax = serializers.DecimalField(max_digits=14, decimal_places=2)
+    proposed_tax = serializers.DecimalField(max_digits=14, decimal_places=2)
+    difference = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class TaxRuleImpactSerializer(TaxImpactSerializer):
+    tax_rule_id = serializers.IntegerField()
+    tax_rule = serializers.CharField()
+    current_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    proposed_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+
+
+class CorporateAccountImpactSerializer(TaxImpactSerializer):
+    corporate_account_id = serializers.IntegerField(allow_null=True)
+    corporate_account = serializers.CharField(allow_null=True)
+
+
+class CurrencyTaxImpactSerializer(TaxImpactSerializer):
+    currency = serializers.CharField()
+    by_tax_rule = TaxRuleImpactSerializer(many=True)
+    by_corporate_account = CorporateAccountImpactSerializer(many=True)
+
+
+class TaxSimulationReportSerializer(serializers.Serializer):
+    currencies = CurrencyTaxImpactSerializer(many=True)
+
 
 class PaymentMethodSerializer(serializers.ModelSerializer):
     class Meta:
@@ -127,6 +225,26 @@ class ReservationSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "created_at", "updated_at", "guest", "corporate_account"]
 
 
+class RatePlanSerializer(serializers.ModelSerializer):
+    tax_rule_id = serializers.PrimaryKeyRelatedField(
+        source="tax_rule", queryset=TaxRule.objects.all(), allow_null=True, required=False
+    )
+
+    class Meta:
+        model = RatePlan
+        fields = [
+            "id",
+            "code",
+            "name",
+            "nightly_rate",
+            "tax_rule_id",
+            "is_active",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = ["id", "created_at", "updated_at"]
+
+
 class FolioItemSerializer(serializers.ModelSerializer):
     tax_rule = TaxRuleSerializer(read_only=True)
     tax_rule_id = serializers.PrimaryKeyRelatedField(
@@ -136,8 +254,7 @@ class FolioItemSerializer(serializers.ModelSerializer):
         required=False,
         allow_null=True,
     )
-    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
-    tax_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    taxes = FolioItemTaxSerializer(many=True, read_only=True)
 
     class Meta:
         model = FolioItem
@@ -153,6 +270,8 @@ class FolioItemSerializer(serializers.ModelSerializer):
             "posted_by",
             "line_total",
             "tax_amount",
+            "taxes",
+            "source_reference",
             "created_at",
             "updated_at",
         ]
@@ -162,11 +281,77 @@ class FolioItemSerializer(serializers.ModelSerializer):
             "posted_by",
             "line_total",
             "tax_amount",
+            "source_reference",
             "created_at",
             "updated_at",
         ]
 
 
+class BulkFolioItemSerializer(serializers.ModelSerializer):
+    # Plain integers here; BulkPostingSerializer resolves each table with one query.
+    folio_id = serializers.IntegerField(required=False)
+    tax_rule_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = FolioItem
+        fields = [
+            "folio_id",
+            "description",
+            "item_type",
+            "quantity",
+            "unit_price",
+            "tax_rule_id",
+            "posted_at",
+        ]
+
+
+class BulkPostingSerializer(serializers.Serializer):
+    """Items for one folio (given in the context) or, without one, each with a ``folio_id``."""
+
+    items = BulkFolioItemSerializer(many=True, allow_empty=False, max_length=MAX_BULK_ITEMS)
+
+    def validate_items(self, items):
+        folio = self.context.get("folio")
+        tax_rule_ids = {item["tax_rule_id"] for item in items if item.get("tax_rule_id") is not None}
+        tax_rules = TaxRule.objects.in_bulk(tax_rule_ids)
+        folios = {}
+        if folio is None:
+            folio_ids = {item["folio_id"] for item in items if "folio_id" in item}
+            folios = Folio.objects.select_related("corporate_account").in_bulk(folio_ids)
+
+        errors, any_errors = [], False
+        for item in items:
+            item_errors = {}
+            if folio is None and item.get("folio_id") not in folios:
+                item_errors["folio_id"] = ["This field is required and must name an existing folio."]
+            if item.get("tax_rule_id") is not None and item["tax_rule_id"] not in tax_rules:
+                item_errors["tax_rule_id"] = [f"Invalid pk \"{item['tax_rule_id']}\" - object does not exist."]
+            errors.append(item_errors)
+            any_errors = any_errors or bool(item_errors)
+        if any_errors:
+            raise serializers.ValidationError(errors)
+
+        for item in items:
+            item["folio"] = folio or folios[item.pop("folio_id")]
+            item.pop("folio_id", None)
+            item["tax_rule"] = tax_rules.get(item.pop("tax_rule_id", None))
+        return items
+
+
+class BulkPostingFolioSerializer(serializers.Serializer):
+    folio_id = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    tax_total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class BulkPostingReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    item_ids = serializers.ListField(child=serializers.IntegerField())
+    folios = BulkPostingFolioSerializer(many=True)
+    credit_limit_exceeded = serializers.ListField(child=serializers.CharField())
+
+
 class FolioDiscountSerializer(serializers.ModelSerializer):
     discount = DiscountSerializer(read_only=True)
     discount_id = serializers.PrimaryKeyRelatedField(
@@ -245,6 +430,16 @@ class FolioSerializer(serializers.ModelSerializer):
         ]
 
 
+class FolioSummarySerializer(FolioSerializer):
+    """Folio without its nested items, for list pages where only totals are shown."""
+
+    class Meta(FolioSerializer.Meta):
+        fields = [field for field in FolioSerializer.Meta.fields if field != "items"]
+        read_only_fields = [
+            field for field in FolioSerializer.Meta.read_only_fields if field != "items"
+        ]
+
+
 class InvoiceLineSerializer(serializers.ModelSerializer):
     class Meta:
         model = InvoiceLine
@@ -262,11 +457,11 @@ class InvoiceLineSerializer(serializers.ModelSerializer):
 
 
 class InvoiceDiscountSerializer(serializers.ModelSerializer):
-    discount = DiscountSerializer(read_only=True)
+    discount = DiscountSerializer(read_only=True, allow_null=True)
 
     class Meta:
         model = InvoiceDiscount
-        fields = ["id", "discount", "applied_amount", "created_at", "updated_at"]
+        fields = ["id", "discount", "description", "applied_amount", "created_at", "updated_at"]
         read_only_fields = fields
 
 
@@ -336,7 +531,6 @@ class InvoiceSerializer(serializers.ModelSerializer):
     invoice_discounts = InvoiceDiscountSerializer(many=True, read_only=True)
     adjustments = InvoiceAdjustmentSerializer(many=True, read_only=True)
     payments = PaymentSerializer(many=True, read_only=True)
-    balance_due = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     discount_ids = serializers.PrimaryKeyRelatedField(
         queryset=Discount.objects.filter(is_active=True),
         many=True,
@@ -357,6 +551,8 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "discount_total",
             "tax_total",
             "total",
+            "amount_paid",
+            "balance_due",
             "notes",
             "folio",
             "folio_id",
@@ -364,7 +560,6 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "invoice_discounts",
             "adjustments",
             "payments",
-            "balance_due",
             "discount_ids",
             "created_at",
             "updated_at",
@@ -376,56 +571,245 @@ class InvoiceSerializer(serializers.ModelSerializer):
             "discount_total",
             "tax_total",
             "total",
+            "amount_paid",
+            "balance_due",
             "folio",
             "lines",
             "invoice_discounts",
             "adjustments",
             "payments",
-            "balance_due",
             "created_at",
             "updated_at",
         ]
 
     def create(self, validated_data):
-        discount_ids = validated_data.pop("discount_ids", [])
+        discounts = validated_data.pop("discount_ids", [])
         invoice = super().create(validated_data)
-        folio = invoice.folio
-        subtotal = Decimal("0.00")
-        tax_total = Decimal("0.00")
-
-        for item in folio.items.all():
-            line_total = item.line_total
-            tax_amount = item.tax_amount
-            InvoiceLine.objects.create(
-                invoice=invoice,
-                folio_item=item,
-                description=item.description,
-                quantity=item.quantity,
-                unit_price=item.unit_price,
-                net_amount=line_total,
-                tax_amount=tax_amount,
-            )
-            subtotal += line_total
-            tax_total += tax_amount
-
-        if discount_ids:
-            discounts = Discount.objects.filter(id__in=[d.id for d in discount_ids], is_active=True)
-            base_amount = subtotal + tax_total
-            for discount in discounts:
-                applied = self._calculate_discount(base_amount, discount)
-                InvoiceDiscount.objects.create(
-                    invoice=invoice,
-                    discount=discount,
-                    applied_amount=applied,
-                )
-
-        invoice.recalculate_totals()
+        populate_invoice(invoice, discounts)
         return invoice
 
-    def _calculate_discount(self, base_amount: Decimal, discount: Discount) -> Decimal:
-        if discount.discount_type == Discount.DiscountType.PERCENTAGE:
-            return (base_amount * discount.value) / Decimal("100.00")
-        return discount.value
+
+class InvoiceBatchSerializer(serializers.Serializer):
+    corporate_account_id = serializers.PrimaryKeyRelatedField(
+        source="corporate_account",
+        queryset=CorporateAccount.objects.all(),
+        required=False,
+        allow_null=True,
+    )
+    status = serializers.ChoiceField(
+        choices=Folio.FolioStatus.choices, default=Folio.FolioStatus.OPEN
+    )
+    created_from = serializers.DateField(required=False)
+    created_to = serializers.DateField(required=False)
+    include_invoiced = serializers.BooleanField(default=False)
+    due_date = serializers.DateField(required=False, allow_null=True)
+
+    def validate(self, attrs):
+        created_from = attrs.get("created_from")
+        created_to = attrs.get("created_to")
+        if created_from and created_to and created_from > created_to:
+            raise serializers.ValidationError("created_from must be on or before created_to.")
+        return attrs
+
+
+class InvoiceBatchResultSerializer(serializers.Serializer):
+    folio_id = serializers.IntegerField()
+    folio_number = serializers.CharField(required=False)
+    status = serializers.ChoiceField(choices=["created", "skipped", "failed"])
+    invoice_id = serializers.IntegerField(required=False)
+    invoice_number = serializers.CharField(required=False)
+    detail = serializers.CharField(required=False)
+
+
+class InvoiceBatchReportSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    skipped = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = InvoiceBatchResultSerializer(many=True)
+
+
+class BulkAdjustmentSerializer(serializers.Serializer):
+    corporate_account_id = serializers.PrimaryKeyRelatedField(
+        source="corporate_account",
+        queryset=CorporateAccount.objects.all(),
+        required=False,
+        allow_null=True,
+    )
+    issued_from = serializers.DateField(required=False)
+    issued_to = serializers.DateField(required=False)
+    status = serializers.ChoiceField(choices=Invoice.InvoiceStatus.choices, required=False)
+    invoice_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    adjustment_type = serializers.ChoiceField(choices=InvoiceAdjustment.AdjustmentType.choices)
+    rule = serializers.ChoiceField(choices=AmountRule.choices, default=AmountRule.FIXED)
+    value = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=Decimal("0.01"))
+    reason = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        issued_from = attrs.get("issued_from")
+        issued_to = attrs.get("issued_to")
+        if issued_from and issued_to and issued_from > issued_to:
+            raise serializers.ValidationError("issued_from must be on or before issued_to.")
+        if not any(
+            attrs.get(key) for key in ("corporate_account", "issued_from", "issued_to", "invoice_ids")
+        ):
+            raise serializers.ValidationError(
+                "Pass corporate_account_id, an issue date range or invoice_ids."
+            )
+        if attrs["rule"] == AmountRule.PERCENTAGE and attrs["value"] > 100:
+            raise serializers.ValidationError("A percentage cannot exceed 100.")
+        return attrs
+
+
+class BulkAdjustmentTotalSerializer(serializers.Serializer):
+    currency = serializers.CharField()
+    count = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class BulkAdjustmentReportSerializer(serializers.Serializer):
+    adjusted = serializers.IntegerField()
+    skipped = serializers.IntegerField()
+    totals = BulkAdjustmentTotalSerializer(many=True)
+
+
+class RemittanceAllocationSerializer(serializers.Serializer):
+    invoice_id = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal("0.01"))
+
+
+class RemittanceSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=Decimal("0.01"))
+    method = serializers.ChoiceField(
+        choices=AllocationMethod.choices, default=AllocationMethod.OLDEST_FIRST
+    )
+    corporate_account_id = serializers.PrimaryKeyRelatedField(
+        source="corporate_account",
+        queryset=CorporateAccount.objects.all(),
+        required=False,
+        allow_null=True,
+    )
+    invoice_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    allocations = RemittanceAllocationSerializer(many=True, required=False)
+    currency = serializers.CharField(max_length=3, required=False)
+    payment_method_id = serializers.PrimaryKeyRelatedField(
+        source="payment_method",
+        queryset=PaymentMethod.objects.all(),
+        required=False,
+        allow_null=True,
+    )
+    reference = serializers.CharField(max_length=120, required=False, allow_blank=True)
+    paid_at = serializers.DateTimeField(required=False)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        allocations = attrs.pop("allocations", None)
+        if attrs["method"] == AllocationMethod.EXPLICIT:
+            if not allocations:
+                raise serializers.ValidationError("Explicit allocation needs allocations.")
+            invoice_ids = [allocation["invoice_id"] for allocation in allocations]
+            if len(set(invoice_ids)) != len(invoice_ids):
+                raise serializers.ValidationError("Each invoice may be allocated only once.")
+            attrs["allocations"] = {
+                allocation["invoice_id"]: allocation["amount"] for allocation in allocations
+            }
+            if sum(attrs["allocations"].values()) > attrs["amount"]:
+                raise serializers.ValidationError("Allocations add up to more than the amount.")
+        elif not attrs.get("corporate_account") and not attrs.get("invoice_ids"):
+            raise serializers.ValidationError(
+                "Pass corporate_account_id or invoice_ids to choose the invoices to pay."
+            )
+        return attrs
+
+
+class RemittancePaymentSerializer(serializers.Serializer):
+    invoice_id = serializers.IntegerField()
+    invoice_number = serializers.CharField()
+    payment_id = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    balance_due = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class RemittanceReportSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=14, decimal_places=2)
+    allocated = serializers.DecimalField(max_digits=14, decimal_places=2)
+    unallocated = serializers.DecimalField(max_digits=14, decimal_places=2)
+    payments = RemittancePaymentSerializer(many=True)
+
+
+class NightAuditSerializer(serializers.Serializer):
+    business_date = serializers.DateField(required=False)
+
+
+class NightAuditRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NightAuditRun
+        fields = [
+            "id",
+            "business_date",
+            "status",
+            "owner",
+            "lease_expires_at",
+            "started_at",
+            "finished_at",
+            "posted",
+            "skipped",
+            "error",
+        ]
+        read_only_fields = fields
+
+
+class POSLineSerializer(serializers.Serializer):
+    description = serializers.CharField(max_length=200)
+    item_type = serializers.ChoiceField(
+        choices=FolioItem.ItemType.choices, default=FolioItem.ItemType.SERVICE
+    )
+    quantity = serializers.DecimalField(
+        max_digits=9, decimal_places=2, min_value=Decimal("0.01"), default=Decimal("1.00")
+    )
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    tax_rule_id = serializers.IntegerField(required=False, allow_null=True)
+
+
+class POSEventSerializer(serializers.Serializer):
+    """A POS check charged to a folio, named by ``folio_number`` or an in-house ``room_number``."""
+
+    check_id = serializers.CharField(max_length=60, required=False)
+    outlet = serializers.CharField(max_length=40, required=False, default="")
+    folio_number = serializers.CharField(max_length=20, required=False)
+    room_number = serializers.CharField(max_length=20, required=False)
+    closed_at = serializers.DateTimeField(required=False)
+    lines = POSLineSerializer(many=True, allow_empty=False, max_length=MAX_BULK_ITEMS)
+
+    def validate(self, attrs):
+        if not attrs.get("folio_number") and not attrs.get("room_number"):
+            raise serializers.ValidationError("Either folio_number or room_number is required.")
+        return attrs
+
+
+class PMSGuestSerializer(serializers.Serializer):
+    first_name = serializers.CharField(max_length=120)
+    last_name = serializers.CharField(max_length=120)
+    email = serializers.EmailField(required=False, allow_blank=True)
+    phone_number = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+
+class PMSReservationSerializer(serializers.Serializer):
+    """A reservation as sent by the PMS; fields left out keep their stored values."""
+
+    event_type = serializers.CharField(max_length=120, required=False, allow_blank=True)
+    reservation_number = serializers.CharField(max_length=40)
+    status = serializers.ChoiceField(choices=Reservation.ReservationStatus.choices, required=False)
+    check_in = serializers.DateField(required=False)
+    check_out = serializers.DateField(required=False)
+    room_number = serializers.CharField(max_length=20, required=False)
+    rate_plan = serializers.CharField(max_length=120, required=False, allow_blank=True)
+    number_of_guests = serializers.IntegerField(min_value=1, required=False)
+    notes = serializers.CharField(required=False, allow_blank=True)
+    guest_id = serializers.IntegerField(required=False)
+    guest = PMSGuestSerializer(required=False)
+    corporate_account_code = serializers.CharField(
+        max_length=40, required=False, allow_blank=True, allow_null=True
+    )
 
 
 class WebhookEventSerializer(serializers.ModelSerializer):
@@ -439,10 +823,28 @@ class WebhookEventSerializer(serializers.ModelSerializer):
             "status",
             "processed_at",
             "notes",
+            "attempts",
+            "next_attempt_at",
+            "dedup_key",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = [
+            "id",
+            "status",
+            "processed_at",
+            "attempts",
+            "next_attempt_at",
+            "dedup_key",
             "created_at",
             "updated_at",
         ]
-        read_only_fields = ["id", "status", "processed_at", "created_at", "updated_at"]
+
+
+class FolioBalanceSerializer(serializers.Serializer):
+    folio_id = serializers.IntegerField()
+    as_of = serializers.DateTimeField()
+    balance = serializers.DecimalField(max_digits=14, decimal_places=2)
 
 
 class DailyReportSerializer(serializers.Serializer):
@@ -0,0 +1,126 @@
+"""
+Write-behind spool for webhook events.
+
+With ``WEBHOOK_SPOOL_DIR`` set, the webhook views acknowledge an event as
+soon as it is on disk instead of after its INSERT. Each event is written to
+``tmp/``, fsynced and renamed into ``new/``, Maildir style, so every file in
+``new/`` is complete. The flusher claims files by renaming them into
+``cur/``, inserts them with ``bulk_create`` and deletes them once the insert
+has committed; anything a crashed flusher leaves in ``cur/`` is flushed
+again on the next run, and the deduplication index drops what had already
+been inserted. Run one flusher per spool directory.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import WebhookEvent, webhook_dedup_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+# A file still in tmp/ after this long belongs to a request that died before acknowledging it.
+STALE_AFTER = 3600
+
+_ready: set[Path] = set()
+
+
+def spool_dir() -> Path | None:
+	path = getattr(settings, "WEBHOOK_SPOOL_DIR", None)
+	return Path(path) if path else None
+
+
+def _prepare(root: Path) -> Path:
+	if root not in _ready:
+		for name in ("tmp", "new", "cur"):
+			(root / name).mkdir(parents=True, exist_ok=True)
+		_ready.add(root)
+	return root
+
+
+def _fsync_dir(path: Path) -> None:
+	fd = os.open(path, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+def spool_event(
+	source: str, event_type: str, payload, *, dedup_key: str = "", root: Path | None = None
+) -> str:
+	"""Durably append one event to the spool and return its file name."""
+	root = _prepare(root or spool_dir())
+	# Names sort in arrival order, so events are flushed in the order they came in.
+	name = f"{time.time_ns()}.{os.getpid()}.{uuid.uuid4().hex}"
+	event = {"source": source, "event_type": event_type, "payload": payload, "dedup_key": dedup_key}
+	data = json.dumps(event).encode()
+	with open(root / "tmp" / name, "wb") as handle:
+		handle.write(data)
+		handle.flush()
+		os.fsync(handle.fileno())
+	os.rename(root / "tmp" / name, root / "new" / name)
+	_fsync_dir(root / "new")
+	return name
+
+
+def _claim(root: Path, limit: int) -> list[Path]:
+	"""Files left in ``cur/`` by an earlier flusher, then new files moved into it, oldest first."""
+	claimed = sorted((root / "cur").iterdir())[:limit]
+	for name in sorted(os.listdir(root / "new"))[: limit - len(claimed)]:
+		try:
+			os.rename(root / "new" / name, root / "cur" / name)
+		except FileNotFoundError:
+			continue
+		claimed.append(root / "cur" / name)
+	return claimed
+
+
+def _read(path: Path) -> WebhookEvent | None:
+	try:
+		event = json.loads(path.read_bytes())
+	except (OSError, ValueError):
+		logger.exception("Unreadable webhook spool file %s", path)
+		(path.parent.parent / "bad").mkdir(exist_ok=True)
+		os.rename(path, path.parent.parent / "bad" / path.name)
+		return None
+	return WebhookEvent(
+		source=event["source"],
+		event_type=event["event_type"],
+		payload=event["payload"],
+		dedup_key=event.get("dedup_key") or webhook_dedup_key(event["source"], event["payload"]),
+	)
+
+
+def _purge_stale(root: Path) -> None:
+	cutoff = time.time() - STALE_AFTER
+	for path in (root / "tmp").iterdir():
+		try:
+			if path.stat().st_mtime < cutoff:
+				path.unlink()
+		except FileNotFoundError:
+			continue
+
+
+def flush_spool(root: Path | None = None, *, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+	"""Insert spooled events in batches of ``batch_size`` until the spool is empty."""
+	root = _prepare(root or spool_dir())
+	flushed = 0
+	while True:
+		claimed = _claim(root, batch_size)
+		if not claimed:
+			break
+		events = [(path, _read(path)) for path in claimed]
+		events = [(path, event) for path, event in events if event is not None]
+		# Redeliveries, and files reflushed after a crash, hit the dedup index and are skipped.
+		WebhookEvent.objects.bulk_create([event for _, event in events], ignore_conflicts=True)
+		for path, _ in events:
+			path.unlink()
+		flushed += len(events)
+	_purge_stale(root)
+	return flushed
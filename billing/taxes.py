@@ -0,0 +1,292 @@
+"""
+Tax calculations that run over many folio items at once.
+
+Active :class:`TaxRule` rows are compiled into a :class:`TaxTable` that is
+cached per thread and rebuilt when any rule is saved or deleted. The table
+answers "which rules apply to a room charge posted on this date" from
+memory, so posting, invoicing and reports can tax whole batches of items
+without a query per item.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Iterable, NamedTuple, Optional
+
+from django.db import models
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from . import money
+from .caching import CompiledCache
+from .models import CENT, CorporateAccount, Folio, FolioItemTax, TaxRule
+
+
+class CompiledRule(NamedTuple):
+	pk: int
+	rate: Decimal
+	item_type: str
+	auto_apply: bool
+	compound: bool
+	inclusive: bool
+	priority: int
+	valid_from: Optional[date]
+	valid_to: Optional[date]
+
+	def applies_on(self, day: date) -> bool:
+		return (self.valid_from is None or self.valid_from <= day) and (
+			self.valid_to is None or day <= self.valid_to
+		)
+
+
+class ItemTax(NamedTuple):
+	rule: CompiledRule
+	taxable: int
+	amount: int
+
+
+class TaxTable:
+	"""The active tax rules, indexed by the item type they apply to automatically."""
+
+	def __init__(self, rules: Iterable[TaxRule]) -> None:
+		self.rules = {
+			rule.pk: CompiledRule(
+				pk=rule.pk,
+				rate=rule.rate,
+				item_type=rule.item_type,
+				auto_apply=rule.auto_apply,
+				compound=rule.compound,
+				inclusive=rule.inclusive,
+				priority=rule.priority,
+				valid_from=rule.valid_from,
+				valid_to=rule.valid_to,
+			)
+			for rule in rules
+			if rule.is_active
+		}
+		self._automatic = defaultdict(list)
+		for rule in self.rules.values():
+			if rule.auto_apply:
+				self._automatic[rule.item_type].append(rule)
+		self._resolved: dict[tuple, tuple[CompiledRule, ...]] = {}
+
+	def rules_for(
+		self, item_type: str, day: date, tax_rule_id: Optional[int] = None
+	) -> tuple[CompiledRule, ...]:
+		"""Rules for an item, in the order they apply.
+
+		That is every automatic rule for ``item_type`` (or for all types) in
+		force on ``day``, plus the item's own ``tax_rule_id`` if it is active.
+		"""
+		key = (item_type, day, tax_rule_id)
+		if key not in self._resolved:
+			rules = {
+				rule.pk: rule
+				for rule in (*self._automatic[""], *self._automatic[item_type])
+				if rule.applies_on(day)
+			}
+			if tax_rule_id in self.rules:
+				rules[tax_rule_id] = self.rules[tax_rule_id]
+			self._resolved[key] = tuple(
+				sorted(rules.values(), key=lambda rule: (not rule.inclusive, rule.priority, rule.pk))
+			)
+		return self._resolved[key]
+
+	@staticmethod
+	def calculate(amount: int, rules: tuple[CompiledRule, ...]) -> tuple[int, list[ItemTax]]:
+		"""Split a line ``amount`` in minor units into its net amount and per-rule taxes.
+
+		Inclusive rules are taken out of ``amount`` first: the net is the
+		amount divided by one plus their combined rate, and any rounding
+		remainder goes to the last inclusive tax so net plus taxes is exactly
+		``amount``. Exclusive rules are then added on top in priority order.
+		A compound rule taxes the net plus every tax applied before it.
+		"""
+		inclusive = [rule for rule in rules if rule.inclusive]
+		net = amount
+		if inclusive:
+			# Tax per unit of net, walking the rules as calculate() will.
+			factor = Decimal(0)
+			for rule in inclusive:
+				factor += (1 + factor if rule.compound else 1) * rule.rate / 100
+			net = int((Decimal(amount) / (1 + factor)).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+		last_inclusive = inclusive[-1] if inclusive else None
+		taxes: list[ItemTax] = []
+		applied = 0
+		for rule in rules:
+			taxable = net + applied if rule.compound else net
+			tax = money.percentage(taxable, rule.rate)
+			if rule is last_inclusive:
+				tax = amount - net - applied
+			taxes.append(ItemTax(rule, taxable, tax))
+			applied += tax
+		return net, taxes
+
+
+_tax_table = CompiledCache(
+	"billing:tax-table", lambda: TaxTable(TaxRule.objects.filter(is_active=True))
+)
+
+
+def tax_table() -> TaxTable:
+	"""The compiled tax table, rebuilt after any tax rule change commits."""
+	return _tax_table.get()
+
+
+def invalidate_tax_table() -> None:
+	_tax_table.invalidate()
+
+
+def apply_taxes(items: Iterable) -> list[FolioItemTax]:
+	"""Set ``line_total`` and ``tax_amount`` on every folio item and return their tax rows.
+
+	Each line is rounded to its folio currency's minor unit, then split by
+	:meth:`TaxTable.calculate`. The returned :class:`FolioItemTax` rows are
+	unsaved; the caller writes them once the items have primary keys. Items
+	should have ``folio`` loaded, or it is fetched once per item.
+	"""
+	table = tax_table()
+	rows = []
+	for item in items:
+		currency = item.folio.currency
+		amount = money.multiply(money.to_minor(item.unit_price, currency), item.quantity)
+		posted_at = item.posted_at
+		posted_on = timezone.localdate(posted_at) if timezone.is_aware(posted_at) else posted_at.date()
+		rules = table.rules_for(item.item_type, posted_on, item.tax_rule_id)
+		net, taxes = table.calculate(amount, rules)
+		item.line_total = money.from_minor(net, currency)
+		item.tax_amount = money.from_minor(sum(tax.amount for tax in taxes), currency)
+		rows.extend(
+			FolioItemTax(
+				folio_item=item,
+				tax_rule_id=tax.rule.pk,
+				taxable_amount=money.from_minor(tax.taxable, currency),
+				amount=money.from_minor(tax.amount, currency),
+			)
+			for tax in taxes
+		)
+	return rows
+
+
+def _rounded_per_currency(expression: models.Expression, currency_path: str) -> models.Expression:
+	"""Round ``expression`` to the folio currency's minor unit, half away from zero."""
+	by_exponent = defaultdict(list)
+	for currency in money.ISO_EXPONENTS:
+		exponent = money.exponent(currency)
+		if exponent != money.DEFAULT_EXPONENT:
+			by_exponent[exponent].append(currency)
+	return models.Case(
+		*(
+			models.When(
+				**{f"{currency_path}__in": currencies}, then=Round(expression, exponent)
+			)
+			for exponent, currencies in sorted(by_exponent.items())
+		),
+		default=Round(expression, money.DEFAULT_EXPONENT),
+		output_field=models.DecimalField(max_digits=14, decimal_places=2),
+	)
+
+
+def simulate_rate_change(rates: dict[int, Decimal]) -> dict:
+	"""Current versus proposed tax on open folios if each rule in ``rates`` changed rate.
+
+	The whole house is aggregated by the database in one grouped query over
+	the stored :class:`FolioItemTax` rows: each rule's share of an item is
+	recomputed from its taxable amount and rounded to the folio currency,
+	then summed per currency, tax rule and corporate account. Amounts in
+	different currencies are never added up, so there is one report per
+	currency, with its breakdowns folded from those groups. A changed rate
+	also moves the base of any compound rule applied after it; that
+	second-order effect is not simulated. Inclusive rules are not supported,
+	since their rate re-splits a fixed gross rather than adding tax on top.
+	"""
+	factor = models.Case(
+		*(
+			# Multiply by rate / 100 rather than dividing, so SQLite never truncates.
+			models.When(tax_rule_id=rule_id, then=models.Value(Decimal(rate) / 100))
+			for rule_id, rate in rates.items()
+		),
+		output_field=models.DecimalField(max_digits=9, decimal_places=6),
+	)
+	zero = models.Value(Decimal("0.00"))
+	groups = (
+		FolioItemTax.objects.filter(
+			folio_item__folio__status=Folio.FolioStatus.OPEN, tax_rule_id__in=rates
+		)
+		.values(
+			"tax_rule_id",
+			corporate_account_id=models.F("folio_item__folio__corporate_account_id"),
+			currency=models.F("folio_item__folio__currency"),
+		)
+		.annotate(
+			# Declared before taxable_amount, whose aggregate would shadow the column.
+			proposed_tax=Coalesce(
+				models.Sum(
+					_rounded_per_currency(
+						models.F("taxable_amount") * factor, "folio_item__folio__currency"
+					)
+				),
+				zero,
+			),
+			item_count=models.Count("pk"),
+			taxable_amount=Coalesce(models.Sum("taxable_amount"), zero),
+			current_tax=Coalesce(models.Sum("amount"), zero),
+		)
+		.order_by()
+	)
+
+	groups = list(groups)
+	rules = {rule.pk: rule for rule in TaxRule.objects.filter(pk__in=rates)}
+	accounts = CorporateAccount.objects.in_bulk(
+		{group["corporate_account_id"] for group in groups} - {None}
+	)
+	amounts = ("taxable_amount", "current_tax", "proposed_tax")
+	reports: dict = {}
+	for group in groups:
+		report = reports.setdefault(
+			group["currency"],
+			{
+				"currency": group["currency"],
+				"item_count": 0,
+				**dict.fromkeys(amounts, Decimal("0.00")),
+				"by_tax_rule": {},
+				"by_corporate_account": {},
+			},
+		)
+		rule = rules[group["tax_rule_id"]]
+		rule_row = report["by_tax_rule"].setdefault(
+			rule.pk,
+			{
+				"tax_rule_id": rule.pk,
+				"tax_rule": rule.name,
+				"current_rate": rule.rate,
+				"proposed_rate": Decimal(rates[rule.pk]),
+				"item_count": 0,
+				**dict.fromkeys(amounts, Decimal("0.00")),
+			},
+		)
+		account = accounts.get(group["corporate_account_id"])
+		account_row = report["by_corporate_account"].setdefault(
+			account.pk if account else None,
+			{
+				"corporate_account_id": account.pk if account else None,
+				"corporate_account": account.code if account else None,
+				"item_count": 0,
+				**dict.fromkeys(amounts, Decimal("0.00")),
+			},
+		)
+		for row in (report, rule_row, account_row):
+			row["item_count"] += group["item_count"]
+			for key in amounts:
+				row[key] += Decimal(group[key]).quantize(CENT)
+
+	for report in reports.values():
+		report["by_tax_rule"] = sorted(report["by_tax_rule"].values(), key=lambda row: row["tax_rule"])
+		# Folios without a corporate account are grouped last.
+		report["by_corporate_account"] = sorted(
+			report["by_corporate_account"].values(),
+			key=lambda row: (row["corporate_account"] is None, row["corporate_account"] or ""),
+		)
+		for row in (report, *report["by_tax_rule"], *report["by_corporate_account"]):
+			row["difference"] = row["proposed_tax"] - row["current_tax"]
+	return {"currencies": [reports[currency] for currency in sorted(reports)]}
@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import CorporateAccount, Folio, Invoice, InvoiceAdjustment, InvoiceLine, LedgerEntry
+
+
+class BulkAdjustmentTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME")
+        self.folio = Folio.objects.create(guest_name="Group", corporate_account=self.account)
+        self.invoices = [self._invoice(self.folio, amount) for amount in ("100.00", "300.00")]
+        self.other = self._invoice(Folio.objects.create(guest_name="Walk-in"), "50.00")
+
+    def _invoice(self, folio: Folio, amount: str) -> Invoice:
+        invoice = Invoice.objects.create(folio=folio)
+        InvoiceLine.objects.create(
+            invoice=invoice, description="Stay", unit_price=Decimal(amount), net_amount=Decimal(amount)
+        )
+        invoice.recalculate_totals()
+        return invoice
+
+    def _adjust(self, payload: dict):
+        return self.client.post(reverse("invoice-bulk-adjustment"), payload, format="json")  # type: ignore[misc]
+
+    def _totals(self) -> list[Decimal]:
+        return [Invoice.objects.get(pk=invoice.pk).total for invoice in (*self.invoices, self.other)]
+
+    def test_percentage_rebate_for_an_account(self) -> None:
+        response = self._adjust(
+            {
+                "corporate_account_id": self.account.pk,
+                "adjustment_type": "credit",
+                "rule": "percentage",
+                "value": "10.00",
+                "reason": "Q3 rebate",
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertEqual(
+            response.data,  # type: ignore[attr-defined]
+            {"adjusted": 2, "skipped": 0, "totals": [{"currency": "USD", "count": 2, "amount": "-40.00"}]},
+        )
+        self.assertEqual(self._totals(), [Decimal("90.00"), Decimal("270.00"), Decimal("50.00")])
+        self.assertEqual(
+            LedgerEntry.objects.filter(entry_type=LedgerEntry.EntryType.ADJUSTMENT).count(), 2
+        )
+
+    def test_split_and_fixed_amounts_in_constant_queries(self) -> None:
+        ids = [invoice.pk for invoice in self.invoices]
+        self._adjust(
+            {"invoice_ids": ids, "adjustment_type": "debit", "rule": "pro_rata", "value": "20.00"}
+        )
+        self.assertEqual(self._totals()[:2], [Decimal("105.00"), Decimal("315.00")])
+
+        def run(invoice_ids: list[int]) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                self._adjust({"invoice_ids": invoice_ids, "adjustment_type": "credit", "value": "1.00"})
+            return len(queries)
+
+        self.assertEqual(run(ids[:1]), run([*ids, self.other.pk]))
+        self.assertEqual(InvoiceAdjustment.objects.filter(amount=Decimal("-1.00")).count(), 4)
+
+    def test_requires_a_filter(self) -> None:
+        response = self._adjust({"adjustment_type": "credit", "value": "5.00"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
@@ -0,0 +1,42 @@
+import time
+from contextlib import suppress
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+
+from billing.caching import MAX_AGE, CompiledCache
+from billing.models import CompiledCacheVersion
+
+
+class CompiledCacheTests(TestCase):
+    def setUp(self) -> None:
+        self.builds = 0
+
+        def build() -> int:
+            self.builds += 1
+            return self.builds
+
+        self.cache = CompiledCache("test:counter", build)
+
+    def test_value_is_rebuilt_after_an_invalidation(self) -> None:
+        self.assertEqual((self.cache.get(), self.cache.get()), (1, 1))
+        self.cache.invalidate()
+        self.assertEqual(self.cache.get(), 2)
+        # What another process sees: the token row changed under this thread.
+        CompiledCacheVersion.objects.filter(key="test:counter").update(token="elsewhere")
+        self.assertEqual((self.cache.get(), self.cache.get()), (3, 3))
+
+    def test_rolled_back_invalidation_rebuilds_once(self) -> None:
+        self.cache.get()
+        with suppress(RuntimeError), transaction.atomic():
+            self.cache.invalidate()
+            self.assertEqual(self.cache.get(), 2)
+            raise RuntimeError
+        self.assertEqual((self.cache.get(), self.cache.get()), (3, 3))
+
+    def test_value_expires_without_an_invalidation(self) -> None:
+        self.cache.get()
+        later = time.monotonic() + MAX_AGE + 1
+        with mock.patch("billing.caching.time.monotonic", return_value=later):
+            self.assertEqual((self.cache.get(), self.cache.get()), (2, 2))
@@ -0,0 +1,132 @@
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import TransactionTestCase, skipUnlessDBFeature
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import CorporateAccount, Folio, Invoice, Payment
+
+
+class CreditLimitTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.account = CorporateAccount.objects.create(
+            name="Acme", code="ACME", credit_limit=Decimal("100.00")
+        )
+        self.folio = Folio.objects.create(guest_name="Jane Roe", corporate_account=self.account)
+
+    def _post(self, price: str):
+        return self.client.post(  # type: ignore[misc]
+            reverse("folio-add-item", kwargs={"pk": self.folio.pk}),
+            {"description": "Dinner", "item_type": "service", "unit_price": price},
+            format="json",
+        )
+
+    def test_posting_respects_running_exposure(self) -> None:
+        response = self._post("80.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertFalse(response.data["credit_limit_exceeded"])  # type: ignore[index]
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.exposure, Decimal("80.00"))
+
+        response = self._post("30.00")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+
+        invoice = Invoice.objects.create(folio=self.folio)
+        Payment.objects.create(invoice=invoice, amount=Decimal("50.00"))
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.exposure, Decimal("30.00"))
+        self.assertEqual(self._post("30.00").status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+
+        self.account.enforce_credit_limit = False
+        self.account.save()
+        response = self._post("60.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertTrue(response.data["credit_limit_exceeded"])  # type: ignore[index]
+
+    def test_accounts_are_locked_for_the_check(self) -> None:
+        with mock.patch.object(
+            QuerySet, "select_for_update", autospec=True, side_effect=QuerySet.select_for_update
+        ) as lock:
+            self._post("10.00")
+            item = {"folio_id": self.folio.pk, "description": "Bar", "item_type": "service", "unit_price": "5.00"}
+            self.client.post(reverse("folio-bulk-post"), {"items": [item]}, format="json")  # type: ignore[misc]
+        locked = [call.args[0].model for call in lock.call_args_list]
+        self.assertEqual(locked.count(CorporateAccount), 2)
+
+    def test_deletes_keep_exposure_in_step_with_the_ledger(self) -> None:
+        def exposure() -> Decimal:
+            self.account.refresh_from_db()
+            return self.account.exposure
+
+        self._post("100.00")
+        invoice = Invoice.objects.create(folio=self.folio)
+        payment = Payment.objects.create(invoice=invoice, amount=Decimal("40.00"))
+        self.assertEqual(exposure(), Decimal("60.00"))
+
+        payment.delete()
+        self.assertEqual(exposure(), Decimal("100.00"))
+        Payment.objects.create(invoice=invoice, amount=Decimal("100.00"))
+        self.assertEqual(exposure(), Decimal("0.00"))
+        invoice.delete()
+        self.assertEqual(exposure(), self.folio.ledger_balance())
+        self.assertEqual(exposure(), Decimal("100.00"))
+
+        self.folio.delete()
+        self.assertEqual(exposure(), Decimal("0.00"))
+
+    def test_reassigning_folio_moves_exposure(self) -> None:
+        self._post("40.00")
+        other = CorporateAccount.objects.create(name="Globex", code="GLOBEX")
+        self.folio.corporate_account = other
+        self.folio.save()
+        self.account.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.account.exposure, Decimal("0.00"))
+        self.assertEqual(other.exposure, Decimal("40.00"))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentCreditLimitTests(TransactionTestCase):
+    def test_concurrent_charges_cannot_pass_the_limit_together(self) -> None:
+        admin = get_user_model().objects.create_superuser(username="admin", password="Str0ngPass!")
+        account = CorporateAccount.objects.create(name="Acme", code="ACME", credit_limit=Decimal("100.00"))
+        folio = Folio.objects.create(guest_name="Jane Roe", corporate_account=account)
+        codes = []
+
+        def post() -> None:
+            try:
+                client = APIClient()
+                client.force_authenticate(user=admin)
+                response = client.post(
+                    reverse("folio-add-item", kwargs={"pk": folio.pk}),
+                    {"description": "Dinner", "item_type": "service", "unit_price": "60.00"},
+                    format="json",
+                )
+                codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(codes), [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST])
+        account.refresh_from_db()
+        self.assertEqual(account.exposure, Decimal("60.00"))
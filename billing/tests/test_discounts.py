@@ -0,0 +1,120 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from billing.discounts import CompiledDiscount, apply_discounts, automatic_discounts
+from billing.invoicing import billable_folios, generate_invoices, populate_invoice
+from billing.models import CorporateAccount, Discount, Folio, FolioItem, Invoice, LedgerEntry
+
+
+class DiscountEngineTests(TestCase):
+    def setUp(self) -> None:
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME")
+        self.other = CorporateAccount.objects.create(name="Globex", code="GLOBEX")
+
+    def _discount(self, **kwargs) -> CompiledDiscount:
+        return CompiledDiscount.from_discount(Discount.objects.create(name="Promo", **kwargs))
+
+    def _folio(self, account: CorporateAccount | None = None) -> Folio:
+        folio = Folio.objects.create(guest_name="Guest", corporate_account=account)
+        FolioItem.objects.create(
+            folio=folio, description="Room Night", item_type="room", unit_price=Decimal("100.00")
+        )
+        return folio
+
+    def test_stacking_order_and_caps(self) -> None:
+        percent = self._discount(value=Decimal("10.00"))
+        fixed = self._discount(discount_type="fixed", value=Decimal("5.00"), priority=1)
+        capped = self._discount(value=Decimal("50.00"), max_amount=Decimal("3.00"), priority=2)
+        exclusive = self._discount(value=Decimal("30.00"), stackable=False, priority=3)
+
+        applied = apply_discounts(10000, [capped, fixed, percent, exclusive], "USD")
+        # 10% of 100.00, then 5.00 fixed, then 50% of 85.00 capped at 3.00.
+        self.assertEqual(applied, [(percent, 1000), (fixed, 500), (capped, 300)])
+        self.assertEqual(apply_discounts(10000, [exclusive, capped], "USD"), [(capped, 300)])
+
+        bigger = self._discount(discount_type="fixed", value=Decimal("80.00"))
+        self.assertEqual(apply_discounts(5000, [bigger, fixed], "USD"), [(bigger, 5000)])
+
+    def test_index_resolves_by_account_and_date(self) -> None:
+        today = timezone.localdate()
+        house = Discount.objects.create(name="House", value=Decimal("5.00"), auto_apply=True)
+        acme = Discount.objects.create(
+            name="Acme", value=Decimal("10.00"), auto_apply=True, corporate_account=self.account
+        )
+        Discount.objects.create(
+            name="Expired", value=Decimal("20.00"), auto_apply=True, end_date=today - timedelta(days=1)
+        )
+        Discount.objects.create(
+            name="Globex", value=Decimal("15.00"), auto_apply=True, corporate_account=self.other
+        )
+        Discount.objects.create(name="Manual", value=Decimal("25.00"))
+
+        folios = [self._folio(self.account), self._folio()]
+        resolved = automatic_discounts(folios, today)
+        self.assertEqual({discount.pk for discount in resolved[folios[0].pk]}, {house.pk, acme.pk})
+        self.assertEqual([discount.pk for discount in resolved[folios[1].pk]], [house.pk])
+
+    def test_invoices_apply_automatic_discounts(self) -> None:
+        Discount.objects.create(
+            name="Acme", value=Decimal("10.00"), auto_apply=True, corporate_account=self.account
+        )
+        manual = Discount.objects.create(name="Manual", discount_type="fixed", value=Decimal("4.00"), priority=5)
+
+        invoice = Invoice.objects.create(folio=self._folio(self.account))
+        populate_invoice(invoice, [manual])
+        invoice.recalculate_totals()
+        self.assertEqual(invoice.discount_total, Decimal("14.00"))
+        self.assertEqual(
+            LedgerEntry.objects.filter(entry_type=LedgerEntry.EntryType.DISCOUNT).count(), 2
+        )
+
+    def test_batch_discounts_cost_no_query_per_folio(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            Discount.objects.create(
+                name="Acme", value=Decimal("10.00"), auto_apply=True, corporate_account=self.account
+            )
+        automatic_discounts([], timezone.localdate())
+
+        def run(count: int) -> int:
+            for _ in range(count):
+                self._folio(self.account)
+            with CaptureQueriesContext(connection) as queries:
+                generate_invoices(billable_folios(corporate_account=self.account), workers=1)
+            return len(queries)
+
+        self.assertEqual(run(1), run(3))
+        discounts = Invoice.objects.values_list("invoice_discounts__applied_amount", flat=True)
+        self.assertEqual(list(discounts), [Decimal("10.00")] * 4)
+
+    def test_corporate_rate_applies_to_single_and_batch_invoices(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.discount_rate = Decimal("12.00")
+            self.account.save()
+        Discount.objects.create(name="House", value=Decimal("10.00"), auto_apply=True, priority=1)
+
+        invoice = Invoice.objects.create(folio=self._folio(self.account))
+        populate_invoice(invoice)
+        invoice.recalculate_totals()
+        # 12% of 100.00, then 10% of the remaining 88.00.
+        self.assertEqual(
+            list(invoice.invoice_discounts.order_by("pk").values_list("description", "applied_amount")),
+            [("Corporate rate 12.00%", Decimal("12.00")), ("", Decimal("8.80"))],
+        )
+        self.assertEqual(invoice.total, Decimal("79.20"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.discount_rate = Decimal("20.00")
+            self.account.save()
+        batch_folio = self._folio(self.account)
+        walk_in = self._folio()
+        generate_invoices(Folio.objects.filter(pk__in=[batch_folio.pk, walk_in.pk]), workers=1)
+        rates = dict(
+            Invoice.objects.filter(folio__in=[batch_folio, walk_in], invoice_discounts__discount__isnull=True)
+            .values_list("folio_id", "invoice_discounts__applied_amount")
+        )
+        self.assertEqual(rates, {batch_folio.pk: Decimal("20.00")})
@@ -0,0 +1,134 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import Folio, FolioItem, TaxRule
+
+
+class FolioTotalsTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.tax_rule = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"))
+        self.folio = Folio.objects.create(guest_name="Jane Roe")
+
+    def test_totals_follow_item_writes(self) -> None:
+        response = self.client.post(  # type: ignore[misc]
+            reverse("folio-add-item", kwargs={"pk": self.folio.pk}),
+            {
+                "description": "Room Night",
+                "item_type": "room",
+                "quantity": "2",
+                "unit_price": "100.00",
+                "tax_rule_id": self.tax_rule.pk,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        item_id = response.data["id"]  # type: ignore[index]
+
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.subtotal, Decimal("200.00"))
+        self.assertEqual(self.folio.tax_total, Decimal("20.00"))
+        self.assertEqual(self.folio.total, Decimal("220.00"))
+
+        response = self.client.put(  # type: ignore[misc]
+            reverse("folio-update-item", kwargs={"pk": self.folio.pk, "item_id": item_id}),
+            {
+                "description": "Room Night",
+                "item_type": "room",
+                "quantity": "1",
+                "unit_price": "100.00",
+                "tax_rule_id": None,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.subtotal, Decimal("100.00"))
+        self.assertEqual(self.folio.tax_total, Decimal("0.00"))
+        self.assertEqual(self.folio.total, Decimal("100.00"))
+
+        FolioItem.objects.get(pk=item_id).delete()
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.total, Decimal("0.00"))
+
+        response = self.client.get(reverse("folio-detail", kwargs={"pk": self.folio.pk}))  # type: ignore[misc]
+        self.assertEqual(response.data["total"], "0.00")  # type: ignore[index]
+
+    def test_with_totals_matches_stored_totals(self) -> None:
+        FolioItem.objects.create(
+            folio=self.folio,
+            description="Room Night",
+            item_type="room",
+            quantity=Decimal("3"),
+            unit_price=Decimal("80.00"),
+            tax_rule=self.tax_rule,
+        )
+        FolioItem.objects.create(
+            folio=self.folio,
+            description="Minibar",
+            item_type="service",
+            unit_price=Decimal("12.50"),
+        )
+        Folio.objects.filter(pk=self.folio.pk).update(
+            subtotal=Decimal("0.00"), tax_total=Decimal("0.00"), total=Decimal("0.00")
+        )
+
+        folio = Folio.objects.with_totals().get(pk=self.folio.pk)
+        self.assertEqual(folio.items_subtotal, Decimal("252.50"))
+        self.assertEqual(folio.items_tax_total, Decimal("24.00"))
+        self.assertEqual(folio.items_total, Decimal("276.50"))
+
+        Folio.objects.filter(pk=self.folio.pk).refresh_totals()
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.total, Decimal("276.50"))
+
+        response = self.client.get(reverse("folio-list"))  # type: ignore[misc]
+        row = response.data["results"][0]  # type: ignore[index]
+        self.assertEqual(row["total"], "276.50")
+        self.assertNotIn("items", row)
+
+    def test_item_amounts_are_stored_rounded(self) -> None:
+        rule = TaxRule.objects.create(name="City", rate=Decimal("7.50"))
+        item = FolioItem.objects.create(
+            folio=self.folio,
+            description="Parking",
+            item_type="service",
+            quantity=Decimal("1"),
+            unit_price=Decimal("33.33"),
+            tax_rule=rule,
+        )
+        stored = FolioItem.objects.values("line_total", "tax_amount").get(pk=item.pk)
+        self.assertEqual(stored, {"line_total": Decimal("33.33"), "tax_amount": Decimal("2.50")})
+
+        rule.is_active = False
+        rule.save()
+        item.refresh_from_db()
+        self.assertEqual(item.tax_amount, Decimal("2.50"))
+
+    def test_saving_a_stale_folio_keeps_its_totals(self) -> None:
+        stale = Folio.objects.get(pk=self.folio.pk)
+        FolioItem.objects.create(
+            folio=self.folio, description="Room Night", item_type="room", unit_price=Decimal("100.00")
+        )
+        stale.notes = "Late checkout"
+        stale.save()
+
+        response = self.client.patch(  # type: ignore[misc]
+            reverse("folio-detail", kwargs={"pk": self.folio.pk}), {"notes": "VIP"}, format="json"
+        )
+        self.assertEqual(response.data["total"], "100.00")  # type: ignore[index]
+        self.folio.refresh_from_db()
+        self.assertEqual((self.folio.notes, self.folio.total), ("VIP", Decimal("100.00")))
@@ -0,0 +1,184 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from billing.models import (
+    Discount,
+    Folio,
+    Invoice,
+    InvoiceAdjustment,
+    InvoiceDiscount,
+    InvoiceLine,
+    Payment,
+)
+from billing.unit_of_work import mark_invoice_dirty, unit_of_work
+
+
+class InvoiceTotalsTests(TestCase):
+    def setUp(self) -> None:
+        self.folio = Folio.objects.create(guest_name="Jane Roe")
+        self.discount = Discount.objects.create(name="Promo", value=Decimal("5.00"))
+
+    def _invoice(self, net: str, tax: str) -> Invoice:
+        invoice = Invoice.objects.create(folio=self.folio)
+        InvoiceLine.objects.create(
+            invoice=invoice,
+            description="Room Night",
+            unit_price=Decimal(net),
+            net_amount=Decimal(net),
+            tax_amount=Decimal(tax),
+        )
+        return invoice
+
+    def test_recalculate_many_invoices_in_one_statement(self) -> None:
+        first = self._invoice("100.00", "10.00")
+        InvoiceDiscount.objects.create(
+            invoice=first, discount=self.discount, applied_amount=Decimal("5.00")
+        )
+        InvoiceAdjustment.objects.create(
+            invoice=first,
+            adjustment_type=InvoiceAdjustment.AdjustmentType.CREDIT,
+            amount=Decimal("-2.50"),
+        )
+        second = self._invoice("40.00", "0.00")
+        empty = Invoice.objects.create(folio=self.folio, total=Decimal("99.00"))
+
+        with self.assertNumQueries(1):
+            updated = Invoice.objects.filter(folio=self.folio).recalculate_totals()
+        self.assertEqual(updated, 3)
+
+        first.refresh_from_db()
+        self.assertEqual(first.subtotal, Decimal("100.00"))
+        self.assertEqual(first.tax_total, Decimal("10.00"))
+        self.assertEqual(first.discount_total, Decimal("5.00"))
+        self.assertEqual(first.total, Decimal("102.50"))
+        second.refresh_from_db()
+        self.assertEqual(second.total, Decimal("40.00"))
+        empty.refresh_from_db()
+        self.assertEqual(empty.total, Decimal("0.00"))
+
+    def test_totals_are_stored_to_the_cent(self) -> None:
+        invoice = self._invoice("0.10", "0.00")
+        InvoiceLine.objects.create(
+            invoice=invoice, description="Water", unit_price=Decimal("0.20"), net_amount=Decimal("0.20")
+        )
+        invoice.recalculate_totals()
+        # 0.1 + 0.2 is not 0.3 in binary floating point, which is how SQLite sums.
+        stored = Invoice.objects.filter(pk=invoice.pk, subtotal=Decimal("0.30"), total=Decimal("0.30"))
+        self.assertTrue(stored.exists())
+
+    def test_instance_recalculation_refreshes_totals(self) -> None:
+        invoice = self._invoice("80.00", "8.00")
+        invoice.recalculate_totals()
+        self.assertEqual(invoice.total, Decimal("88.00"))
+
+    def test_unit_of_work_recalculates_each_invoice_once(self) -> None:
+        invoice = self._invoice("50.00", "5.00")
+        with CaptureQueriesContext(connection) as queries:
+            with unit_of_work():
+                for amount in ("1.00", "2.00", "3.00"):
+                    InvoiceAdjustment.objects.create(
+                        invoice=invoice,
+                        adjustment_type=InvoiceAdjustment.AdjustmentType.DEBIT,
+                        amount=Decimal(amount),
+                    )
+                    mark_invoice_dirty(invoice)
+                with unit_of_work():
+                    mark_invoice_dirty(invoice.pk)
+                self.assertEqual(invoice.total, Decimal("0.00"))
+
+        updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "billing_invoice"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(invoice.total, Decimal("61.00"))
+
+    def test_balance_follows_posted_payments(self) -> None:
+        invoice = self._invoice("100.00", "10.00")
+        invoice.recalculate_totals()
+        self.assertEqual(invoice.balance_due, Decimal("110.00"))
+
+        payment = Payment.objects.create(invoice=invoice, amount=Decimal("60.00"))
+        invoice.recalculate_totals()
+        self.assertEqual(invoice.amount_paid, Decimal("60.00"))
+        self.assertEqual(invoice.balance_due, Decimal("50.00"))
+        self.assertTrue(Invoice.objects.filter(pk=invoice.pk, balance_due__gt=0).exists())
+
+        payment.status = Payment.PaymentStatus.REFUNDED
+        payment.save()
+        invoice.recalculate_totals()
+        self.assertEqual(invoice.amount_paid, Decimal("0.00"))
+        self.assertEqual(invoice.balance_due, Decimal("110.00"))
+
+    def test_payment_changes_update_the_stored_balance(self) -> None:
+        invoice = self._invoice("100.00", "10.00")
+        invoice.recalculate_totals()
+        payment = Payment.objects.create(invoice=invoice, amount=Decimal("60.00"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance_due, Decimal("50.00"))
+
+        payment.status = Payment.PaymentStatus.VOID
+        payment.save()
+        invoice.refresh_from_db()
+        self.assertEqual((invoice.amount_paid, invoice.balance_due), (Decimal("0.00"), Decimal("110.00")))
+
+        other = Payment.objects.create(invoice=invoice, amount=Decimal("30.00"))
+        other.amount = Decimal("40.00")
+        other.save()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance_due, Decimal("70.00"))
+        other.delete()
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance_due, Decimal("110.00"))
+        self.assertFalse(Invoice.objects.drifted().exists())
+
+    def test_paid_invoice_with_inexact_cents_is_not_outstanding(self) -> None:
+        invoice = self._invoice("0.10", "0.20")
+        invoice.recalculate_totals()
+        Payment.objects.create(invoice=invoice, amount=Decimal("0.10"))
+        self.assertTrue(Invoice.objects.filter(pk=invoice.pk, balance_due=Decimal("0.20")).exists())
+        Payment.objects.create(invoice=invoice, amount=Decimal("0.20"))
+        self.assertFalse(Invoice.objects.filter(balance_due__gt=0).exists())
+
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="clerk"))
+        self.assertEqual(client.get(reverse("reports-outstanding")).data, [])  # type: ignore[attr-defined]
+
+    def test_correct_totals_with_inexact_cents_are_not_drifted(self) -> None:
+        invoice = self._invoice("0.10", "0.20")
+        InvoiceDiscount.objects.create(
+            invoice=invoice, discount=self.discount, applied_amount=Decimal("0.10")
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(
+            subtotal=Decimal("0.10"),
+            tax_total=Decimal("0.20"),
+            discount_total=Decimal("0.10"),
+            total=Decimal("0.20"),
+            balance_due=Decimal("0.20"),
+        )
+        self.assertFalse(Invoice.objects.drifted().exists())
+
+        out = StringIO()
+        call_command("check_invoice_totals", stdout=out)
+        self.assertIn("Checked 1 invoices, 0 drifted.", out.getvalue())
+
+    def test_check_command_reports_and_repairs_drift(self) -> None:
+        invoices = [self._invoice(net, "1.00") for net in ("10.00", "20.00", "30.00")]
+        Invoice.objects.filter(folio=self.folio).recalculate_totals()
+        Invoice.objects.filter(pk=invoices[1].pk).update(total=Decimal("5.00"))
+        self.assertEqual(list(Invoice.objects.drifted().values_list("pk", flat=True)), [invoices[1].pk])
+
+        out = StringIO()
+        call_command("check_invoice_totals", chunk_size=2, stdout=out)
+        self.assertIn(f"#{invoices[1].pk}): total 5.00 != 21.00", out.getvalue())
+        self.assertIn("Checked 3 invoices, 1 drifted.", out.getvalue())
+
+        out = StringIO()
+        call_command("check_invoice_totals", repair=True, stdout=out)
+        self.assertIn("1 drifted, 1 repaired", out.getvalue())
+        self.assertFalse(Invoice.objects.drifted().exists())
@@ -0,0 +1,130 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing import invoicing
+from billing.invoicing import billable_folios, generate_invoices, populate_invoice
+from billing.models import CorporateAccount, Discount, Folio, FolioItem, Invoice, TaxRule
+
+
+class InvoiceGenerationTests(TestCase):
+    def setUp(self) -> None:
+        self.tax_rule = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"))
+        self.discount = Discount.objects.create(name="VIP", value=Decimal("10.00"))
+
+    def _folio(self, nights: int) -> Folio:
+        folio = Folio.objects.create(guest_name="Group Block")
+        for _ in range(nights):
+            FolioItem.objects.create(
+                folio=folio,
+                description="Room Night",
+                item_type=FolioItem.ItemType.ROOM,
+                unit_price=Decimal("100.00"),
+                tax_rule=self.tax_rule,
+            )
+        return folio
+
+    def _generate(self, folio: Folio) -> tuple[Invoice, int]:
+        with CaptureQueriesContext(connection) as queries:
+            invoice = Invoice.objects.create(folio=folio)
+            populate_invoice(invoice, [self.discount, self.discount])
+        return invoice, len(queries)
+
+    def test_query_count_does_not_depend_on_item_count(self) -> None:
+        self._generate(self._folio(1))  # Builds the compiled lookups.
+        _, small = self._generate(self._folio(1))
+        invoice, large = self._generate(self._folio(30))
+        self.assertEqual(small, large)
+
+        self.assertEqual(invoice.lines.count(), 30)
+        self.assertEqual(invoice.invoice_discounts.count(), 1)
+        self.assertEqual(invoice.subtotal, Decimal("3000.00"))
+        self.assertEqual(invoice.tax_total, Decimal("300.00"))
+        self.assertEqual(invoice.discount_total, Decimal("330.00"))
+        self.assertEqual(invoice.total, Decimal("2970.00"))
+
+
+class BatchInvoiceTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME")
+
+    def _folio(self, account: CorporateAccount | None, nights: int) -> Folio:
+        folio = Folio.objects.create(guest_name="Guest", corporate_account=account)
+        for _ in range(nights):
+            FolioItem.objects.create(
+                folio=folio, description="Room Night", item_type="room", unit_price=Decimal("90.00")
+            )
+        return folio
+
+    def test_batch_invoices_matching_folios(self) -> None:
+        billed = [self._folio(self.account, 2), self._folio(self.account, 1)]
+        empty = self._folio(self.account, 0)
+        other = self._folio(None, 1)
+
+        response = self.client.post(  # type: ignore[misc]
+            reverse("invoice-batch"),
+            {"corporate_account_id": self.account.pk},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+        self.assertEqual(response.data["created"], 2)  # type: ignore[index]
+        self.assertEqual(response.data["skipped"], 1)  # type: ignore[index]
+        self.assertEqual(response.data["failed"], 0)  # type: ignore[index]
+
+        self.assertEqual(Invoice.objects.get(folio=billed[0]).total, Decimal("180.00"))
+        self.assertEqual(Invoice.objects.get(folio=billed[1]).balance_due, Decimal("90.00"))
+        self.assertFalse(Invoice.objects.filter(folio__in=[empty, other]).exists())
+
+        out = StringIO()
+        call_command("generate_invoices", "--chunk-size", "1", stdout=out)
+        self.assertIn("Created 1 invoices", out.getvalue())
+        self.assertTrue(Invoice.objects.filter(folio=other).exists())
+
+    def test_folios_invoiced_meanwhile_are_skipped(self) -> None:
+        folios = [self._folio(self.account, 1) for _ in range(2)]
+        selected = billable_folios(corporate_account=self.account)
+        folio_ids = list(selected.order_by("pk").values_list("pk", flat=True))
+        # Another run invoices the second folio after this one selected it.
+        Invoice.objects.create(folio=folios[1])
+
+        results = invoicing._invoice_chunk(selected, folio_ids, None)
+        self.assertEqual([row["status"] for row in results], ["created", "skipped"])
+        self.assertEqual(Invoice.objects.filter(folio=folios[1]).count(), 1)
+
+    def test_a_failing_chunk_is_reported_per_folio(self) -> None:
+        folios = [self._folio(self.account, 1) for _ in range(2)]
+        real = invoicing.build_lines
+
+        def build_lines(invoice, items):
+            if invoice.folio_id == folios[0].pk:
+                raise ValueError("bad item")
+            return real(invoice, items)
+
+        patched = mock.patch.object(invoicing, "build_lines", build_lines)
+        with patched, self.assertLogs("billing.invoicing", "ERROR"):
+            results = generate_invoices(Folio.objects.filter(pk__in=[f.pk for f in folios]), chunk_size=1)
+
+        self.assertEqual(
+            [(row["folio_id"], row["status"]) for row in results],
+            [(folios[0].pk, "failed"), (folios[1].pk, "created")],
+        )
+        self.assertEqual(results[0]["detail"], "bad item")
+        self.assertFalse(Invoice.objects.filter(folio=folios[0]).exists())
@@ -0,0 +1,178 @@
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+from billing.models import (
+    Folio,
+    FolioItem,
+    Discount,
+    Invoice,
+    InvoiceAdjustment,
+    InvoiceDiscount,
+    LedgerEntry,
+    LedgerSnapshot,
+    Payment,
+    PaymentRefund,
+)
+
+
+@override_settings(LEDGER_SNAPSHOT_INTERVAL=3)
+class FolioLedgerTests(TestCase):
+    def setUp(self) -> None:
+        self.folio = Folio.objects.create(guest_name="Jane Roe")
+
+    def _charge(self, amount: str) -> FolioItem:
+        return FolioItem.objects.create(
+            folio=self.folio, description="Minibar", item_type="service", unit_price=Decimal(amount)
+        )
+
+    def test_entries_and_snapshots(self) -> None:
+        first = self._charge("10.00")
+        self._charge("20.00")
+        self.assertFalse(LedgerSnapshot.objects.exists())
+
+        invoice = Invoice.objects.create(folio=self.folio)
+        payment = Payment.objects.create(invoice=invoice, amount=Decimal("25.00"))
+        snapshot = LedgerSnapshot.objects.get()
+        self.assertEqual(snapshot.balance, Decimal("5.00"))
+        midpoint = timezone.now()
+
+        PaymentRefund.objects.create(payment=payment, amount=Decimal("5.00"))
+        InvoiceAdjustment.objects.create(
+            invoice=invoice,
+            adjustment_type=InvoiceAdjustment.AdjustmentType.CREDIT,
+            amount=Decimal("-2.00"),
+        )
+        first.unit_price = Decimal("15.00")
+        first.save()
+        first.delete()
+
+        types = list(LedgerEntry.objects.values_list("entry_type", "amount"))
+        self.assertEqual(
+            types,
+            [
+                ("charge", Decimal("10.00")),
+                ("charge", Decimal("20.00")),
+                ("payment", Decimal("-25.00")),
+                ("refund", Decimal("5.00")),
+                ("adjustment", Decimal("-2.00")),
+                ("charge", Decimal("5.00")),
+                ("charge", Decimal("-15.00")),
+            ],
+        )
+        self.assertEqual(LedgerSnapshot.objects.count(), 2)
+        self.assertEqual(self.folio.ledger_balance(), Decimal("-2.00"))
+        self.assertEqual(self.folio.ledger_balance(as_of=midpoint), Decimal("5.00"))
+
+    def test_deletes_append_reversals(self) -> None:
+        self._charge("100.00")
+        invoice = Invoice.objects.create(folio=self.folio)
+        discount = InvoiceDiscount.objects.create(
+            invoice=invoice, discount=Discount.objects.create(name="Promo", value=Decimal("10.00")), applied_amount=Decimal("10.00")
+        )
+        adjustment = InvoiceAdjustment.objects.create(
+            invoice=invoice, adjustment_type=InvoiceAdjustment.AdjustmentType.DEBIT, amount=Decimal("5.00")
+        )
+        payment = Payment.objects.create(invoice=invoice, amount=Decimal("60.00"))
+        refund = PaymentRefund.objects.create(payment=payment, amount=Decimal("20.00"))
+        self.assertEqual(self.folio.ledger_balance(), Decimal("55.00"))
+
+        refund.delete()
+        self.assertEqual(self.folio.ledger_balance(), Decimal("35.00"))
+        discount.delete()
+        adjustment.delete()
+        self.assertEqual(self.folio.ledger_balance(), Decimal("40.00"))
+        PaymentRefund.objects.create(payment=payment, amount=Decimal("20.00"))
+        payment.delete()
+        self.assertEqual(self.folio.ledger_balance(), Decimal("100.00"))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance_due, Decimal("0.00"))
+
+        second = Invoice.objects.create(folio=self.folio)
+        Payment.objects.create(invoice=second, amount=Decimal("100.00"))
+        InvoiceAdjustment.objects.create(
+            invoice=second, adjustment_type=InvoiceAdjustment.AdjustmentType.CREDIT, amount=Decimal("-3.00")
+        )
+        entries = LedgerEntry.objects.count()
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="clerk"))
+        client.delete(reverse("invoice-detail", kwargs={"pk": second.pk}))
+        self.assertFalse(Invoice.objects.filter(pk=second.pk).exists())
+        # Nothing was erased from the ledger; the deletion itself was appended.
+        self.assertEqual(LedgerEntry.objects.count(), entries + 1)
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.ledger_balance(), self.folio.total)
+
+        # Only deleting the folio itself takes its ledger with it.
+        self.assertTrue(LedgerSnapshot.objects.exists())
+        self.folio.delete()
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_append_locks_the_folio_before_inserting(self) -> None:
+        with mock.patch.object(
+            QuerySet, "select_for_update", autospec=True, side_effect=QuerySet.select_for_update
+        ) as lock:
+            self._charge("1.00")
+        self.assertIn(Folio, [call.args[0].model for call in lock.call_args_list])
+
+    def test_balance_endpoint(self) -> None:
+        self._charge("12.50")
+        client = APIClient()
+        client.force_authenticate(user=get_user_model().objects.create_user(username="clerk"))
+        response = client.get(reverse("folio-balance", kwargs={"pk": self.folio.pk}))
+        self.assertEqual(response.data["balance"], "12.50")  # type: ignore[attr-defined]
+        response = client.get(
+            reverse("folio-balance", kwargs={"pk": self.folio.pk}), {"as_of": "2000-01-01T00:00:00"}
+        )
+        self.assertEqual(response.data["balance"], "0.00")  # type: ignore[attr-defined]
+
+
+@override_settings(LEDGER_SNAPSHOT_INTERVAL=2)
+@skipUnlessDBFeature("has_select_for_update")
+class LedgerConcurrencyTests(TransactionTestCase):
+    def _entry(self, folio: Folio, amount: str) -> LedgerEntry:
+        return LedgerEntry(folio=folio, entry_type=LedgerEntry.EntryType.CHARGE, amount=Decimal(amount))
+
+    def test_snapshot_waits_for_an_earlier_uncommitted_append(self) -> None:
+        folio = Folio.objects.create(guest_name="Jane Roe")
+        inserted, released = threading.Event(), threading.Event()
+
+        def slow_append() -> None:
+            try:
+                with transaction.atomic():
+                    LedgerEntry.objects.append([self._entry(folio, "10.00")])
+                    inserted.set()
+                    released.wait(5)
+            finally:
+                connection.close()
+
+        def snapshotting_append() -> None:
+            try:
+                inserted.wait(5)
+                # Due for a snapshot; it must not be taken past the uncommitted entry.
+                LedgerEntry.objects.append([self._entry(folio, "1.00"), self._entry(folio, "2.00")])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=slow_append), threading.Thread(target=snapshotting_append)]
+        for thread in threads:
+            thread.start()
+        inserted.wait(5)
+        threads[1].join(0.5)
+        # The second append is blocked on the folio lock until the first commits.
+        self.assertTrue(threads[1].is_alive())
+        released.set()
+        for thread in threads:
+            thread.join()
+
+        snapshot = LedgerSnapshot.objects.get()
+        self.assertEqual(snapshot.balance, Decimal("13.00"))
+        self.assertEqual(folio.ledger_balance(), Decimal("13.00"))
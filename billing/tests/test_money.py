@@ -0,0 +1,19 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from billing import money
+
+
+class MoneyTests(SimpleTestCase):
+    def test_round_trip_uses_currency_exponent(self) -> None:
+        self.assertEqual(money.to_minor(Decimal("12.345"), "USD"), 1235)
+        self.assertEqual(money.from_minor(1235, "USD"), Decimal("12.35"))
+        self.assertEqual(money.to_minor(Decimal("1500.50"), "JPY"), 1501)
+        self.assertEqual(money.from_minor(1501, "JPY"), Decimal("1501.00"))
+
+    def test_multiply_and_percentage_round_half_away_from_zero(self) -> None:
+        self.assertEqual(money.multiply(3333, Decimal("1.50")), 5000)
+        self.assertEqual(money.percentage(3333, Decimal("7.50")), 250)
+        self.assertEqual(money.percentage(-3333, Decimal("7.50")), -250)
+        self.assertEqual(money.percentage(10, Decimal("5.00")), 1)
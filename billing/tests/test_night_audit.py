@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import (
+    Folio,
+    FolioItem,
+    Guest,
+    LedgerEntry,
+    NightAuditRun,
+    RatePlan,
+    Reservation,
+    TaxRule,
+)
+from billing.night_audit import NightAuditLocked, run_night_audit
+
+BUSINESS_DATE = date(2026, 3, 10)
+
+
+class NightAuditTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        tax_rule = TaxRule.objects.create(name="City tax", rate=Decimal("10.00"))
+        RatePlan.objects.create(code="BAR", name="Best available", nightly_rate="100.00", tax_rule=tax_rule)
+        self.guest = Guest.objects.create(first_name="Jane", last_name="Roe")
+        self.with_folio = self._reservation("R-1", "101")
+        self.folio = Folio.objects.create(reservation=self.with_folio, guest_name="Jane Roe")
+        self.without_folio = self._reservation("R-2", "102")
+        self.no_plan = self._reservation("R-3", "103", rate_plan="UNKNOWN")
+        self._reservation("R-4", "104", status=Reservation.ReservationStatus.BOOKED)
+        self._reservation("R-5", "105", check_out=BUSINESS_DATE)
+
+    def _reservation(self, number: str, room: str, **kwargs) -> Reservation:
+        fields = {
+            "guest": self.guest,
+            "reservation_number": number,
+            "room_number": room,
+            "rate_plan": "BAR",
+            "status": Reservation.ReservationStatus.CHECKED_IN,
+            "check_in": BUSINESS_DATE - timedelta(days=1),
+            "check_out": BUSINESS_DATE + timedelta(days=2),
+            **kwargs,
+        }
+        return Reservation.objects.create(**fields)
+
+    def test_posts_one_room_charge_per_in_house_reservation(self) -> None:
+        run = run_night_audit(BUSINESS_DATE, chunk_size=1)
+
+        self.assertEqual(run.status, NightAuditRun.RunStatus.COMPLETED)
+        self.assertEqual((run.posted, run.skipped), (2, 1))
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.total, Decimal("110.00"))
+        self.assertEqual(self.folio.ledger_balance(), Decimal("110.00"))
+        opened = Folio.objects.get(reservation=self.without_folio)
+        item = opened.items.get()
+        self.assertEqual(item.description, "Room 102 - Best available")
+        self.assertEqual(item.posted_at.date(), BUSINESS_DATE)
+        self.assertFalse(FolioItem.objects.filter(folio__reservation=self.no_plan).exists())
+
+    def test_rerun_posts_only_missing_charges(self) -> None:
+        run_night_audit(BUSINESS_DATE)
+        entries = LedgerEntry.objects.count()
+        self.assertEqual(run_night_audit(BUSINESS_DATE).posted, 2)
+        self.assertEqual(LedgerEntry.objects.count(), entries)
+
+        # A failed run is resumed: only the reservation that never got its charge is posted.
+        NightAuditRun.objects.update(status=NightAuditRun.RunStatus.FAILED)
+        FolioItem.objects.filter(folio=self.folio).delete()
+        run = run_night_audit(BUSINESS_DATE)
+        self.assertEqual((run.status, run.posted, run.skipped), ("completed", 1, 2))
+        self.assertEqual(FolioItem.objects.filter(source_reference__startswith="night-audit:").count(), 2)
+
+    def test_running_audit_holds_the_lock_until_its_lease_expires(self) -> None:
+        NightAuditRun.objects.create(
+            business_date=BUSINESS_DATE,
+            owner="other-node",
+            lease_expires_at=timezone.now() + timedelta(minutes=1),
+        )
+        with self.assertRaises(NightAuditLocked):
+            run_night_audit(BUSINESS_DATE)
+        response = self.client.post(  # type: ignore[misc]
+            reverse("night-audit"), {"business_date": BUSINESS_DATE.isoformat()}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)  # type: ignore[attr-defined]
+        self.assertFalse(FolioItem.objects.exists())
+
+        NightAuditRun.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(  # type: ignore[misc]
+            reverse("night-audit"), {"business_date": BUSINESS_DATE.isoformat()}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+        self.assertEqual(response.data["posted"], 2)  # type: ignore[index]
@@ -0,0 +1,94 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from billing.models import CorporateAccount, Guest, Reservation, WebhookEvent
+from billing.webhooks import process_pending
+
+
+class PMSIngestionTests(TestCase):
+    def setUp(self) -> None:
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME", discount_rate=Decimal("0"))
+        self.guest = Guest.objects.create(first_name="Jane", last_name="Roe", email="jane@example.com")
+
+    def _event(self, event_type: str = "reservation.modified", **payload) -> WebhookEvent:
+        return WebhookEvent.objects.create(
+            source=WebhookEvent.WebhookSource.PMS,
+            event_type=event_type,
+            payload={"event_type": event_type, **payload},
+        )
+
+    def _created(self, number: str, **kwargs) -> WebhookEvent:
+        payload = {
+            "reservation_number": number,
+            "check_in": "2026-05-01",
+            "check_out": "2026-05-04",
+            "room_number": "101",
+            "guest": {"first_name": "Jane", "last_name": "Roe", "email": "JANE@example.com"},
+            **kwargs,
+        }
+        return self._event("reservation.created", **payload)
+
+    def test_burst_is_folded_per_reservation_and_last_write_wins(self) -> None:
+        self._created("R-1", corporate_account_code="ACME")
+        self._event(reservation_number="R-1", room_number="202", rate_plan="BAR")
+        self._event(reservation_number="R-1", room_number="303")
+        self._created(
+            "R-2", guest={"first_name": "Ann", "last_name": "Lee", "email": "ann@example.com"}
+        )
+        self._event("reservation.cancelled", reservation_number="R-2")
+
+        self.assertEqual(process_pending(), {"processed": 5, "failed": 0})
+
+        first = Reservation.objects.get(reservation_number="R-1")
+        self.assertEqual((first.room_number, first.rate_plan), ("303", "BAR"))
+        self.assertEqual((first.guest, first.corporate_account), (self.guest, self.account))
+        second = Reservation.objects.get(reservation_number="R-2")
+        self.assertEqual(second.status, Reservation.ReservationStatus.CANCELLED)
+        self.assertEqual(second.guest.email, "ann@example.com")
+        self.assertEqual(Guest.objects.count(), 2)
+
+    def test_updates_keep_fields_they_leave_out(self) -> None:
+        reservation = Reservation.objects.create(
+            guest=self.guest,
+            reservation_number="R-1",
+            check_in=date(2026, 5, 1),
+            check_out=date(2026, 5, 3),
+            room_number="101",
+            notes="Late arrival",
+        )
+        self._event(reservation_number="R-1", check_out="2026-05-05", status="checked_in")
+        process_pending()
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.check_out, date(2026, 5, 5))
+        self.assertEqual(reservation.status, Reservation.ReservationStatus.CHECKED_IN)
+        self.assertEqual((reservation.notes, reservation.guest), ("Late arrival", self.guest))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_query_count_does_not_depend_on_event_count(self) -> None:
+        def run(count: int, prefix: str) -> int:
+            for index in range(count):
+                self._created(f"{prefix}-{index}", corporate_account_code="ACME")
+                self._event(reservation_number=f"{prefix}-{index}", room_number="505")
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(process_pending()["failed"], 0)
+            return len(queries)
+
+        self.assertEqual(run(2, "A"), run(40, "B"))
+        self.assertEqual(Reservation.objects.filter(room_number="505").count(), 42)
+
+    def test_invalid_events_fail(self) -> None:
+        unknown_account = self._created("R-1", corporate_account_code="NOPE")
+        incomplete = self._event("reservation.created", reservation_number="R-2", room_number="1")
+        backwards = self._created("R-3", check_out="2026-04-30")
+
+        self.assertEqual(process_pending(), {"processed": 0, "failed": 3})
+        notes = dict(WebhookEvent.objects.values_list("pk", "notes"))
+        self.assertEqual(notes[unknown_account.pk], "Unknown corporate account NOPE.")
+        self.assertEqual(notes[incomplete.pk], "Reservation R-2 is missing check_in, check_out, guest.")
+        self.assertEqual(notes[backwards.pk], "Reservation R-3 must check out after it checks in.")
+        self.assertFalse(Reservation.objects.exists())
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from billing.models import (
+    CorporateAccount,
+    Folio,
+    FolioItem,
+    Guest,
+    LedgerEntry,
+    Reservation,
+    TaxRule,
+    WebhookEvent,
+)
+from billing.webhooks import process_pending
+
+
+class POSIngestionTests(TestCase):
+    def setUp(self) -> None:
+        self.tax_rule = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"))
+        guest = Guest.objects.create(first_name="Jane", last_name="Roe")
+        reservation = Reservation.objects.create(
+            guest=guest,
+            reservation_number="R-1",
+            room_number="101",
+            status=Reservation.ReservationStatus.CHECKED_IN,
+            check_in=date.today() - timedelta(days=1),
+            check_out=date.today() + timedelta(days=1),
+        )
+        self.room_folio = Folio.objects.create(reservation=reservation, guest_name="Jane Roe")
+        self.folio = Folio.objects.create(guest_name="John Doe")
+
+    def _event(self, **payload) -> WebhookEvent:
+        return WebhookEvent.objects.create(
+            source=WebhookEvent.WebhookSource.POS, event_type="check.closed", payload=payload
+        )
+
+    def _line(self, price: str, **kwargs) -> dict:
+        return {"description": "Dinner", "unit_price": price, "tax_rule_id": self.tax_rule.pk, **kwargs}
+
+    def test_checks_are_posted_to_room_and_numbered_folios(self) -> None:
+        by_room = self._event(check_id="C-1", outlet="Bistro", room_number="101", lines=[self._line("20.00")])
+        self._event(check_id="C-2", outlet="Bistro", room_number="101", lines=[self._line("5.00", quantity="2")])
+        self._event(check_id="C-3", folio_number=self.folio.folio_number, lines=[self._line("30.00")])
+
+        self.assertEqual(process_pending(), {"processed": 3, "failed": 0})
+
+        self.room_folio.refresh_from_db()
+        self.assertEqual(self.room_folio.total, Decimal("33.00"))
+        self.assertEqual(self.room_folio.ledger_balance(), Decimal("33.00"))
+        item = FolioItem.objects.get(source_reference="pos:Bistro:C-1:0")
+        self.assertEqual(item.description, "Bistro: Dinner")
+        self.assertEqual(item.posted_at, by_room.created_at)
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.total, Decimal("33.00"))
+        self.assertFalse(WebhookEvent.objects.exclude(status=WebhookEvent.EventStatus.PROCESSED).exists())
+
+    def test_redelivered_checks_are_not_charged_twice(self) -> None:
+        check = {"check_id": "C-1", "room_number": "101", "lines": [self._line("20.00")]}
+        self._event(**check)
+        self._event(**check)
+        process_pending()
+        self._event(**check)
+        out = StringIO()
+        call_command("process_webhooks", "--source", "pos", stdout=out)
+        self.assertIn("Processed 1 events, 0 failed", out.getvalue())
+
+        self.assertEqual(FolioItem.objects.filter(folio=self.room_folio).count(), 1)
+        self.assertEqual(LedgerEntry.objects.filter(folio=self.room_folio).count(), 2)
+
+    def test_invalid_checks_fail_without_blocking_the_batch(self) -> None:
+        account = CorporateAccount.objects.create(
+            name="Acme", code="ACME", credit_limit=Decimal("10.00"), enforce_credit_limit=True
+        )
+        limited = Folio.objects.create(guest_name="Acme guest", corporate_account=account)
+        unknown_room = self._event(room_number="999", lines=[self._line("10.00")])
+        bad_line = self._event(folio_number=self.folio.folio_number, lines=[{"description": "Tea"}])
+        over_limit = self._event(folio_number=limited.folio_number, lines=[self._line("50.00")])
+        self._event(folio_number=self.folio.folio_number, lines=[self._line("10.00")])
+
+        self.assertEqual(process_pending(), {"processed": 1, "failed": 3})
+
+        notes = dict(WebhookEvent.objects.values_list("pk", "notes"))
+        self.assertEqual(notes[unknown_room.pk], "No open folio for room 999.")
+        self.assertIn("unit_price", notes[bad_line.pk])
+        self.assertEqual(notes[over_limit.pk], "Charges exceed the credit limit of ACME.")
+        self.assertEqual(FolioItem.objects.get().folio, self.folio)
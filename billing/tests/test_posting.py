@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import CorporateAccount, Folio, FolioItem, FolioItemTax, LedgerEntry, TaxRule
+
+
+class BulkPostingTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.tax_rule = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"))
+        self.folio = Folio.objects.create(guest_name="Jane Roe")
+        self.other = Folio.objects.create(guest_name="John Doe")
+
+    def _item(self, price: str, **kwargs) -> dict:
+        return {
+            "description": "Minibar",
+            "item_type": "service",
+            "unit_price": price,
+            "tax_rule_id": self.tax_rule.pk,
+            **kwargs,
+        }
+
+    def _post_to_folio(self, items: list[dict]):
+        return self.client.post(  # type: ignore[misc]
+            reverse("folio-bulk-items", kwargs={"pk": self.folio.pk}), {"items": items}, format="json"
+        )
+
+    def test_bulk_post_to_one_folio(self) -> None:
+        response = self._post_to_folio([self._item("10.00"), self._item("5.00", quantity="2.00")])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertEqual(response.data["created"], 2)  # type: ignore[index]
+        self.assertEqual(
+            response.data["folios"],  # type: ignore[index]
+            [{"folio_id": self.folio.pk, "subtotal": "20.00", "tax_total": "2.00", "total": "22.00"}],
+        )
+        self.assertEqual(FolioItemTax.objects.filter(folio_item__folio=self.folio).count(), 2)
+        self.assertEqual(LedgerEntry.objects.filter(folio=self.folio).count(), 4)
+        self.assertEqual(self.folio.ledger_balance(), Decimal("22.00"))
+
+    def test_query_count_does_not_depend_on_item_count(self) -> None:
+        def run(count: int) -> int:
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post_to_folio([self._item("1.00")] * count)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+            return len(queries)
+
+        run(1)  # Builds the compiled lookups.
+        self.assertEqual(run(2), run(40))
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.total, Decimal("47.30"))
+
+    def test_cross_folio_posting_and_validation(self) -> None:
+        url = reverse("folio-bulk-post")
+        items = [self._item("10.00", folio_id=self.folio.pk), self._item("20.00", folio_id=self.other.pk)]
+        response = self.client.post(url, {"items": items}, format="json")  # type: ignore[misc]
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertEqual(FolioItem.objects.filter(folio=self.other).get().tax_amount, Decimal("2.00"))
+
+        bad = [self._item("1.00", folio_id=self.folio.pk), self._item("1.00", folio_id=0, tax_rule_id=0)]
+        response = self.client.post(url, {"items": bad}, format="json")  # type: ignore[misc]
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+        errors = response.data["items"]  # type: ignore[index]
+        self.assertEqual(errors[0], {})
+        self.assertEqual(set(errors[1]), {"folio_id", "tax_rule_id"})
+        self.assertEqual(FolioItem.objects.count(), 2)
+
+    def test_credit_limit_applies_to_the_whole_batch(self) -> None:
+        account = CorporateAccount.objects.create(name="Acme", code="ACME", credit_limit=Decimal("50.00"))
+        self.folio.corporate_account = account
+        self.folio.save()
+
+        response = self._post_to_folio([self._item("20.00"), self._item("30.00")])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+        self.assertEqual(response.data["corporate_accounts"], ["ACME"])  # type: ignore[index]
+        self.assertFalse(FolioItem.objects.exists())
+
+        account.enforce_credit_limit = False
+        account.save()
+        response = self._post_to_folio([self._item("20.00"), self._item("30.00")])
+        self.assertEqual(response.data["credit_limit_exceeded"], ["ACME"])  # type: ignore[index]
+        account.refresh_from_db()
+        self.assertEqual(account.exposure, Decimal("55.00"))
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import CorporateAccount, Folio, Invoice, InvoiceLine, LedgerEntry, Payment
+from billing.remittances import allocate_oldest_first, allocate_pro_rata
+
+
+class RemittanceTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME")
+        self.folio = Folio.objects.create(guest_name="Group", corporate_account=self.account)
+        now = timezone.now()
+        self.invoices = [
+            self._invoice(amount, now - timedelta(days=days))
+            for amount, days in (("100.00", 30), ("200.00", 20), ("300.00", 10))
+        ]
+
+    def _invoice(self, amount: str, issued_at) -> Invoice:
+        invoice = Invoice.objects.create(folio=self.folio, issued_at=issued_at)
+        InvoiceLine.objects.create(
+            invoice=invoice, description="Stay", unit_price=Decimal(amount), net_amount=Decimal(amount)
+        )
+        invoice.recalculate_totals()
+        return invoice
+
+    def _remit(self, payload: dict):
+        return self.client.post(reverse("payment-remittance"), payload, format="json")  # type: ignore[misc]
+
+    def _balances(self) -> list[Decimal]:
+        return [Invoice.objects.get(pk=invoice.pk).balance_due for invoice in self.invoices]
+
+    def test_allocators_split_exactly(self) -> None:
+        balances = [(1, 100), (2, 200), (3, 300)]
+        self.assertEqual(allocate_oldest_first(250, balances), {1: 100, 2: 150})
+        self.assertEqual(allocate_pro_rata(100, balances), {1: 17, 2: 33, 3: 50})
+        self.assertEqual(allocate_pro_rata(1000, balances), {1: 100, 2: 200, 3: 300})
+
+    def test_allocators_skip_settled_invoices(self) -> None:
+        balances = [(1, 0), (2, -5), (3, 300)]
+        self.assertEqual(allocate_oldest_first(250, balances), {3: 250})
+        self.assertEqual(allocate_pro_rata(298, balances), {3: 298})
+
+    def test_oldest_first_remittance(self) -> None:
+        response = self._remit(
+            {"amount": "450.00", "corporate_account_id": self.account.pk, "reference": "WIRE-1"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertEqual(response.data["allocated"], "450.00")  # type: ignore[index]
+        self.assertEqual(response.data["unallocated"], "0.00")  # type: ignore[index]
+        self.assertEqual(self._balances(), [Decimal("0.00"), Decimal("0.00"), Decimal("150.00")])
+        self.assertEqual(Payment.objects.filter(reference="WIRE-1").count(), 3)
+        self.assertEqual(
+            LedgerEntry.objects.filter(entry_type=LedgerEntry.EntryType.PAYMENT).count(), 3
+        )
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.exposure, Decimal("-450.00"))
+
+    def test_pro_rata_and_overpayment(self) -> None:
+        response = self._remit(
+            {"amount": "700.00", "method": "pro_rata", "corporate_account_id": self.account.pk}
+        )
+        self.assertEqual(response.data["unallocated"], "100.00")  # type: ignore[index]
+        self.assertEqual(self._balances(), [Decimal("0.00")] * 3)
+
+    def test_explicit_allocation(self) -> None:
+        first, second, _ = self.invoices
+        response = self._remit(
+            {
+                "amount": "60.00",
+                "method": "explicit",
+                "allocations": [
+                    {"invoice_id": first.pk, "amount": "10.00"},
+                    {"invoice_id": second.pk, "amount": "50.00"},
+                ],
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # type: ignore[attr-defined]
+        self.assertEqual(self._balances()[:2], [Decimal("90.00"), Decimal("150.00")])
+
+        response = self._remit(
+            {
+                "amount": "500.00",
+                "method": "explicit",
+                "allocations": [{"invoice_id": first.pk, "amount": "500.00"}],
+            }
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+        self.assertEqual(Payment.objects.count(), 2)
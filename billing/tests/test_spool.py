@@ -0,0 +1,77 @@
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.models import WebhookEvent
+from billing.spool import flush_spool, spool_event
+
+
+class WebhookSpoolTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        settings = override_settings(WEBHOOK_SPOOL_DIR=str(self.root))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_events_are_acknowledged_before_they_are_inserted(self) -> None:
+        for number in range(3):
+            response = self.client.post(  # type: ignore[misc]
+                reverse("webhooks-pos"), {"event_type": "check.closed", "check_id": number}, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)  # type: ignore[attr-defined]
+        self.assertFalse(WebhookEvent.objects.exists())
+        self.assertEqual(len(os.listdir(self.root / "new")), 3)
+
+        out = StringIO()
+        call_command("flush_webhook_spool", "--once", "--batch-size", "2", stdout=out)
+
+        self.assertIn("Flushed 3 events.", out.getvalue())
+        events = WebhookEvent.objects.order_by("pk")
+        self.assertEqual([event.payload["check_id"] for event in events], [0, 1, 2])
+        self.assertEqual({event.source for event in events}, {WebhookEvent.WebhookSource.POS})
+        self.assertEqual(os.listdir(self.root / "new") + os.listdir(self.root / "cur"), [])
+
+    def test_flush_recovers_claimed_files_and_sets_aside_bad_ones(self) -> None:
+        name = spool_event(WebhookEvent.WebhookSource.PMS, "reservation.created", {"n": 1})
+        # A flusher that crashed after claiming the file, before inserting it.
+        os.rename(self.root / "new" / name, self.root / "cur" / name)
+        spool_event(WebhookEvent.WebhookSource.PMS, "reservation.modified", {"n": 2})
+        (self.root / "new" / "0.garbled").write_text("{not json")
+        stale = self.root / "tmp" / "0.unfinished"
+        stale.write_text("{")
+        os.utime(stale, (0, 0))
+
+        with self.assertLogs("billing.spool", "ERROR"):
+            self.assertEqual(flush_spool(), 2)
+
+        self.assertEqual(
+            list(WebhookEvent.objects.order_by("pk").values_list("event_type", flat=True)),
+            ["reservation.created", "reservation.modified"],
+        )
+        self.assertEqual(os.listdir(self.root / "bad"), ["0.garbled"])
+        self.assertFalse(stale.exists())
+
+    def test_duplicate_deliveries_are_flushed_once(self) -> None:
+        payload = {"event_type": "check.closed", "check_id": "C-1"}
+        for _ in range(2):
+            self.client.post(reverse("webhooks-pos"), payload, format="json")  # type: ignore[misc]
+        name = spool_event(WebhookEvent.WebhookSource.POS, "check.closed", {"check_id": "C-2"})
+        # A flusher that crashed after inserting the file, before deleting it.
+        flush_spool()
+        (self.root / "cur" / name).write_text(
+            '{"source": "pos", "event_type": "check.closed", "payload": {"check_id": "C-2"}}'
+        )
+
+        self.assertEqual(flush_spool(), 1)
+        self.assertEqual(WebhookEvent.objects.count(), 2)
@@ -0,0 +1,199 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing.invoicing import populate_invoice
+from billing.models import CorporateAccount, Folio, FolioItem, Invoice, TaxRule
+from billing.taxes import apply_taxes, tax_table
+
+
+class TaxEngineTests(TestCase):
+    def setUp(self) -> None:
+        self.folio = Folio.objects.create(guest_name="Jane Roe")
+
+    def _item(self, price: str, item_type: str = "room", **kwargs) -> FolioItem:
+        return FolioItem.objects.create(
+            folio=self.folio,
+            description="Charge",
+            item_type=item_type,
+            unit_price=Decimal(price),
+            **kwargs,
+        )
+
+    def test_stacked_and_compound_taxes(self) -> None:
+        city = TaxRule.objects.create(name="City", rate=Decimal("2.00"), item_type="room", auto_apply=True)
+        TaxRule.objects.create(name="State", rate=Decimal("5.00"), auto_apply=True)
+        TaxRule.objects.create(
+            name="Occupancy", rate=Decimal("3.00"), item_type="room", auto_apply=True, compound=True, priority=10
+        )
+
+        room = self._item("100.00")
+        self.assertEqual(room.line_total, Decimal("100.00"))
+        # 2.00 + 5.00, then 3% of 107.00 = 3.21.
+        self.assertEqual(room.tax_amount, Decimal("10.21"))
+        self.assertEqual(
+            list(room.taxes.values_list("tax_rule__name", "taxable_amount", "amount")),
+            [
+                ("City", Decimal("100.00"), Decimal("2.00")),
+                ("State", Decimal("100.00"), Decimal("5.00")),
+                ("Occupancy", Decimal("107.00"), Decimal("3.21")),
+            ],
+        )
+        service = self._item("10.00", item_type="service", tax_rule=city)
+        self.assertEqual(service.tax_amount, Decimal("0.70"))
+
+        self.folio.refresh_from_db()
+        self.assertEqual(self.folio.tax_total, Decimal("10.91"))
+
+    def test_inclusive_tax_is_taken_out_of_the_price(self) -> None:
+        TaxRule.objects.create(name="VAT", rate=Decimal("10.00"), inclusive=True, auto_apply=True)
+        TaxRule.objects.create(name="Service", rate=Decimal("5.00"), auto_apply=True, item_type="service")
+
+        room = self._item("100.00")
+        self.assertEqual((room.line_total, room.tax_amount), (Decimal("90.91"), Decimal("9.09")))
+        service = self._item("110.00", item_type="service")
+        self.assertEqual((service.line_total, service.tax_amount), (Decimal("100.00"), Decimal("15.00")))
+
+    def test_rules_follow_validity_dates_and_edits(self) -> None:
+        today = timezone.localdate()
+        rule = TaxRule.objects.create(
+            name="Levy", rate=Decimal("4.00"), auto_apply=True, valid_from=today - timedelta(days=30)
+        )
+        old = self._item("50.00", posted_at=timezone.now() - timedelta(days=60))
+        self.assertEqual(old.tax_amount, Decimal("0.00"))
+        self.assertEqual(self._item("50.00").tax_amount, Decimal("2.00"))
+
+        rule.rate = Decimal("6.00")
+        rule.save()
+        self.assertEqual(self._item("50.00").tax_amount, Decimal("3.00"))
+        rule.delete()
+        self.assertEqual(self._item("50.00").tax_amount, Decimal("0.00"))
+
+    def test_batches_are_taxed_from_the_cached_table(self) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            TaxRule.objects.create(name="State", rate=Decimal("5.00"), auto_apply=True)
+        items = [
+            FolioItem(folio=self.folio, description="Charge", item_type="room", unit_price=Decimal(price))
+            for price in ("10.00", "20.00", "30.00")
+        ]
+        tax_table()
+        # Only the cache token is read.
+        with self.assertNumQueries(1):
+            rows = apply_taxes(items)
+        self.assertEqual([row.amount for row in rows], [Decimal("0.50"), Decimal("1.00"), Decimal("1.50")])
+        self.assertEqual(items[2].tax_amount, Decimal("1.50"))
+
+
+class TaxSimulationTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.admin = User.objects.create_superuser(
+            username="admin",
+            email="admin@example.com",
+            password="Str0ngPass!",
+        )
+        self.client.force_authenticate(user=self.admin)  # type: ignore[attr-defined]
+        self.vat = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"))
+        self.city = TaxRule.objects.create(name="City", rate=Decimal("5.00"))
+        self.account = CorporateAccount.objects.create(name="Acme", code="ACME")
+
+        corporate = Folio.objects.create(guest_name="Jane Roe", corporate_account=self.account)
+        walk_in = Folio.objects.create(guest_name="John Doe", currency="JPY")
+        closed = Folio.objects.create(guest_name="Old Guest", status=Folio.FolioStatus.CLOSED)
+        for folio, price, rule in (
+            (corporate, "100.05", self.vat),
+            (corporate, "40.00", self.city),
+            (walk_in, "1005", self.vat),
+            (closed, "500.00", self.vat),
+        ):
+            FolioItem.objects.create(
+                folio=folio, description="Charge", item_type="service", unit_price=Decimal(price), tax_rule=rule
+            )
+
+    def test_simulation_breaks_down_by_rule_and_account(self) -> None:
+        response = self.client.post(  # type: ignore[misc]
+            reverse("config-tax-simulate"),
+            {"changes": [{"tax_rule_id": self.vat.pk, "rate": "12.50"}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+        data = response.data  # type: ignore[attr-defined]
+        # USD rounds to cents and JPY to whole yen: 10.005 -> 10.01, 12.50625 -> 12.51,
+        # 100.5 -> 101 and 125.625 -> 126. The closed folio and the City rule are ignored.
+        jpy, usd = data["currencies"]
+        self.assertEqual((jpy["currency"], usd["currency"]), ("JPY", "USD"))
+        self.assertEqual((usd["item_count"], jpy["item_count"]), (1, 1))
+        self.assertEqual((usd["current_tax"], usd["proposed_tax"]), ("10.01", "12.51"))
+        self.assertEqual((jpy["current_tax"], jpy["proposed_tax"]), ("101.00", "126.00"))
+        self.assertEqual(jpy["difference"], "25.00")
+
+        [vat] = usd["by_tax_rule"]
+        self.assertEqual(vat["proposed_rate"], "12.50")
+        self.assertEqual(vat["taxable_amount"], "100.05")
+
+        [corporate] = usd["by_corporate_account"]
+        self.assertEqual(corporate["corporate_account"], "ACME")
+        self.assertEqual(corporate["difference"], "2.50")
+        [walk_in] = jpy["by_corporate_account"]
+        self.assertIsNone(walk_in["corporate_account_id"])
+        self.assertEqual(walk_in["proposed_tax"], "126.00")
+
+        self.vat.refresh_from_db()
+        self.assertEqual(self.vat.rate, Decimal("10.00"))
+
+    def test_simulation_rejects_inclusive_rules(self) -> None:
+        self.city.inclusive = True
+        self.city.save()
+        response = self.client.post(  # type: ignore[misc]
+            reverse("config-tax-simulate"),
+            {"changes": [{"tax_rule_id": self.city.pk, "rate": "8.00"}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+        self.assertIn("City", str(response.data["changes"]))  # type: ignore[index]
+
+    def test_simulation_rejects_duplicate_rules(self) -> None:
+        change = {"tax_rule_id": self.vat.pk, "rate": "12.00"}
+        response = self.client.post(  # type: ignore[misc]
+            reverse("config-tax-simulate"), {"changes": [change, change]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)  # type: ignore[attr-defined]
+
+
+class TaxSummaryReportTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def setUp(self) -> None:
+        clerk = get_user_model().objects.create_user(username="clerk")
+        self.client.force_authenticate(user=clerk)  # type: ignore[attr-defined]
+
+    def _report(self) -> list[tuple[str, str, str]]:
+        rows = self.client.get(reverse("reports-tax")).data  # type: ignore[misc,attr-defined]
+        return [(row["tax_rule"], row["taxable_amount"], row["tax_amount"]) for row in rows]
+
+    def test_issued_periods_ignore_later_item_changes(self) -> None:
+        vat = TaxRule.objects.create(name="VAT", rate=Decimal("10.00"), auto_apply=True)
+        TaxRule.objects.create(name="City", rate=Decimal("2.00"), item_type="room", auto_apply=True)
+        folio = Folio.objects.create(guest_name="Jane Roe")
+        room, service = (
+            FolioItem.objects.create(folio=folio, description="Charge", item_type=item_type, unit_price=Decimal(price))
+            for item_type, price in (("room", "100.00"), ("service", "20.00"))
+        )
+        populate_invoice(Invoice.objects.create(folio=folio))
+        issued = [("City", "100.00", "2.00"), ("VAT", "120.00", "12.00")]
+        self.assertEqual(self._report(), issued)
+
+        room.unit_price = Decimal("300.00")
+        room.save()
+        service.delete()
+        vat.name = "Sales Tax"
+        vat.save()
+        self.assertEqual(self._report(), issued)
@@ -0,0 +1,142 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from billing import webhooks
+from billing.models import WebhookEvent
+from billing.webhooks import claim_batch, process_pending
+
+EventStatus = WebhookEvent.EventStatus
+POS = WebhookEvent.WebhookSource.POS
+
+
+class WebhookWorkerTests(TestCase):
+    def _events(self, count: int) -> list[WebhookEvent]:
+        return [WebhookEvent.objects.create(source=POS, payload={"n": n}) for n in range(count)]
+
+    def test_workers_claim_disjoint_batches(self) -> None:
+        events = self._events(5)
+        first = claim_batch("worker-a", batch_size=3)
+        second = claim_batch("worker-b", batch_size=3)
+
+        self.assertEqual([event.pk for event in first], [event.pk for event in events[:3]])
+        self.assertEqual([event.pk for event in second], [event.pk for event in events[3:]])
+        self.assertEqual(claim_batch("worker-c"), [])
+
+        # A worker that died mid-batch loses its events once the lease expires.
+        WebhookEvent.objects.filter(locked_by="worker-a").update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(len(claim_batch("worker-c")), 3)
+
+    def test_failed_events_back_off_and_become_dead_letters(self) -> None:
+        (event,) = self._events(1)
+        failing = mock.patch.dict(webhooks.HANDLERS, {POS: lambda batch: {e.pk: "Unknown folio." for e in batch}})
+        with failing:
+            self.assertEqual(process_pending(), {"processed": 0, "failed": 1})
+            event.refresh_from_db()
+            self.assertEqual((event.status, event.attempts, event.notes), (EventStatus.FAILED, 1, "Unknown folio."))
+            self.assertEqual(event.locked_by, "")
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=25))
+            # Not due yet.
+            self.assertEqual(process_pending(), {"processed": 0, "failed": 0})
+
+            for _ in range(webhooks.MAX_ATTEMPTS - 1):
+                WebhookEvent.objects.update(next_attempt_at=timezone.now())
+                process_pending()
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (EventStatus.DEAD, webhooks.MAX_ATTEMPTS))
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(process_pending(), {"processed": 0, "failed": 0})
+
+    def test_handler_crash_only_charges_the_event_that_raised(self) -> None:
+        bad = self._events(3)[1]
+
+        def crash(batch):
+            WebhookEvent.objects.filter(pk__in=[e.pk for e in batch]).update(notes="handled")
+            if any(event.pk == bad.pk for event in batch):
+                raise RuntimeError("database went away")
+            return {}
+
+        with mock.patch.dict(webhooks.HANDLERS, {POS: crash}), self.assertLogs("billing.webhooks", "ERROR"):
+            self.assertEqual(process_pending(), {"processed": 2, "failed": 1})
+
+        self.assertEqual(
+            set(WebhookEvent.objects.exclude(pk=bad.pk).values_list("status", "notes", "attempts")),
+            {(EventStatus.PROCESSED, "handled", 0)},
+        )
+        bad.refresh_from_db()
+        self.assertEqual(
+            (bad.status, bad.notes, bad.attempts),
+            (EventStatus.FAILED, "RuntimeError: database went away", 1),
+        )
+
+    def test_lease_is_renewed_and_a_lost_lease_is_left_alone(self) -> None:
+        first, second = self._events(2)
+        events = claim_batch("worker-a")
+        # worker-a stalled until its lease lapsed, and worker-b took over the second event.
+        WebhookEvent.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        WebhookEvent.objects.filter(pk=second.pk).update(
+            locked_by="worker-b", locked_until=timezone.now() + webhooks.LEASE
+        )
+        leases = []
+
+        def handler(batch):
+            held = WebhookEvent.objects.filter(pk__in=[e.pk for e in batch])
+            leases.extend(held.values_list("locked_until", flat=True))
+            return {}
+
+        with mock.patch.dict(webhooks.HANDLERS, {POS: handler}):
+            self.assertEqual(webhooks.process_batch(events, "worker-a"), {"processed": 1, "failed": 0})
+
+        [lease] = leases
+        self.assertGreater(lease, timezone.now() + webhooks.LEASE - timedelta(minutes=1))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, EventStatus.PROCESSED)
+        self.assertEqual((second.status, second.locked_by), (EventStatus.PROCESSING, "worker-b"))
+
+    def test_backoff_is_exponential_and_capped(self) -> None:
+        self.assertEqual(webhooks.backoff(1), timedelta(seconds=30))
+        self.assertEqual(webhooks.backoff(3), timedelta(minutes=2))
+        self.assertEqual(webhooks.backoff(20), webhooks.MAX_BACKOFF)
+
+
+class WebhookDeduplicationTests(APITestCase):
+    client: APIClient  # type: ignore[assignment]
+
+    def _post(self, name: str, payload: dict, **headers):
+        return self.client.post(reverse(name), payload, format="json", headers=headers)  # type: ignore[misc]
+
+    def test_redelivered_payload_is_acknowledged_without_a_second_row(self) -> None:
+        payload = {"event_type": "check.closed", "check_id": "C-1", "lines": []}
+        first = self._post("webhooks-pos", payload)
+        with CaptureQueriesContext(connection) as queries:
+            again = self._post("webhooks-pos", {"lines": [], "check_id": "C-1", "event_type": "check.closed"})
+
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)  # type: ignore[attr-defined]
+        self.assertEqual(again.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+        self.assertEqual(again.data["id"], first.data["id"])  # type: ignore[index]
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        # The same payload from another source is a different event.
+        self.assertEqual(self._post("webhooks-pms", payload).status_code, status.HTTP_202_ACCEPTED)  # type: ignore[attr-defined]
+
+    def test_provider_event_id_identifies_the_delivery(self) -> None:
+        gateway = "webhooks-payment"
+        self._post(gateway, {"id": "WH-1", "event_type": "PAYMENT.CAPTURE.COMPLETED", "attempt": 1})
+        retried = self._post(gateway, {"id": "WH-1", "event_type": "PAYMENT.CAPTURE.COMPLETED", "attempt": 2})
+        by_header = self._post("webhooks-pos", {"n": 1}, **{"X-Event-Id": "E-9"})
+        same_header = self._post("webhooks-pos", {"n": 2}, **{"X-Event-Id": "E-9"})
+
+        self.assertEqual(retried.status_code, status.HTTP_200_OK)  # type: ignore[attr-defined]
+        self.assertEqual(retried.data["dedup_key"], "id:WH-1")  # type: ignore[index]
+        self.assertEqual(same_header.data["id"], by_header.data["id"])  # type: ignore[index]
+        self.assertEqual(WebhookEvent.objects.count(), 2)
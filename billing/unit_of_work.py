@@ -0,0 +1,77 @@
+"""
+Deferred invoice recalculation scoped to a transaction.
+
+Code that changes lines, discounts, adjustments or payments marks the
+invoice dirty instead of recalculating it straight away. Inside
+``unit_of_work()`` every dirty invoice is recalculated exactly once, in a
+single UPDATE, just before the transaction commits; outside of one the
+recalculation happens immediately, as before.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from .models import Invoice
+
+
+_state = threading.local()
+
+
+def _pending() -> dict | None:
+	return getattr(_state, "pending", None)
+
+
+@contextmanager
+def unit_of_work():
+	"""Open an atomic block that recalculates the invoices marked dirty in it once.
+
+	Nested blocks join the outermost unit of work, so the flush happens only
+	when the outermost block exits without an error.
+	"""
+	if _pending() is not None:
+		with transaction.atomic():
+			yield
+		return
+
+	_state.pending = {}
+	try:
+		with transaction.atomic():
+			yield
+			_flush(_state.pending)
+	finally:
+		_state.pending = None
+
+
+def mark_invoice_dirty(invoice: Invoice | int) -> None:
+	"""Schedule an invoice (instance or primary key) for total recalculation."""
+	pending = _pending()
+	if pending is None:
+		if isinstance(invoice, Invoice):
+			invoice.recalculate_totals()
+		else:
+			Invoice.objects.filter(pk=invoice).recalculate_totals()
+		return
+
+	if isinstance(invoice, Invoice):
+		pending.setdefault(invoice.pk, []).append(invoice)
+	else:
+		pending.setdefault(invoice, [])
+
+
+def _flush(pending: dict) -> None:
+	if not pending:
+		return
+	invoices = Invoice.objects.filter(pk__in=list(pending))
+	invoices.recalculate_totals()
+
+	# Bring the instances handed to mark_invoice_dirty() up to date in one read.
+	tracked = [pk for pk, instances in pending.items() if instances]
+	if not tracked:
+		return
+	rows = Invoice.objects.filter(pk__in=tracked).values("pk", "updated_at", *Invoice.TOTAL_FIELDS)
+	for row in rows:
+		pk = row.pop("pk")
+		for instance in pending[pk]:
+			for field, value in row.items():
+				setattr(instance, field, value)
@@ -8,12 +8,14 @@ from .views import (
     FolioViewSet,
     GuestViewSet,
     InvoiceViewSet,
+    NightAuditView,
     OutstandingReportView,
     PMSWebhookView,
     POSWebhookView,
     PaymentGatewayWebhookView,
     PaymentMethodViewSet,
     PaymentViewSet,
+    RatePlanViewSet,
     ReservationViewSet,
     TaxRuleViewSet,
     TaxSummaryReportView,
@@ -32,6 +34,7 @@ router.register(r"payments", PaymentViewSet, basename="payment")
 router.register(r"discounts", DiscountViewSet, basename="discount")
 router.register(r"corporates", CorporateAccountViewSet, basename="corporate")
 router.register(r"config/taxes", TaxRuleViewSet, basename="config-tax")
+router.register(r"config/rate-plans", RatePlanViewSet, basename="config-rate-plan")
 router.register(r"config/payment-methods", PaymentMethodViewSet, basename="config-payment-method")
 
 urlpatterns = [
@@ -39,6 +42,7 @@ urlpatterns = [
     path("reports/daily", DailyReportView.as_view(), name="reports-daily"),
     path("reports/tax-summary", TaxSummaryReportView.as_view(), name="reports-tax"),
     path("reports/outstanding", OutstandingReportView.as_view(), name="reports-outstanding"),
+    path("night-audit", NightAuditView.as_view(), name="night-audit"),
     path("webhooks/pms", PMSWebhookView.as_view(), name="webhooks-pms"),
     path("webhooks/pos", POSWebhookView.as_view(), name="webhooks-pos"),
     path("webhooks/payment-gateway", PaymentGatewayWebhookView.as_view(), name="webhooks-payment"),
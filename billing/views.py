@@ -2,10 +2,12 @@ from datetime import date
 from decimal import Decimal
 from io import BytesIO
 
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F, Sum
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 from drf_spectacular.types import OpenApiTypes
 from reportlab.pdfgen import canvas
@@ -21,33 +23,59 @@ from .models import (
 	FolioItem,
 	Invoice,
 	InvoiceAdjustment,
-	InvoiceLine,
+	InvoiceLineTax,
+	NightAuditRun,
 	Payment,
 	PaymentMethod,
 	PaymentRefund,
+	RatePlan,
 	Reservation,
 	TaxRule,
 	WebhookEvent,
 	Guest,
+	webhook_dedup_key,
 )
 from .serializers import (
+	BulkAdjustmentReportSerializer,
+	BulkAdjustmentSerializer,
+	BulkPostingReportSerializer,
+	BulkPostingSerializer,
 	CorporateAccountSerializer,
 	DailyReportSerializer,
 	DiscountSerializer,
+	FolioBalanceSerializer,
 	FolioItemSerializer,
 	FolioSerializer,
+	FolioSummarySerializer,
 	GuestSerializer,
 	InvoiceAdjustmentSerializer,
+	InvoiceBatchReportSerializer,
+	InvoiceBatchSerializer,
 	InvoiceSerializer,
+	NightAuditRunSerializer,
+	NightAuditSerializer,
 	OutstandingInvoiceSerializer,
 	PaymentMethodSerializer,
 	PaymentRefundSerializer,
 	PaymentSerializer,
+	RatePlanSerializer,
+	RemittanceReportSerializer,
+	RemittanceSerializer,
 	ReservationSerializer,
 	TaxRuleSerializer,
+	TaxSimulationReportSerializer,
+	TaxSimulationSerializer,
 	TaxSummarySerializer,
 	WebhookEventSerializer,
 )
+from .adjustments import AdjustmentError, adjustable_invoices, apply_bulk_adjustment
+from .invoicing import billable_folios, generate_invoices, summarize
+from .night_audit import NightAuditLocked, run_night_audit
+from .posting import exposure_by_account, lock_accounts, over_credit_limit, post_items
+from .remittances import AllocationError, apply_remittance
+from .spool import spool_dir, spool_event
+from .taxes import apply_taxes, simulate_rate_change
+from .unit_of_work import mark_invoice_dirty, unit_of_work
 
 
 class GuestViewSet(viewsets.ModelViewSet):
@@ -69,7 +97,11 @@ class ReservationViewSet(viewsets.ModelViewSet):
 
 class FolioViewSet(viewsets.ModelViewSet):
 	queryset = Folio.objects.select_related("reservation", "corporate_account").prefetch_related(
-		"items", "items__tax_rule", "folio_discounts", "folio_discounts__discount"
+		"items",
+		"items__tax_rule",
+		"items__taxes__tax_rule",
+		"folio_discounts",
+		"folio_discounts__discount",
 	)
 	serializer_class = FolioSerializer
 	permission_classes = [permissions.IsAuthenticated]
@@ -77,6 +109,21 @@ class FolioViewSet(viewsets.ModelViewSet):
 	search_fields = ["folio_number", "guest_name"]
 	ordering_fields = ["created_at", "folio_number"]
 
+	def get_queryset(self):
+		if self.action == "bulk_items":
+			return Folio.objects.select_related("corporate_account")
+		if self.action == "list":
+			# Totals are stored on the folio, so a list page never needs the item rows.
+			return Folio.objects.select_related("reservation", "corporate_account").prefetch_related(
+				"folio_discounts", "folio_discounts__discount"
+			)
+		return super().get_queryset()
+
+	def get_serializer_class(self):
+		if self.action == "list":
+			return FolioSummarySerializer
+		return super().get_serializer_class()
+
 	def perform_create(self, serializer):
 		reservation = serializer.validated_data.get("reservation")
 		guest_name = serializer.validated_data.get("guest_name")
@@ -89,8 +136,79 @@ class FolioViewSet(viewsets.ModelViewSet):
 		folio = self.get_object()
 		serializer = FolioItemSerializer(data=request.data, context={"request": request})
 		serializer.is_valid(raise_exception=True)
-		item = serializer.save(folio=folio, posted_by=request.user if request.user.is_authenticated else None)
-		return Response(FolioItemSerializer(item).data, status=status.HTTP_201_CREATED)
+
+		charge = FolioItem(folio=folio, **serializer.validated_data)
+		charge.compute_amounts()
+		with transaction.atomic():
+			# Constant-time check against the account's running exposure, held until the charge commits.
+			account = lock_accounts([folio.pk]).get(folio.corporate_account_id)
+			over_limit = account is not None and account.exceeds_credit_limit(
+				charge.line_total + charge.tax_amount
+			)
+			if over_limit and account.enforce_credit_limit:
+				return Response(
+					{"detail": "Charge exceeds the corporate account's credit limit."},
+					status=status.HTTP_400_BAD_REQUEST,
+				)
+
+			item = serializer.save(
+				folio=folio, posted_by=request.user if request.user.is_authenticated else None
+			)
+		data = FolioItemSerializer(item).data
+		data["credit_limit_exceeded"] = over_limit
+		return Response(data, status=status.HTTP_201_CREATED)
+
+	@extend_schema(
+		request=BulkPostingSerializer,
+		responses={201: BulkPostingReportSerializer},
+		description="Post many items to this folio in one request.",
+	)
+	@action(detail=True, methods=["post"], url_path="items/bulk")
+	def bulk_items(self, request, pk=None):
+		return self._post_bulk(request, self.get_object())
+
+	@extend_schema(
+		request=BulkPostingSerializer,
+		responses={201: BulkPostingReportSerializer},
+		description="Post many items across folios; each item names its folio_id.",
+	)
+	@action(detail=False, methods=["post"], url_path="items/bulk")
+	def bulk_post(self, request):
+		return self._post_bulk(request)
+
+	def _post_bulk(self, request, folio=None):
+		serializer = BulkPostingSerializer(data=request.data, context={"folio": folio})
+		serializer.is_valid(raise_exception=True)
+		posted_by = request.user if request.user.is_authenticated else None
+		items = [FolioItem(**item, posted_by=posted_by) for item in serializer.validated_data["items"]]
+
+		# Check the whole batch against each account's running exposure up front,
+		# with the accounts locked until the items are posted.
+		apply_taxes(items)
+		with transaction.atomic():
+			accounts = lock_accounts({item.folio_id for item in items})
+			exceeded = over_credit_limit(accounts.values(), exposure_by_account(items))
+			blocked = [account.code for account in exceeded if account.enforce_credit_limit]
+			if blocked:
+				return Response(
+					{
+						"detail": "Charges exceed the corporate account's credit limit.",
+						"corporate_accounts": sorted(blocked),
+					},
+					status=status.HTTP_400_BAD_REQUEST,
+				)
+
+			created = post_items(items)
+		folios = Folio.objects.filter(pk__in={item.folio_id for item in created}).values(
+			"subtotal", "tax_total", "total", folio_id=F("pk")
+		)
+		report = {
+			"created": len(created),
+			"item_ids": [item.pk for item in created],
+			"folios": list(folios),
+			"credit_limit_exceeded": sorted(account.code for account in exceeded),
+		}
+		return Response(BulkPostingReportSerializer(report).data, status=status.HTTP_201_CREATED)
 
 	@extend_schema(
 		parameters=[
@@ -111,15 +229,65 @@ class FolioViewSet(viewsets.ModelViewSet):
 		serializer.save()
 		return Response(FolioItemSerializer(item).data)
 
+	@extend_schema(
+		parameters=[
+			OpenApiParameter(
+				name="as_of",
+				type=OpenApiTypes.DATETIME,
+				location=OpenApiParameter.QUERY,
+				description="Return the balance as it stood at this time. Defaults to now.",
+				required=False,
+			)
+		],
+		responses={200: FolioBalanceSerializer},
+		description="Folio balance from the ledger: latest snapshot plus the entries after it.",
+	)
+	@action(detail=True, methods=["get"], url_path="balance")
+	def balance(self, request, pk=None):
+		folio = get_object_or_404(Folio, pk=pk)
+		as_of = request.query_params.get("as_of")
+		if as_of:
+			as_of = parse_datetime(as_of)
+			if as_of is None:
+				return Response({"detail": "as_of must be an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+			if timezone.is_naive(as_of):
+				as_of = timezone.make_aware(as_of)
+		payload = {"folio_id": folio.pk, "as_of": as_of or timezone.now(), "balance": folio.ledger_balance(as_of)}
+		return Response(FolioBalanceSerializer(payload).data)
+
+
 class InvoiceViewSet(viewsets.ModelViewSet):
 	queryset = Invoice.objects.select_related("folio", "folio__reservation").prefetch_related(
 		"lines", "invoice_discounts", "invoice_discounts__discount", "adjustments", "payments"
 	)
 	serializer_class = InvoiceSerializer
 	permission_classes = [permissions.IsAuthenticated]
-	filterset_fields = ["status", "currency", "folio__corporate_account"]
+	filterset_fields = {
+		"status": ["exact"],
+		"currency": ["exact"],
+		"folio__corporate_account": ["exact"],
+		"balance_due": ["exact", "gt", "gte", "lt", "lte"],
+	}
 	search_fields = ["invoice_number", "folio__guest_name"]
-	ordering_fields = ["issued_at", "invoice_number", "total"]
+	ordering_fields = ["issued_at", "invoice_number", "total", "balance_due"]
+
+	def perform_create(self, serializer):
+		with unit_of_work():
+			serializer.save()
+
+	@extend_schema(
+		request=InvoiceBatchSerializer,
+		responses={200: InvoiceBatchReportSerializer},
+		description="Invoice every folio matching the filters, in chunks, and report per folio.",
+	)
+	@action(detail=False, methods=["post"], url_path="batch")
+	def batch(self, request):
+		serializer = InvoiceBatchSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		options = dict(serializer.validated_data)
+		due_date = options.pop("due_date", None)
+		results = generate_invoices(billable_folios(**options), due_date=due_date)
+		return Response(InvoiceBatchReportSerializer(summarize(results)).data)
 
 	@action(detail=True, methods=["get"], url_path="pdf")
 	def pdf(self, request, pk=None):
@@ -175,6 +343,24 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 			content_type="application/pdf",
 		)
 
+	@extend_schema(
+		request=BulkAdjustmentSerializer,
+		responses={201: BulkAdjustmentReportSerializer},
+		description="Add a credit or debit note to every invoice matching the filters.",
+	)
+	@action(detail=False, methods=["post"], url_path="adjustments")
+	def bulk_adjustment(self, request):
+		serializer = BulkAdjustmentSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		options = dict(serializer.validated_data)
+		terms = {key: options.pop(key) for key in ("adjustment_type", "rule", "value")}
+		terms["reason"] = options.pop("reason", "")
+		try:
+			report = apply_bulk_adjustment(adjustable_invoices(**options), **terms)
+		except AdjustmentError as exc:
+			return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+		return Response(BulkAdjustmentReportSerializer(report).data, status=status.HTTP_201_CREATED)
+
 	@action(detail=True, methods=["post"], url_path="credit-note")
 	def credit_note(self, request, pk=None):
 		invoice = self.get_object()
@@ -183,13 +369,14 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 		if amount <= 0:
 			return Response({"detail": "Amount must be greater than zero."}, status=status.HTTP_400_BAD_REQUEST)
 
-		InvoiceAdjustment.objects.create(
-			invoice=invoice,
-			adjustment_type=InvoiceAdjustment.AdjustmentType.CREDIT,
-			amount=-abs(amount),
-			reason=reason,
-		)
-		invoice.recalculate_totals()
+		with unit_of_work():
+			InvoiceAdjustment.objects.create(
+				invoice=invoice,
+				adjustment_type=InvoiceAdjustment.AdjustmentType.CREDIT,
+				amount=-abs(amount),
+				reason=reason,
+			)
+			mark_invoice_dirty(invoice)
 		return Response(InvoiceSerializer(invoice).data, status=status.HTTP_201_CREATED)
 
 	@action(detail=True, methods=["post"], url_path="debit-note")
@@ -200,13 +387,14 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 		if amount <= 0:
 			return Response({"detail": "Amount must be greater than zero."}, status=status.HTTP_400_BAD_REQUEST)
 
-		InvoiceAdjustment.objects.create(
-			invoice=invoice,
-			adjustment_type=InvoiceAdjustment.AdjustmentType.DEBIT,
-			amount=abs(amount),
-			reason=reason,
-		)
-		invoice.recalculate_totals()
+		with unit_of_work():
+			InvoiceAdjustment.objects.create(
+				invoice=invoice,
+				adjustment_type=InvoiceAdjustment.AdjustmentType.DEBIT,
+				amount=abs(amount),
+				reason=reason,
+			)
+			mark_invoice_dirty(invoice)
 		return Response(InvoiceSerializer(invoice).data, status=status.HTTP_201_CREATED)
 
 	@action(detail=True, methods=["post"], url_path="payments")
@@ -214,8 +402,9 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 		invoice = self.get_object()
 		serializer = PaymentSerializer(data=request.data, context={"request": request})
 		serializer.is_valid(raise_exception=True)
-		payment = serializer.save(invoice=invoice, processed_by=request.user)
-		invoice.recalculate_totals()
+		with unit_of_work():
+			payment = serializer.save(invoice=invoice, processed_by=request.user)
+			mark_invoice_dirty(invoice)
 		return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
 
 
@@ -224,6 +413,21 @@ class PaymentViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
 	serializer_class = PaymentSerializer
 	permission_classes = [permissions.IsAuthenticated]
 
+	@extend_schema(
+		request=RemittanceSerializer,
+		responses={201: RemittanceReportSerializer},
+		description="Spread one remittance over many invoices (oldest first, explicit or pro rata).",
+	)
+	@action(detail=False, methods=["post"], url_path="remittance")
+	def remittance(self, request):
+		serializer = RemittanceSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		try:
+			report = apply_remittance(**serializer.validated_data, processed_by=request.user)
+		except AllocationError as exc:
+			return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+		return Response(RemittanceReportSerializer(report).data, status=status.HTTP_201_CREATED)
+
 	@action(detail=True, methods=["post"], url_path="refund")
 	def refund(self, request, pk=None):
 		payment = self.get_object()
@@ -235,15 +439,16 @@ class PaymentViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
 		if amount <= 0 or amount > payment.amount:
 			return Response({"detail": "Invalid refund amount."}, status=status.HTTP_400_BAD_REQUEST)
 
-		refund = PaymentRefund.objects.create(
-			payment=payment,
-			amount=amount,
-			reason=reason,
-			processed_by=request.user,
-		)
-		payment.status = Payment.PaymentStatus.REFUNDED
-		payment.save(update_fields=["status", "updated_at"])
-		payment.invoice.recalculate_totals()
+		with unit_of_work():
+			refund = PaymentRefund.objects.create(
+				payment=payment,
+				amount=amount,
+				reason=reason,
+				processed_by=request.user,
+			)
+			payment.status = Payment.PaymentStatus.REFUNDED
+			payment.save(update_fields=["status", "updated_at"])
+			mark_invoice_dirty(payment.invoice_id)
 		return Response(PaymentRefundSerializer(refund).data, status=status.HTTP_201_CREATED)
 
 
@@ -281,6 +486,28 @@ class TaxRuleViewSet(viewsets.ModelViewSet):
 	filterset_fields = ["is_active"]
 	ordering_fields = ["name", "created_at"]
 
+	@extend_schema(
+		request=TaxSimulationSerializer,
+		responses={200: TaxSimulationReportSerializer},
+		description="Compare current tax on open folios with the tax at proposed rates, without saving them.",
+	)
+	@action(detail=False, methods=["post"], url_path="simulate")
+	def simulate(self, request):
+		serializer = TaxSimulationSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		rates = {
+			change["tax_rule_id"].pk: change["rate"] for change in serializer.validated_data["changes"]
+		}
+		return Response(TaxSimulationReportSerializer(simulate_rate_change(rates)).data)
+
+
+class RatePlanViewSet(viewsets.ModelViewSet):
+	queryset = RatePlan.objects.select_related("tax_rule")
+	serializer_class = RatePlanSerializer
+	permission_classes = [permissions.IsAdminUser]
+	filterset_fields = ["is_active"]
+	ordering_fields = ["code", "nightly_rate", "created_at"]
+
 
 class PaymentMethodViewSet(viewsets.ModelViewSet):
 	queryset = PaymentMethod.objects.all()
@@ -367,22 +594,23 @@ class TaxSummaryReportView(APIView):
 		else:
 			end = start
 
-		lines = (
-			InvoiceLine.objects.filter(invoice__issued_at__date__range=(start, end))
-			.select_related("folio_item__tax_rule")
-			.exclude(folio_item__tax_rule__isnull=True)
+		# Each invoice line keeps one row per tax rule, copied when the invoice was
+		# issued, so stacked taxes are reported under every rule and later edits
+		# to the items do not rewrite past periods.
+		taxes = InvoiceLineTax.objects.filter(
+			invoice_line__invoice__issued_at__date__range=(start, end)
 		)
 		summaries = (
-			lines.values("folio_item__tax_rule__name")
+			taxes.values("tax_rule_name")
 			.annotate(
-				taxable_amount=Sum("net_amount"),
-				tax_amount=Sum("tax_amount"),
+				taxable_amount=Sum("taxable_amount"),
+				tax_amount=Sum("amount"),
 			)
-			.order_by("folio_item__tax_rule__name")
+			.order_by("tax_rule_name")
 		)
 		data = [
 			{
-				"tax_rule": entry["folio_item__tax_rule__name"],
+				"tax_rule": entry["tax_rule_name"],
 				"taxable_amount": entry["taxable_amount"] or Decimal("0.00"),
 				"tax_amount": entry["tax_amount"] or Decimal("0.00"),
 			}
@@ -400,24 +628,57 @@ class OutstandingReportView(APIView):
 		description="List all invoices with outstanding balances (balance_due > 0)."
 	)
 	def get(self, request):
-		invoices = Invoice.objects.filter(status__in=[Invoice.InvoiceStatus.ISSUED, Invoice.InvoiceStatus.PAID])
-		outstanding = []
-		for invoice in invoices:
-			balance = invoice.balance_due
-			if balance > 0:
-				outstanding.append(
-					{
-						"invoice_id": invoice.pk,
-						"invoice_number": invoice.invoice_number,
-						"guest_name": invoice.folio.guest_name,
-						"balance_due": balance,
-						"issued_at": invoice.issued_at,
-					}
-				)
+		invoices = Invoice.objects.filter(
+			status__in=[Invoice.InvoiceStatus.ISSUED, Invoice.InvoiceStatus.PAID],
+			balance_due__gt=0,
+		)
+		outstanding = [
+			{
+				"invoice_id": row["pk"],
+				"invoice_number": row["invoice_number"],
+				"guest_name": row["folio__guest_name"],
+				"balance_due": row["balance_due"],
+				"issued_at": row["issued_at"],
+			}
+			for row in invoices.values(
+				"pk", "invoice_number", "folio__guest_name", "balance_due", "issued_at"
+			)
+		]
 		serializer = OutstandingInvoiceSerializer(outstanding, many=True)
 		return Response(serializer.data)
 
 
+class NightAuditView(APIView):
+	permission_classes = [permissions.IsAdminUser]
+
+	@extend_schema(
+		responses={200: NightAuditRunSerializer(many=True)},
+		description="List night audit runs, latest business date first.",
+	)
+	def get(self, request):
+		runs = NightAuditRun.objects.all()[:30]
+		return Response(NightAuditRunSerializer(runs, many=True).data)
+
+	@extend_schema(
+		request=NightAuditSerializer,
+		responses={200: NightAuditRunSerializer},
+		description=(
+			"Post the night's room charges to every in-house reservation. A completed "
+			"business date is returned unchanged; a failed or abandoned run is resumed "
+			"and only posts the charges it is missing. 409 while another run holds it."
+		),
+	)
+	def post(self, request):
+		serializer = NightAuditSerializer(data=request.data)
+		serializer.is_valid(raise_exception=True)
+		business_date = serializer.validated_data.get("business_date") or timezone.localdate()
+		try:
+			run = run_night_audit(business_date)
+		except NightAuditLocked as exc:
+			return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+		return Response(NightAuditRunSerializer(run).data)
+
+
 class BaseWebhookView(APIView):
 	permission_classes = [permissions.AllowAny]
 	authentication_classes = []
@@ -425,18 +686,33 @@ class BaseWebhookView(APIView):
 
 	@extend_schema(
 		request=WebhookEventSerializer,
-		responses={202: WebhookEventSerializer},
-		description="Receive webhook events from external systems."
+		responses={202: WebhookEventSerializer, 200: WebhookEventSerializer},
+		description=(
+			"Receive webhook events from external systems. A redelivered event (same provider "
+			"event id, or same payload) is acknowledged with 200 and the stored event. With a "
+			"spool configured the event is acknowledged once it is on disk and the body is "
+			"only {\"status\": \"queued\"}."
+		),
 	)
 	def post(self, request):
-		event = WebhookEvent.objects.create(
+		event_type = request.data.get("event_type", "")
+		dedup_key = webhook_dedup_key(self.source, request.data, request.headers.get("X-Event-Id", ""))
+		if spool_dir() is not None:
+			spool_event(self.source, event_type, request.data, dedup_key=dedup_key)
+			return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+		event, created = WebhookEvent.objects.get_or_create(
 			source=self.source,
-			event_type=request.data.get("event_type", ""),
-			payload=request.data,
-			status="received",
+			dedup_key=dedup_key,
+			defaults={
+				"event_type": event_type,
+				"payload": request.data,
+				"status": WebhookEvent.EventStatus.RECEIVED,
+			},
 		)
 		serializer = WebhookEventSerializer(event)
-		return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+		return Response(
+			serializer.data, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK
+		)
 
 
 class PMSWebhookView(BaseWebhookView):
@@ -596,19 +872,21 @@ class PayPalExecutePaymentView(APIView):
 			defaults={"is_active": True}
 		)
 		
-		# Create payment record
-		payment = Payment.objects.create(
-			invoice=invoice,
-			payment_method=payment_method,
-			amount=result["amount"],
-			reference=result.get("transaction_id", payment_id),
-			status=Payment.PaymentStatus.POSTED,
-			notes=f"PayPal payment ID: {payment_id}, Payer email: {result.get('payer_email', 'N/A')}"
-		)
+		with unit_of_work():
+			# Create payment record
+			payment = Payment.objects.create(
+				invoice=invoice,
+				payment_method=payment_method,
+				amount=result["amount"],
+				reference=result.get("transaction_id", payment_id),
+				status=Payment.PaymentStatus.POSTED,
+				notes=f"PayPal payment ID: {payment_id}, Payer email: {result.get('payer_email', 'N/A')}"
+			)
+			mark_invoice_dirty(invoice)
 		
 		# Update invoice status
-		invoice.recalculate_totals()
-		if invoice.balance_due <= 0:
+		balance_due = invoice.balance_due
+		if balance_due <= 0:
 			invoice.status = Invoice.InvoiceStatus.PAID
 			invoice.save(update_fields=["status", "updated_at"])
 		
@@ -619,7 +897,7 @@ class PayPalExecutePaymentView(APIView):
 			"invoice_id": invoice.id,
 			"invoice_number": invoice.invoice_number,
 			"amount_paid": str(payment.amount),
-			"balance_due": str(invoice.balance_due)
+			"balance_due": str(balance_due)
 		}, status=status.HTTP_200_OK)
 
 
@@ -708,21 +986,22 @@ class PayPalRefundView(APIView):
 				status=status.HTTP_500_INTERNAL_SERVER_ERROR
 			)
 		
-		# Create refund record
-		refund = PaymentRefund.objects.create(
-			payment=payment,
-			amount=amount,
-			reason=reason,
-			processed_by=request.user,
-			notes=f"PayPal refund ID: {result.get('refund_id', 'N/A')}"
-		)
-		
-		# Update payment status
-		payment.status = Payment.PaymentStatus.REFUNDED
-		payment.save(update_fields=["status", "updated_at"])
-		
-		# Recalculate invoice
-		payment.invoice.recalculate_totals()
+		with unit_of_work():
+			# Create refund record
+			refund = PaymentRefund.objects.create(
+				payment=payment,
+				amount=amount,
+				reason=reason,
+				processed_by=request.user,
+				notes=f"PayPal refund ID: {result.get('refund_id', 'N/A')}"
+			)
+			
+			# Update payment status
+			payment.status = Payment.PaymentStatus.REFUNDED
+			payment.save(update_fields=["status", "updated_at"])
+			
+			# Recalculate invoice
+			mark_invoice_dirty(payment.invoice_id)
 		
 		return Response({
 			"success": True,
@@ -0,0 +1,219 @@
+"""
+Processing of stored webhook events.
+
+Workers claim batches of due events by setting a short lease on them. On
+databases with ``SKIP LOCKED`` the claim skips rows another worker is
+claiming at the same moment; elsewhere the conditional UPDATE of the claim
+is enough, since only one writer can win it. A batch is applied in chunks,
+renewing the lease before each one. A handler applies a whole chunk and
+returns the error of each event it could not apply; the chunk is then
+marked in bulk, in the same transaction as the handler's writes, and only
+where the worker still holds the lease. If a handler raises, the chunk is
+rolled back and retried one event at a time, so only the event that
+raises is charged an attempt. Failed events are retried with exponential
+backoff until they become dead letters.
+"""
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .models import WebhookEvent
+from .pms import process_pms_events
+from .pos import process_pos_events
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+CHUNK_SIZE = 100
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 8
+BACKOFF = timedelta(seconds=30)
+MAX_BACKOFF = timedelta(hours=1)
+
+EventStatus = WebhookEvent.EventStatus
+
+HANDLERS: dict[str, Callable[[list[WebhookEvent]], dict[int, str]]] = {
+	WebhookEvent.WebhookSource.PMS: process_pms_events,
+	WebhookEvent.WebhookSource.POS: process_pos_events,
+}
+
+
+class LeaseLost(Exception):
+	"""The worker's lease on some events lapsed and another worker claimed them."""
+
+
+def worker_id() -> str:
+	return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+
+
+def backoff(attempts: int) -> timedelta:
+	"""Delay before retrying an event that has failed ``attempts`` times."""
+	return min(BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF)
+
+
+def due_events(now: datetime, source: str | None = None) -> models.QuerySet:
+	"""Events a worker may claim: new, failed and due for a retry, or abandoned mid-batch."""
+	retry_due = models.Q(next_attempt_at__isnull=True) | models.Q(next_attempt_at__lte=now)
+	events = WebhookEvent.objects.filter(
+		(models.Q(status__in=[EventStatus.RECEIVED, EventStatus.FAILED]) & retry_due)
+		| models.Q(status=EventStatus.PROCESSING, locked_until__lt=now),
+		source__in=HANDLERS,
+	)
+	if source:
+		events = events.filter(source=source)
+	return events.order_by("pk")
+
+
+def claim_batch(
+	owner: str, source: str | None = None, *, batch_size: int = DEFAULT_BATCH_SIZE
+) -> list[WebhookEvent]:
+	"""Lease up to ``batch_size`` due events to ``owner`` and return them."""
+	now = timezone.now()
+	with transaction.atomic():
+		candidates = due_events(now, source)
+		if connection.features.has_select_for_update_skip_locked:
+			candidates = candidates.select_for_update(skip_locked=True)
+		ids = list(candidates.values_list("pk", flat=True)[:batch_size])
+		if not ids:
+			return []
+		# Re-checking the conditions makes the claim a compare-and-swap where rows are not locked.
+		due_events(now, source).filter(pk__in=ids).update(
+			status=EventStatus.PROCESSING, locked_by=owner, locked_until=now + LEASE, updated_at=now
+		)
+	return list(
+		WebhookEvent.objects.filter(
+			pk__in=ids, status=EventStatus.PROCESSING, locked_by=owner
+		).order_by("pk")
+	)
+
+
+def _renew(events: list[WebhookEvent], owner: str) -> list[WebhookEvent]:
+	"""Extend ``owner``'s lease on ``events`` and return fresh copies of those it still holds."""
+	now = timezone.now()
+	held = WebhookEvent.objects.filter(
+		pk__in=[event.pk for event in events], status=EventStatus.PROCESSING, locked_by=owner
+	)
+	held.update(locked_until=now + LEASE, updated_at=now)
+	return list(held.order_by("pk"))
+
+
+def _record(events: list[WebhookEvent], errors: dict[int, str], owner: str) -> None:
+	"""Mark ``events`` processed or failed, raising :class:`LeaseLost` if ``owner`` lost any of them."""
+	now = timezone.now()
+	held = WebhookEvent.objects.filter(status=EventStatus.PROCESSING, locked_by=owner)
+	failures = [event for event in events if event.pk in errors]
+	for event in failures:
+		event.attempts += 1
+		event.notes = errors[event.pk]
+		event.locked_by, event.locked_until = "", None
+		event.updated_at = now
+		if event.attempts >= MAX_ATTEMPTS:
+			event.status = EventStatus.DEAD
+			event.processed_at, event.next_attempt_at = now, None
+		else:
+			event.status = EventStatus.FAILED
+			event.next_attempt_at = now + backoff(event.attempts)
+	recorded = held.bulk_update(
+		failures,
+		[
+			"attempts",
+			"notes",
+			"status",
+			"processed_at",
+			"next_attempt_at",
+			"locked_by",
+			"locked_until",
+			"updated_at",
+		],
+	)
+	recorded += held.filter(pk__in=[event.pk for event in events if event.pk not in errors]).update(
+		status=EventStatus.PROCESSED,
+		processed_at=now,
+		next_attempt_at=None,
+		locked_by="",
+		locked_until=None,
+		updated_at=now,
+	)
+	if recorded != len(events):
+		raise LeaseLost(f"Lost the lease on {len(events) - recorded} webhook events.")
+
+
+def _apply(events: list[WebhookEvent], owner: str) -> dict[int, str]:
+	"""Run ``events`` through their handlers and record the outcome in one transaction.
+
+	Returns the error of each event, or ``""`` for those that were applied.
+	"""
+	by_source = defaultdict(list)
+	for event in events:
+		by_source[event.source].append(event)
+	with transaction.atomic():
+		errors: dict[int, str] = {}
+		for source, batch in by_source.items():
+			errors.update(HANDLERS[source](batch))
+		_record(events, errors, owner)
+	return {event.pk: errors.get(event.pk, "") for event in events}
+
+
+def _apply_one(event: WebhookEvent, owner: str) -> dict[int, str]:
+	held = _renew([event], owner)
+	if not held:
+		return {}
+	try:
+		return _apply(held, owner)
+	except LeaseLost:
+		return {}
+	except Exception as exc:
+		logger.exception("Webhook event %s failed", event.pk)
+		error = f"{type(exc).__name__}: {exc}"
+	try:
+		with transaction.atomic():
+			_record(_renew(held, owner), {event.pk: error}, owner)
+	except LeaseLost:
+		return {}
+	return {event.pk: error}
+
+
+def process_batch(events: list[WebhookEvent], owner: str) -> dict[str, int]:
+	"""Run ``events`` leased to ``owner`` through their handlers and record the outcome of each.
+
+	Events whose lease lapsed and went to another worker are left to it.
+	"""
+	outcomes: dict[int, str] = {}
+	for start in range(0, len(events), CHUNK_SIZE):
+		chunk = _renew(events[start : start + CHUNK_SIZE], owner)
+		if not chunk:
+			continue
+		try:
+			outcomes.update(_apply(chunk, owner))
+			continue
+		except LeaseLost:
+			logger.warning("Lost the lease on part of a chunk of %d webhook events", len(chunk))
+		except Exception:
+			logger.exception("Webhook chunk of %d events failed", len(chunk))
+		# The chunk was rolled back; apply its events one at a time, so only one that raises
+		# is charged an attempt and events another worker took over are skipped.
+		for event in chunk:
+			outcomes.update(_apply_one(event, owner))
+	failed = sum(1 for error in outcomes.values() if error)
+	return {"processed": len(outcomes) - failed, "failed": failed}
+
+
+def process_pending(
+	source: str | None = None, *, batch_size: int = DEFAULT_BATCH_SIZE, owner: str | None = None
+) -> dict[str, int]:
+	"""Claim and process batches of due events until none are left."""
+	owner = owner or worker_id()
+	totals = {"processed": 0, "failed": 0}
+	while True:
+		events = claim_batch(owner, source, batch_size=batch_size)
+		if not events:
+			return totals
+		for key, count in process_batch(events, owner).items():
+			totals[key] += count
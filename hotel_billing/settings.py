@@ -169,7 +169,12 @@ PAYPAL_CLIENT_SECRET = "EIoS-bG7O1AHWahm9N8gXRImPtdhS0TONaRpo2xLSKAj4yyUwHz5dMwK
 PAYPAL_RETURN_URL = "http://127.0.0.1:8000/api/payments/paypal/success"
 PAYPAL_CANCEL_URL = "http://127.0.0.1:8000/api/payments/paypal/cancel"
 
-# Default primary key field type
+# Billing batch jobs
+BILLING_INVOICE_WORKERS = 4  # parallel chunks for batch invoicing (SQLite always uses 1)
+LEDGER_SNAPSHOT_INTERVAL = 100  # folio ledger entries between balance snapshots
+
+# Webhook ingestion
+WEBHOOK_SPOOL_DIR = None  # e.g. BASE_DIR / "spool" / "webhooks" to acknowledge before the INSERT
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field